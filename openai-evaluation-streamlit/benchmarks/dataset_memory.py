@@ -0,0 +1,108 @@
+"""Memory report for the in-memory GAIA dataset.
+
+Compares the bytes a Streamlit server holds for the dataset before and after the compact model:
+
+- before: every session loaded the full partition (all columns as Python strings) into st.session_state.df
+  and merged it again into st.session_state.user_results, so each session held two full copies;
+- after: one compact frame per partition is shared by all sessions (heavy text columns dropped, categoricals,
+  small integer counts, RangeIndex), and annotator text is loaded for the selected question only.
+
+Uses the latest local snapshot of the partition when there is one, otherwise a synthetic GAIA-like partition.
+
+Usage (from the openai-evaluation-streamlit folder):
+    python benchmarks/dataset_memory.py [--rows 466] [--sessions 10] [--snapshot-dir .cache/snapshots]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import pandas as pd
+from scripts.data_handling.compact_dataset import compact_dataframe, memory_report, HEAVY_TEXT_COLUMNS
+from scripts.data_handling.dataset_snapshot import load_snapshot, DEFAULT_PARTITION, SNAPSHOT_DIR
+
+# File names attached to GAIA questions, roughly in the proportions of the validation split
+SAMPLE_FILE_NAMES = ['', '', '', '', 'data.xlsx', 'paper.pdf', 'notes.txt', 'code.py', 'table.csv', 'image.png', 'audio.mp3']
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(['the', 'answer', 'question', 'search', 'result', 'number', 'paper', 'year', 'table'])
+                    for _ in range(words))
+
+def synthetic_partition(rows, seed=0):
+    """Build a partition shaped like the GaiaDataset table, with text lengths typical of GAIA."""
+    rng = random.Random(seed)
+    config_name, split_name = DEFAULT_PARTITION
+    records = []
+    for _ in range(rows):
+        file_name = rng.choice(SAMPLE_FILE_NAMES)
+        number_of_tools = rng.randint(0, 6)
+        records.append({
+            'config_name': config_name,
+            'split_name': split_name,
+            'task_id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'Question': random_text(rng, rng.randint(30, 120)),
+            'Level': rng.randint(1, 3),
+            'FinalAnswer': random_text(rng, rng.randint(1, 4)),
+            'file_name': file_name,
+            'file_path': f"https://bucket.s3.amazonaws.com/gaia/{file_name}" if file_name else '',
+            'Annotator_Metadata_Steps': random_text(rng, rng.randint(100, 400)),
+            'Annotator_Metadata_Number_of_steps': str(rng.randint(2, 15)),
+            'Annotator_Metadata_How_long_did_this_take': f"{rng.randint(2, 40)} minutes",
+            'Annotator_Metadata_Tools': '\n'.join(random_text(rng, 3) for _ in range(number_of_tools)),
+            'Annotator_Metadata_Number_of_tools': number_of_tools,
+            'user_result_status': 'N/A',
+            'created_date': datetime(2024, 10, 1),
+        })
+    return pd.DataFrame(records)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=466, help='rows of the synthetic partition (no snapshot found)')
+    parser.add_argument('--sessions', type=int, default=10, help='concurrent sessions to size the totals for')
+    parser.add_argument('--snapshot-dir', default=os.path.join(APP_DIR, SNAPSHOT_DIR), help='where to look for a snapshot')
+    args = parser.parse_args()
+
+    raw = load_snapshot(args.snapshot_dir, DEFAULT_PARTITION)
+    source = 'snapshot'
+    if raw is None:
+        raw = synthetic_partition(args.rows)
+        source = 'synthetic'
+
+    compact = compact_dataframe(raw)
+    raw_report = memory_report(raw)
+    compact_report = memory_report(compact)
+    heavy_text_bytes = sum(raw_report['columns'].get(column, 0) for column in HEAVY_TEXT_COLUMNS)
+
+    before_per_session = 2 * raw_report['bytes']  # st.session_state.df plus the merged st.session_state.user_results
+    report = {
+        'source': source,
+        'partition': list(DEFAULT_PARTITION),
+        'rows': raw_report['rows'],
+        'sessions': args.sessions,
+        'before': {
+            'dataset_bytes': raw_report['bytes'],
+            'shared_bytes': 0,
+            'bytes_per_session': before_per_session,
+            'total_bytes': before_per_session * args.sessions,
+            'columns': raw_report['columns'],
+        },
+        'after': {
+            'dataset_bytes': compact_report['bytes'],
+            'shared_bytes': compact_report['bytes'],
+            'bytes_per_session': 0,  # Sessions reference the shared frame
+            'total_bytes': compact_report['bytes'],
+            'heavy_text_bytes_on_demand': heavy_text_bytes,
+            'columns': compact_report['columns'],
+        },
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
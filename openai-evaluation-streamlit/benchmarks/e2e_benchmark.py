@@ -0,0 +1,355 @@
+"""Offline end-to-end benchmark of the app's hot paths.
+
+Runs against local stand-ins (see offline_backends.py): SQLite instead of Azure SQL, an in-memory S3 and a
+fake OpenAI chat completions endpoint, so it needs no credentials or network. It times:
+
+- ingest: the full process_dataset pipeline on a synthetic GAIA partition with attachments (the Hugging Face
+  login, dataset download and git clone are replaced by local fixtures; conversion, S3 upload, SQL insert and
+  snapshot are the real code). The first run uploads everything, later runs skip unchanged files;
+- fetch: fetch_dataframe_from_sql for the partition, with all columns and with the compact column set;
+- explore: explore page reruns through Streamlit's AppTest (first load, steady-state reruns and
+  Send to ChatGPT);
+- update_user_result: single-result writes, and update_user_results with a batch of 50;
+- preprocess: preprocess_file per file type on a corpus of sample attachments.
+
+The report also carries the app's span totals (count, errors, seconds per span name, see
+scripts/api_utils/telemetry.py) for everything the run did.
+
+SQLite timings are not Azure SQL latencies; compare runs of this script with each other, not with production.
+The report is JSON (stdout or --output). With --compare, medians are checked against an earlier report and
+the script exits with status 1 if any got slower by more than --tolerance.
+
+Usage (from the openai-evaluation-streamlit folder):
+    python benchmarks/e2e_benchmark.py [--rows 165] [--repeat 5] [--output report.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+
+BUCKET_NAME = 'benchmark-bucket'
+BENCHMARK_USER = ('benchmark-user', 'benchmark', 'user')
+PARTITION = ('2023_all', 'validation')
+
+# One synthetic question in four has an attachment, about the share in the GAIA validation split
+ATTACHMENT_EVERY = 4
+
+STATUSES = ['Correct without Instruction', 'Incorrect without Instruction', 'Correct with Instruction',
+            'Incorrect with Instruction']
+
+def summarize(samples):
+    """Reduce timings in seconds to milliseconds statistics."""
+    milliseconds = [sample * 1000 for sample in samples]
+    return {
+        'runs': len(milliseconds),
+        'min_ms': round(min(milliseconds), 3),
+        'median_ms': round(statistics.median(milliseconds), 3),
+        'mean_ms': round(statistics.mean(milliseconds), 3),
+        'max_ms': round(max(milliseconds), 3),
+    }
+
+def time_call(function, *args, **kwargs):
+    """Return (seconds, result) of one call."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def time_calls(function, repeat, *args, **kwargs):
+    return [time_call(function, *args, **kwargs)[0] for _ in range(repeat)]
+
+def configure_environment(workdir, sqlite_url, openai_api_base):
+    """Point the app at the stand-ins. Must run before app modules are imported (they read settings at import)."""
+    os.environ.update({
+        'SQL_DATABASE_URL': sqlite_url,
+        'OPENAI_API_BASE': openai_api_base,
+        'OPENAI_API_KEY': 'benchmark',
+        'AWS_ACCESS_KEY': 'benchmark',
+        'AWS_SECRET_KEY': 'benchmark',
+        'S3_BUCKET_NAME': BUCKET_NAME,
+        'HF_TOKEN': 'benchmark',
+        'GAIA_REPO_URL': 'file:///offline',
+        'GAIA_DATASET_SOURCE': 'sql',
+        'GAIA_CONFIG_NAME': PARTITION[0],
+        'GAIA_SPLIT_NAME': PARTITION[1],
+        'GAIA_INGEST_PARTITIONS': '/'.join(PARTITION),
+        'RESULT_JOURNAL_PATH': os.path.join(workdir, '.cache', 'result_journal.jsonl'),
+        'APP_WARMUP': '0',
+    })
+    os.chdir(workdir)  # The app keeps its caches under ./.cache
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+def raw_gaia_table(rows, attachments, repo_dir, seed=0):
+    """Build a pyarrow table shaped like the Hugging Face GAIA split, copying attachments into repo_dir."""
+    import pyarrow as pa
+
+    rng = random.Random(seed)
+    extensions = sorted(attachments)
+    words = ['population', 'city', 'year', 'paper', 'table', 'author', 'species', 'record', 'answer', 'museum']
+    records = []
+    for number in range(rows):
+        task_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        file_name = ''
+        if number % ATTACHMENT_EVERY == 0:  # Includes the first question, so the explore page fetches one
+            extension = extensions[(number // ATTACHMENT_EVERY) % len(extensions)]
+            file_name = f"{task_id}{extension}"
+            shutil.copyfile(attachments[extension], os.path.join(repo_dir, file_name))
+        number_of_tools = rng.randint(0, 5)
+        records.append({
+            'task_id': task_id,
+            'Question': ' '.join(rng.choice(words) for _ in range(rng.randint(30, 120))),
+            'Level': str(rng.randint(1, 3)),
+            'Final answer': ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3))),
+            'file_name': file_name,
+            'file_path': '',
+            'Annotator Metadata': {
+                'Steps': '\n'.join(f"{step}. {' '.join(rng.choice(words) for _ in range(20))}" for step in range(1, 10)),
+                'Number of steps': str(rng.randint(2, 15)),
+                'How long did this take?': f"{rng.randint(2, 40)} minutes",
+                'Tools': '\n'.join(f"{tool}. {rng.choice(words)}" for tool in range(1, number_of_tools + 1)),
+                'Number of tools': str(number_of_tools),
+            },
+        })
+    return pa.Table.from_pylist(records)
+
+def bench_ingest(args, s3_client, attachments, workdir):
+    from scripts import main as ingest
+    from scripts.data_handling.load_dataset import convert_gaia_table
+
+    # A clone directory without .git is used as is, so the fixture replaces git clone
+    repo_dir = os.path.join(workdir, '.cache', 'gaia_repo', '2023', PARTITION[1])
+    os.makedirs(repo_dir, exist_ok=True)
+    raw = raw_gaia_table(args.rows, attachments, repo_dir)
+
+    def local_batches(cache_dir, batch_size, config_name, split_name):
+        # Same conversion as iter_gaia_batches, minus the Hugging Face download
+        for start in range(0, raw.num_rows, batch_size):
+            df = convert_gaia_table(raw.slice(start, batch_size), config_name, split_name).to_pandas()
+            df.index = range(start, start + len(df))
+            yield df
+
+    ingest.login = lambda **kwargs: None
+    ingest.iter_gaia_batches = local_batches
+    ingest.fetch_lfs_files = lambda clone_dir, file_paths: None
+    ingest.init_s3_client = lambda *args, **kwargs: s3_client
+
+    samples = []
+    for _ in range(args.repeat):
+        seconds, summary = time_call(ingest.process_dataset)
+        if 'Dataset processing complete' not in summary:
+            raise RuntimeError(f"process_dataset failed: {summary}")
+        samples.append(seconds)
+    return {
+        'rows': raw.num_rows,
+        'attachments': sum(1 for name in raw.column('file_name').to_pylist() if name),
+        'first_run_ms': round(samples[0] * 1000, 3),  # Uploads every attachment
+        'repeat_runs': summarize(samples[1:] or samples),  # Attachments unchanged in S3, skipped
+    }
+
+def bench_fetch(args):
+    from scripts.api_utils.azure_sql_utils import fetch_dataframe_from_sql, GAIA_DATASET_DTYPES
+    from scripts.data_handling.compact_dataset import HEAVY_TEXT_COLUMNS
+
+    compact_columns = [column for column in GAIA_DATASET_DTYPES if column not in HEAVY_TEXT_COLUMNS]
+    df = fetch_dataframe_from_sql(config_name=PARTITION[0], split_name=PARTITION[1])
+    if df is None or df.empty:
+        raise RuntimeError("fetch_dataframe_from_sql returned no rows")
+    return {
+        'rows': len(df),
+        'all_columns': summarize(time_calls(
+            fetch_dataframe_from_sql, args.repeat, config_name=PARTITION[0], split_name=PARTITION[1])),
+        'compact_columns': summarize(time_calls(
+            fetch_dataframe_from_sql, args.repeat, config_name=PARTITION[0], split_name=PARTITION[1],
+            columns=compact_columns)),
+    }
+
+def bench_explore(args, s3_client):
+    import scripts.api_utils.amazon_s3_utils as amazon_s3_utils
+    from streamlit.testing.v1 import AppTest
+
+    amazon_s3_utils.init_s3_client = lambda *args, **kwargs: s3_client
+
+    app = AppTest.from_file(os.path.join(APP_DIR, 'newapp.py'), default_timeout=120)
+    user_id, username, role = BENCHMARK_USER
+    app.session_state['page'] = 'explore_questions'
+    app.session_state['login_success'] = True
+    app.session_state['user_id'] = user_id
+    app.session_state['username'] = username
+    app.session_state['role'] = role
+
+    def run(action=None):
+        seconds, _ = time_call(action or app.run)
+        if app.exception:
+            raise RuntimeError(f"Explore page raised: {app.exception[0].value}")
+        return seconds
+
+    first_load = run()  # Loads the partition, builds the index, loads the user's results
+    reruns = [run() for _ in range(args.repeat)]
+
+    send_buttons = [button for button in app.button if button.key and button.key.startswith('send_chatgpt_')]
+    sends = []
+    for _ in range(args.repeat if send_buttons else 0):
+        button = [button for button in app.button if button.key == send_buttons[0].key][0]
+        sends.append(run(lambda: button.click().run()))
+
+    return {
+        'first_load_ms': round(first_load * 1000, 3),
+        'rerun': summarize(reruns),
+        'send_to_chatgpt': summarize(sends) if sends else None,
+    }
+
+def bench_update_user_result(args):
+    from scripts.api_utils.azure_sql_utils import update_user_result, update_user_results, fetch_dataframe_from_sql
+
+    user_id = BENCHMARK_USER[0]
+    task_ids = fetch_dataframe_from_sql(config_name=PARTITION[0], split_name=PARTITION[1], columns=['task_id'])['task_id'].tolist()
+
+    # Alternate statuses so every write moves the question between cube cells
+    writes = max(args.repeat * 10, 20)
+    samples = [
+        time_call(update_user_result, user_id, task_ids[number % len(task_ids)], STATUSES[number % len(STATUSES)], 'benchmark')[0]
+        for number in range(writes)
+    ]
+
+    batches = []
+    for number in range(args.repeat):
+        batch = [(user_id, task_ids[(number * 50 + offset) % len(task_ids)], STATUSES[(number + offset) % len(STATUSES)], 'benchmark')
+                 for offset in range(50)]
+        seconds, written = time_call(update_user_results, batch)
+        if not written:
+            raise RuntimeError("update_user_results failed")
+        batches.append(seconds)
+    return {'single': summarize(samples), 'batch_of_50': summarize(batches)}
+
+def bench_preprocess(args, attachments):
+    from scripts.data_handling.file_processor import preprocess_file
+
+    question = "What was the population of city 3 in year 2005?"
+    results = {}
+    for extension, path in sorted(attachments.items()):
+        seconds, first = time_call(preprocess_file, path, question=question)
+        if isinstance(first, str) and ('Unsupported' in first or first.startswith('Error')):
+            raise RuntimeError(f"preprocess_file failed for {extension}: {first[:200]}")
+        results[extension] = {
+            'bytes': os.path.getsize(path),
+            'first_ms': round(seconds * 1000, 3),
+            'repeat': summarize(time_calls(preprocess_file, args.repeat, path, question=question)),
+        }
+    return results
+
+def flatten_medians(report, prefix=''):
+    """Map 'section.entry' to median_ms (or a single *_ms value) for every timing in a report."""
+    medians = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if 'median_ms' in value:
+                medians[name] = value['median_ms']
+            else:
+                medians.update(flatten_medians(value, name + '.'))
+        elif key.endswith('_ms') and isinstance(value, (int, float)):
+            medians[name] = value
+    return medians
+
+def compare_reports(report, baseline, tolerance):
+    """Return the timings that are slower than in the baseline by more than tolerance (a fraction)."""
+    current = flatten_medians(report['results'])
+    previous = flatten_medians(baseline.get('results', {}))
+    regressions = {}
+    for name, value in current.items():
+        if name in previous and previous[name] > 0 and value > previous[name] * (1 + tolerance):
+            regressions[name] = {'baseline_ms': previous[name], 'current_ms': value,
+                                 'change': round(value / previous[name] - 1, 3)}
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=165, help='questions in the synthetic partition')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement')
+    parser.add_argument('--openai-latency-ms', type=float, default=0.0, help='delay added by the fake OpenAI endpoint')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against --compare (0.25 = 25%%)')
+    parser.add_argument('--workdir', help='folder for the SQLite file and caches (default: a temporary folder)')
+    args = parser.parse_args()
+    args.repeat = max(args.repeat, 1)
+
+    sys.path.insert(0, BENCHMARK_DIR)
+    from offline_backends import create_sqlite_database, StubS3Client, FakeChatCompletionServer, write_sample_attachments
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='gaia-benchmark-'))
+    os.makedirs(workdir, exist_ok=True)
+    original_dir = os.getcwd()
+    openai_server = FakeChatCompletionServer(latency_seconds=args.openai_latency_ms / 1000)
+    try:
+        sqlite_url = create_sqlite_database(os.path.join(workdir, 'benchmark.db'), users=[BENCHMARK_USER])
+        configure_environment(workdir, sqlite_url, openai_server.start())
+        s3_client = StubS3Client()
+
+        results = {}
+        # App output goes to stderr so stdout carries only the report
+        with contextlib.redirect_stdout(sys.stderr):
+            attachments = write_sample_attachments(os.path.join(workdir, 'attachments'))
+            # Ingest first: the other measurements read the partition it writes
+            results['ingest'] = bench_ingest(args, s3_client, attachments, workdir)
+            results['fetch_dataframe_from_sql'] = bench_fetch(args)
+            results['explore'] = bench_explore(args, s3_client)
+            results['update_user_result'] = bench_update_user_result(args)
+            results['preprocess_file'] = bench_preprocess(args, attachments)
+
+            from scripts.data_handling.result_writer import flush_pending
+            flush_pending()
+
+        from scripts.api_utils.telemetry import metrics_snapshot
+        spans = {name: {**totals, 'seconds': round(totals['seconds'], 3)} for name, totals in sorted(metrics_snapshot().items())}
+
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {'rows': args.rows, 'repeat': args.repeat, 'openai_latency_ms': args.openai_latency_ms},
+            'stand_ins': {'s3_calls': dict(s3_client.calls), 'openai_requests': openai_server.requests},
+            'results': results,
+            'spans': spans,
+        }
+    finally:
+        openai_server.stop()
+        os.chdir(original_dir)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.tolerance)
+        report['regressions'] = regressions
+        status = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
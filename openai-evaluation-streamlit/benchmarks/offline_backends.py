@@ -0,0 +1,242 @@
+"""Local stand-ins for Azure SQL, S3 and the OpenAI API, used by the offline benchmarks.
+
+- SQLite replaces Azure SQL: point the app at it with SQL_DATABASE_URL (see create_sqlite_database).
+- StubS3Client is an in-memory S3 implementing the client calls the app makes.
+- FakeChatCompletionServer is an OpenAI-compatible /chat/completions endpoint on localhost, so the real
+  openai client runs unchanged once OPENAI_API_BASE points at it.
+- write_sample_attachments builds a small corpus with one attachment per supported file type.
+"""
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from botocore.exceptions import ClientError
+
+# Tables created by scripts/setup_database.py, in SQLite syntax (GaiaDataset is created by the ingest itself)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT UNIQUE,
+    password TEXT,
+    role TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_results (
+    result_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    task_id TEXT,
+    user_result_status TEXT,
+    chatgpt_response TEXT,
+    created_date TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS IX_user_results_user_task ON user_results (user_id, task_id);
+CREATE INDEX IF NOT EXISTS IX_user_results_task ON user_results (task_id);
+CREATE TABLE IF NOT EXISTS user_result_cube (
+    user_id TEXT,
+    dimension TEXT,
+    dimension_value TEXT,
+    user_result_status TEXT,
+    question_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, dimension, dimension_value, user_result_status)
+);
+"""
+
+def create_sqlite_database(path, users=()):
+    """Create the app's tables in a SQLite file, add (user_id, username, role) users, and return its SQLAlchemy URL."""
+    with sqlite3.connect(path) as connection:
+        connection.executescript(SQLITE_SCHEMA)
+        connection.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, password, role) VALUES (?, ?, '', ?)", users
+        )
+    return f"sqlite:///{os.path.abspath(path)}"
+
+class StubBody:
+    """The StreamingBody part of a get_object response."""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        for chunk in iter(lambda: self._stream.read(chunk_size), b''):
+            yield chunk
+
+class StubS3Client:
+    """Thread-safe in-memory S3 with the calls the app makes: head_object, put_object, upload_file and get_object."""
+
+    def __init__(self):
+        self.objects = {}  # (bucket, key) -> (data, etag)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _error(self, code, operation):
+        return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+    def _get(self, bucket, key, operation):
+        with self._lock:
+            self.calls[operation] += 1
+            entry = self.objects.get((bucket, key))
+        if entry is None:
+            raise self._error('404' if operation == 'HeadObject' else 'NoSuchKey', operation)
+        return entry
+
+    def put_object(self, Bucket, Key, Body=b''):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.calls['PutObject'] += 1
+            self.objects[(Bucket, Key)] = (data, hashlib.md5(data).hexdigest())
+        return {'ETag': f'"{self.objects[(Bucket, Key)][1]}"'}
+
+    def upload_file(self, Filename, Bucket, Key, Config=None, ExtraArgs=None):
+        with open(Filename, 'rb') as file:
+            self.put_object(Bucket, Key, file.read())
+
+    def head_object(self, Bucket, Key):
+        data, etag = self._get(Bucket, Key, 'HeadObject')
+        return {'ContentLength': len(data), 'ETag': f'"{etag}"'}
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None):
+        data, etag = self._get(Bucket, Key, 'GetObject')
+        if IfNoneMatch and IfNoneMatch.strip('"') == etag:
+            raise self._error('304', 'GetObject')
+        if Range:
+            if not data:
+                raise self._error('InvalidRange', 'GetObject')
+            start, end = Range[len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': StubBody(data), 'ContentLength': len(data), 'ETag': f'"{etag}"'}
+
+class FakeChatCompletionServer:
+    """OpenAI-compatible chat completions endpoint on localhost, answering every request with the same reply."""
+
+    def __init__(self, reply='YES', latency_seconds=0.0):
+        self.reply = reply
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        self._server = None
+
+    def start(self):
+        """Start serving in a daemon thread and return the API base URL (for OPENAI_API_BASE)."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                fake.requests += 1
+                if fake.latency_seconds:
+                    time.sleep(fake.latency_seconds)
+                body = json.dumps({
+                    'id': f"chatcmpl-{fake.requests}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': 'gpt-3.5-turbo',
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': fake.reply}, 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep the benchmark output to the JSON report
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name='fake-openai', daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+def sample_lines(count):
+    return [f"Line {number}: the population of city {number % 17} was {1000 + number * 37} in year {1990 + number % 30}."
+            for number in range(count)]
+
+def minimal_pdf(lines):
+    """Build a one-page PDF with the given lines of text in a standard font."""
+    escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in lines]
+    content = "BT /F1 10 Tf 40 760 Td 12 TL " + ' '.join(f"({line}) '" for line in escaped) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    pdf += b''.join(f"{offset:010d} 00000 n \n".encode('ascii') for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('ascii')
+    return pdf
+
+def write_sample_attachments(directory, lines=2000):
+    """Write one attachment per file type preprocess_file supports and return {extension: path}."""
+    import pandas as pd
+    from docx import Document
+    from pptx import Presentation
+
+    os.makedirs(directory, exist_ok=True)
+    text_lines = sample_lines(lines)
+    paths = {extension: os.path.join(directory, f"sample{extension}") for extension in
+             ['.txt', '.py', '.csv', '.xlsx', '.jsonld', '.docx', '.pdf', '.pptx', '.pdb', '.zip']}
+
+    with open(paths['.txt'], 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(text_lines))
+    with open(paths['.py'], 'w', encoding='utf-8') as file:
+        file.write('\n'.join(f"value_{number} = {number} * 37  # {line}" for number, line in enumerate(text_lines)))
+
+    table = pd.DataFrame({
+        'city': [number % 17 for number in range(lines)],
+        'year': [1990 + number % 30 for number in range(lines)],
+        'population': [1000 + number * 37 for number in range(lines)],
+    })
+    table.to_csv(paths['.csv'], index=False)
+    table.to_excel(paths['.xlsx'], index=False)
+
+    with open(paths['.jsonld'], 'w', encoding='utf-8') as file:
+        json.dump({'@context': 'https://schema.org', '@graph': [
+            {'@type': 'Place', 'name': f"city {number}", 'population': 1000 + number * 37} for number in range(lines // 10)
+        ]}, file)
+
+    document = Document()
+    for line in text_lines[:lines // 4]:
+        document.add_paragraph(line)
+    document.save(paths['.docx'])
+
+    with open(paths['.pdf'], 'wb') as file:
+        file.write(minimal_pdf(text_lines[:60]))
+
+    presentation = Presentation()
+    for start in range(0, 200, 10):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {start // 10 + 1}"
+        slide.placeholders[1].text = '\n'.join(text_lines[start:start + 10])
+    presentation.save(paths['.pptx'])
+
+    with open(paths['.pdb'], 'w', encoding='ascii') as file:
+        file.write("HEADER    BENCHMARK STRUCTURE\nTITLE     SAMPLE PROTEIN\n")
+        for number in range(lines):
+            file.write(f"ATOM  {number + 1:5d}  CA  ALA A{number % 999 + 1:4d}    "
+                       f"{number * 0.1:8.3f}{number * 0.2:8.3f}{number * 0.3:8.3f}  1.00  0.00           C\n")
+        file.write("END\n")
+
+    with zipfile.ZipFile(paths['.zip'], 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(paths['.txt'], 'notes.txt')
+        archive.write(paths['.csv'], 'table.csv')
+        archive.write(paths['.docx'], 'report.docx')
+    return paths
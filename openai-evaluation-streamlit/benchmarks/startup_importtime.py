@@ -0,0 +1,121 @@
+"""Cold-start import benchmark for the Streamlit app.
+
+Imports the modules of the landing and login paths in a fresh interpreter with `python -X importtime`,
+reports the time spent importing app code and its dependencies (excluding Streamlit itself), and exits
+with status 1 if a path exceeds its budget or loads a module that should only be imported on first use.
+
+Usage (from the openai-evaluation-streamlit folder):
+    python benchmarks/startup_importtime.py [--budget-ms 400] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported by each cold-start path
+STARTUP_PATHS = {
+    'landing': ['newapp'],
+    'login': ['newapp', 'streamlit_pages.login_page'],
+}
+
+# Heavy modules that must not be loaded by app code before the page needing them is opened
+DEFERRED_MODULES = [
+    'pandas', 'numpy', 'boto3', 'botocore', 'openai', 'matplotlib', 'PyPDF2', 'docx', 'PIL',
+    'pyarrow', 'datasets', 'huggingface_hub',
+]
+
+# Default budget for app imports in milliseconds (Streamlit's own import time is not counted)
+DEFAULT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '400'))
+
+class ImportNode:
+    def __init__(self, name, level, cumulative_us):
+        self.name = name
+        self.level = level
+        self.cumulative_us = cumulative_us
+        self.children = []
+
+    def walk(self, skip=()):
+        """Yield this node and its descendants, leaving out the subtrees of top-level packages in skip."""
+        if self.name.split('.')[0] in skip:
+            return
+        yield self
+        for child in self.children:
+            yield from child.walk(skip)
+
+def parse_importtime(stderr):
+    """Turn `-X importtime` output into a list of top-level ImportNode trees."""
+    roots = []
+    pending = []  # Nodes waiting for their parent; importtime prints children before their parent
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Names are indented by two spaces per nesting level after the separator's space
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        node = ImportNode(name.strip(), level, int(cumulative_us))
+
+        while pending and pending[-1].level > level:
+            node.children.insert(0, pending.pop())
+        if level == 0:
+            roots.append(node)
+        else:
+            pending.append(node)
+    return roots
+
+def measure(modules):
+    """Import the modules in a fresh interpreter and return (app_ms, deferred modules loaded by app code)."""
+    code = '; '.join(f'import {module}' for module in modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{result.stderr[-2000:]}")
+
+    packages = {module.split('.')[0] for module in modules}
+    app_us = 0
+    loaded = set()
+    for root in parse_importtime(result.stderr):
+        if root.name.split('.')[0] not in packages:
+            continue  # Interpreter startup (site, encodings, ...)
+        # Streamlit's own imports (and whatever it loads) are not ours to optimize
+        streamlit_us = sum(node.cumulative_us for node in root.walk() if node.name == 'streamlit')
+        app_nodes = list(root.walk(skip=('streamlit',)))
+        if not app_nodes:
+            continue
+        app_us += root.cumulative_us - streamlit_us
+        loaded.update(node.name.split('.')[0] for node in app_nodes if node.name.split('.')[0] in DEFERRED_MODULES)
+    return app_us / 1000, sorted(loaded)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='maximum app import time per path')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per path; the fastest run counts')
+    args = parser.parse_args()
+
+    # Warm the OS file cache so the first measured run is not dominated by disk reads
+    subprocess.run([sys.executable, '-c', 'import streamlit'], cwd=APP_DIR, capture_output=True)
+
+    report = {'budget_ms': args.budget_ms, 'paths': {}}
+    failed = False
+    for path_name, modules in STARTUP_PATHS.items():
+        runs = [measure(modules) for _ in range(args.runs)]
+        app_ms = min(run[0] for run in runs)
+        loaded = runs[0][1]
+        passed = app_ms <= args.budget_ms and not loaded
+        failed = failed or not passed
+        report['paths'][path_name] = {
+            'modules': modules,
+            'app_import_ms': round(app_ms, 1),
+            'deferred_modules_loaded': loaded,
+            'passed': passed,
+        }
+
+    print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,21 +1,23 @@
 #newapp.py
 import os
 import streamlit as st
-import pandas as pd
 from dotenv import load_dotenv
-from scripts.api_utils.amazon_s3_utils import init_s3_client
-from scripts.api_utils.azure_sql_utils import fetch_dataframe_from_sql, fetch_user_results
-from scripts.api_utils.chatgpt_utils import init_openai
-from streamlit_pages.login_page import login_page
-from streamlit_pages.register_page import register_page
-from streamlit_pages.admin_page import admin_page
-from streamlit_pages.admin_dataset_management import admin_dataset_management_page
-from streamlit_pages.admin_user_management import admin_user_management_page
+from scripts.api_utils.telemetry import span, start_metrics_server
+
+# Pages and the pandas/boto3/SQLAlchemy/OpenAI helpers are imported where they are first used,
+# so the landing and login pages start without loading them
 
 # Load environment variables
 load_dotenv()
 
 def main():
+    # Optional (APP_WARMUP=1): prime Azure SQL, the dataset cache and attachments once per server process
+    from scripts.warmup import start_warmup
+    start_warmup()
+
+    # Optional (METRICS_PORT): serve span metrics for Prometheus once per server process
+    start_metrics_server()
+
     # Set default values for session state using setdefault()
     st.session_state.setdefault('page', 'landing')
     st.session_state.setdefault('login_success', False)
@@ -23,8 +25,13 @@ def main():
     st.session_state.setdefault('user_id', None)  # Ensure 'user_id' is initialized properly
     st.session_state.setdefault('role', '')
 
+    # Time the whole script run, including the SQL, S3, OpenAI and extraction spans it triggers
+    with span('streamlit.rerun', page=st.session_state.page):
+        render_page()
+
+def render_page():
     # Ensure user is logged in before accessing certain pages
-    if st.session_state.page in ['main', 'explore_questions', 'admin', 'view_summary'] and not st.session_state['login_success']:
+    if st.session_state.page in ['main', 'explore_questions', 'admin', 'admin_leaderboard', 'view_summary'] and not st.session_state['login_success']:
         st.error("Please login to access this page.")
         st.session_state.page = 'login'  # Redirect to login page
         return
@@ -33,17 +40,25 @@ def main():
     if st.session_state.page == 'landing':
         run_landing_page()
     elif st.session_state.page == 'login':
+        from streamlit_pages.login_page import login_page
         login_page()
     elif st.session_state.page == 'register':
+        from streamlit_pages.register_page import register_page
         register_page()
     elif st.session_state.page == 'main':
         run_main_page()
     elif st.session_state.page == 'admin':
+        from streamlit_pages.admin_page import admin_page
         admin_page()
     elif st.session_state.page == 'admin_dataset_management':
+        from streamlit_pages.admin_dataset_management import admin_dataset_management_page
         admin_dataset_management_page()
     elif st.session_state.page == 'admin_user_management':
+        from streamlit_pages.admin_user_management import admin_user_management_page
         admin_user_management_page()
+    elif st.session_state.page == 'admin_leaderboard':
+        from streamlit_pages.admin_leaderboard import admin_leaderboard_page
+        admin_leaderboard_page()
     elif st.session_state.page == 'explore_questions':
         run_explore_questions()
     elif st.session_state.page == 'view_summary':
@@ -137,10 +152,14 @@ def run_explore_questions():
         st.error("Missing S3_BUCKET_NAME.")
         return
 
+    from scripts.api_utils.chatgpt_utils import init_openai
+    from scripts.api_utils.amazon_s3_utils import init_s3_client
+    from scripts.data_handling.dataset_snapshot import get_gaia_dataframe, DEFAULT_PARTITION
+
     init_openai(openai_api_key)
     s3_client = init_s3_client(aws_access_key, aws_secret_key)
 
-    df = fetch_dataframe_from_sql()
+    df = get_gaia_dataframe(st.session_state.get('dataset_partition', DEFAULT_PARTITION))
     if df is not None:
         from streamlit_pages.explore_questions import run_streamlit_app
         run_streamlit_app(df, s3_client, bucket_name)
@@ -155,36 +174,30 @@ def run_view_summary():
         st.session_state.page = 'login'  # Redirect to login page
         return
 
-    # Fetch the main dataset (GaiaDataset)
-    df = fetch_dataframe_from_sql()
-    
-    # Fetch user-specific results (returns None if no results are found)
-    user_results_df = fetch_user_results(st.session_state['user_id'])
+    import pandas as pd
+    from scripts.api_utils.azure_sql_utils import fetch_result_cube, fetch_result_totals, rebuild_result_cube
 
-    # Ensure the main dataset was fetched successfully
-    if df is None:
-        st.error("Failed to load the main dataset from Azure SQL.")
+    user_id = st.session_state['user_id']
+
+    # Question total over every partition, the same scope as the cube, and the user's saved results
+    totals = fetch_result_totals(user_id)
+    cube_df = fetch_result_cube(user_id)
+    if totals is None or cube_df is None:
+        st.error("Failed to load the result summary from Azure SQL.")
         return
-    
-    # If user_results_df is None (no results found for the user), create an empty DataFrame
-    if user_results_df is None or user_results_df.empty:
+    cube_total = cube_df.loc[cube_df['dimension'] == 'all', 'question_count'].sum()
+    if cube_total != totals['user_results']:
+        # Results saved before the cube existed (or while it could not be updated) are missing from it
+        rebuild_result_cube(user_id)
+        cube_df = fetch_result_cube(user_id)
+    if cube_df is None or cube_df.empty:
         st.write("No user results found. Please complete some questions.")
-        user_results_df = pd.DataFrame(columns=['task_id', 'user_result_status', 'chatgpt_response'])  # Empty DataFrame
-
-    # Drop 'user_result_status' from df (main dataset) to avoid duplication during the merge
-    if 'user_result_status' in df.columns:
-        df = df.drop(columns=['user_result_status'])
-
-    # Merge the two dataframes on 'task_id'
-    merged_df = df.merge(user_results_df[['task_id', 'user_result_status']], on='task_id', how='left')
-
-    # Fill missing 'user_result_status' with 'N/A'
-    merged_df['user_result_status'] = merged_df['user_result_status'].fillna('N/A')
+        cube_df = pd.DataFrame(columns=['dimension', 'dimension_value', 'user_result_status', 'question_count'])
 
     from streamlit_pages.view_summary import run_summary_page
 
-    # Call the summary page with the merged dataframe
-    run_summary_page(merged_df, user_results_df)
+    # Call the summary page with the aggregated results
+    run_summary_page(totals['total_questions'], cube_df, on_recalculate=lambda: rebuild_result_cube(user_id))
 
 
 if __name__ == "__main__":
@@ -1,85 +1,409 @@
 #amazon_s3_utils
+import contextvars
+import hashlib
+import io
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
+import pandas as pd
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from .telemetry import traced, annotate, mark_error
+
+# One client per credentials/endpoint, shared by the whole process
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+# Total size of downloaded attachments kept in the local cache before LRU eviction
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv('S3_DOWNLOAD_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Sidecar file holding the ETag of a cached object, and the suffix of in-progress writes
+ETAG_SUFFIX = '.etag'
+TEMP_SUFFIX = '.part'
+
+download_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_download_cache_lock = threading.Lock()
+
+# First bytes of a Git LFS pointer file, left in place of an attachment whose content was not pulled
+LFS_POINTER_PREFIX = b'version https://git-lfs'
+
+# Number of attachments uploaded concurrently during ingest
+UPLOAD_WORKERS = 8
+
+# Files at or above the threshold are uploaded in parts of MULTIPART_CHUNKSIZE
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=4,  # Part uploads per file, on top of UPLOAD_WORKERS files in flight
+    use_threads=True
+)
+
+# Botocore settings for the shared S3 client
+def build_s3_client_config():
+    """Build the botocore config (pool size, adaptive retries, timeouts) from environment variables."""
+    return Config(
+        # Enough connections for UPLOAD_WORKERS files with TRANSFER_CONFIG part uploads each
+        max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50)),
+        retries={'max_attempts': int(os.getenv('S3_MAX_ATTEMPTS', 5)), 'mode': 'adaptive'},
+        connect_timeout=int(os.getenv('S3_CONNECT_TIMEOUT', 5)),
+        read_timeout=int(os.getenv('S3_READ_TIMEOUT', 60))
+    )
 
 # Initialize AWS S3 client
-def init_s3_client(access_key, secret_key):
-    """Initialize AWS S3 client."""
-    return boto3.client('s3',
-                        aws_access_key_id=access_key,
-                        aws_secret_access_key=secret_key)
+def init_s3_client(access_key, secret_key, endpoint_url=None):
+    """Return the process-wide AWS S3 client for these credentials, creating it on first use.
+
+    endpoint_url (or S3_ENDPOINT_URL) points the client at an S3-compatible stand-in such as MinIO.
+    """
+    endpoint_url = endpoint_url or os.getenv('S3_ENDPOINT_URL') or None
+    key = (access_key, secret_key, endpoint_url)
+
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is None:
+            # boto3 clients are thread-safe, so sessions and worker threads share one connection pool
+            client = boto3.client('s3',
+                                  aws_access_key_id=access_key,
+                                  aws_secret_access_key=secret_key,
+                                  endpoint_url=endpoint_url,
+                                  config=build_s3_client_config())
+            _s3_clients[key] = client
+        return client
+
+# Index every attachment in the repository in one pass
+def build_file_index(repo_dir):
+    """Walk all year/split folders of the local repository once, mapping file name to (path, size, mtime)."""
+    file_index = {}
+    pending_dirs = [repo_dir]
+    while pending_dirs:
+        try:
+            with os.scandir(pending_dirs.pop()) as scan:
+                for entry in scan:
+                    if entry.name.startswith('.'):
+                        continue  # Skip .git, .gitattributes and other metadata
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        file_index.setdefault(entry.name, (entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            continue
+
+    print(f"Indexed {len(file_index)} files in {repo_dir}")
+    return file_index
+
+# Update index entries after their files changed on disk
+def refresh_file_index(file_index, file_names):
+    """Re-read the size and mtime of indexed files, e.g. after an LFS pull replaced their pointers."""
+    for file_name in file_names:
+        path = file_index[file_name][0]
+        stat = os.stat(path)
+        file_index[file_name] = (path, stat.st_size, stat.st_mtime)
+
+# Check whether a local file is an LFS pointer instead of the attachment itself
+def is_lfs_pointer(local_file_path):
+    with open(local_file_path, 'rb') as file:
+        return file.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX
 
 # Find a file by name in the repository
-def find_file_in_repo(file_name, repo_dir):
-    """Find a file by name in the local repository."""
+def find_file_in_repo(file_name, repo_dir, file_index=None, config_name='2023_all', split_name='validation'):
+    """Find a file by name in the local repository, using a prebuilt file index if given.
+
+    Without an index, the file is looked up in the year/split folder of the given partition.
+    """
+    if file_index is not None:
+        entry = file_index.get(file_name)
+        return entry[0] if entry else None
+
     # Construct the expected file path
-    search_path = os.path.join(repo_dir, "2023", "validation", file_name)
+    year = config_name.split('_')[0]  # '2023_level1' -> '2023'
+    search_path = os.path.join(repo_dir, year, split_name, file_name)
     if os.path.exists(search_path):
-        print(f"File {file_name} found at {search_path}")
         return search_path
-    else:
-        print(f"File {file_name} not found in {search_path}")
-        return None
+    return None
+
+# Compute the ETag S3 assigns to a local file uploaded with TRANSFER_CONFIG
+def compute_s3_etag(local_file_path):
+    """Compute the expected S3 ETag (plain MD5, or MD5 of part MD5s for multipart uploads) of a local file."""
+    if os.path.getsize(local_file_path) < MULTIPART_THRESHOLD:
+        digest = hashlib.md5()
+        with open(local_file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    part_digests = []
+    with open(local_file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(MULTIPART_CHUNKSIZE), b''):
+            part_digests.append(hashlib.md5(chunk).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+# Check whether the object in S3 already holds the same bytes as the local file
+def s3_object_matches(s3_client, bucket_name, key, local_file_path):
+    """Return True if the S3 object exists with the same size and ETag as the local file."""
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError:
+        return False  # Missing object (or no permission to read it), so upload
+
+    if head.get('ContentLength') != os.path.getsize(local_file_path):
+        return False
+    return head.get('ETag', '').strip('"') == compute_s3_etag(local_file_path)
+
+# Upload a single file unless an identical object is already in S3
+@traced('s3.upload_file')
+def upload_file_if_changed(local_file_path, s3_client, bucket_name, key):
+    """Upload a file to S3, skipping it if unchanged. Returns ('uploaded' or 'skipped', bytes sent).
+
+    Raises ValueError for an LFS pointer file, which would overwrite the real attachment in S3.
+    """
+    if is_lfs_pointer(local_file_path):
+        raise ValueError(f"{local_file_path} is a Git LFS pointer; its content was not pulled")
+    if s3_object_matches(s3_client, bucket_name, key, local_file_path):
+        annotate(key=key, outcome='skipped')
+        return 'skipped', 0
+
+    s3_client.upload_file(local_file_path, bucket_name, key, Config=TRANSFER_CONFIG)
+    sent_bytes = os.path.getsize(local_file_path)
+    annotate(key=key, outcome='uploaded', bytes=sent_bytes)
+    return 'uploaded', sent_bytes
 
 # Upload files to S3 and update paths in the DataFrame
-def upload_files_to_s3_and_update_paths(dataset, s3_client, bucket_name, repo_dir):
-    """Upload files to S3 and update paths in the DataFrame."""
+@traced('s3.upload_files')
+def upload_files_to_s3_and_update_paths(dataset, s3_client, bucket_name, repo_dir, file_index=None, print_summary=True):
+    """Upload files to S3 in parallel and update paths in the DataFrame. Returns the DataFrame and upload stats.
+
+    A file that fails to upload keeps its rows' file_path unchanged and is counted in files_failed.
+    """
+    if file_index is None:
+        file_index = build_file_index(repo_dir)
+
     # Counters
-    total_files = 0
     files_uploaded = 0
+    files_skipped = 0
+    bytes_uploaded = 0
     file_paths_updated = 0
+    failed_files = []
     uploaded_file_types = set()  # Set to keep track of uploaded file types
 
-    for index, row in dataset.iterrows():
-        if 'file_name' in row and row['file_name']:
-            total_files += 1  # Increment total file name counter
-
-            # Find the file in the repository
-            local_file_path = find_file_in_repo(row['file_name'], repo_dir)
-            if local_file_path:
-                # Upload to S3 (will overwrite if the file already exists)
-                try:
-                    s3_client.upload_file(local_file_path, bucket_name, row['file_name'])
-                    # Update file path to S3 URL
-                    dataset.at[index, 'file_path'] = f"https://{bucket_name}.s3.amazonaws.com/{row['file_name']}"
-                    print(f"Uploaded {row['file_name']} to S3 (overwritten if already existed).")
-                    files_uploaded += 1  # Increment files uploaded counter
-                    file_paths_updated += 1  # Increment file paths updated counter
-
-                    # Add the file type to the set
-                    file_extension = os.path.splitext(row['file_name'])[1].lower()
-                    uploaded_file_types.add(file_extension)  # Track unique file types
-                except Exception as e:
-                    print(f"Error uploading {row['file_name']} to S3: {e}")
+    # Match the whole file_name column against the index at once
+    file_names = dataset['file_name'] if 'file_name' in dataset.columns else pd.Series(dtype=object)
+    file_names = file_names[file_names.notna() & (file_names != '')]
+    total_files = len(file_names)
+    found = file_names.isin(file_index.keys())
+    missing_files = sorted(set(file_names[~found]))
+
+    # Group rows by attachment so each file is checked and uploaded once
+    rows_by_file = file_names[found].groupby(file_names[found]).groups
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {}
+        for file_name in rows_by_file:
+            local_file_path = file_index[file_name][0]
+            # Run in a copy of the caller's context so each upload span nests under this one
+            futures[executor.submit(contextvars.copy_context().run, upload_file_if_changed,
+                                    local_file_path, s3_client, bucket_name, file_name)] = file_name
+
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                outcome, sent_bytes = future.result()
+            except Exception as e:
+                print(f"Error uploading {file_name} to S3: {e}")
+                failed_files.append(file_name)
+                continue
+
+            if outcome == 'skipped':
+                files_skipped += 1
             else:
-                print(f"File {row['file_name']} not found in repository.")
-    
+                files_uploaded += 1  # Increment files uploaded counter
+                bytes_uploaded += sent_bytes
+
+            # Update file path to S3 URL
+            for index in rows_by_file[file_name]:
+                dataset.at[index, 'file_path'] = f"https://{bucket_name}.s3.amazonaws.com/{file_name}"
+                file_paths_updated += 1  # Increment file paths updated counter
+
+            # Add the file type to the set
+            uploaded_file_types.add(os.path.splitext(file_name)[1].lower())  # Track unique file types
+    elapsed = time.perf_counter() - start_time
+    bytes_per_second = bytes_uploaded / elapsed if elapsed > 0 else 0.0
+    annotate(files_uploaded=files_uploaded, files_skipped=files_skipped, files_missing=len(missing_files),
+             files_failed=len(failed_files))
+
+    upload_stats = {
+        'total_files': total_files,
+        'files_uploaded': files_uploaded,
+        'files_skipped': files_skipped,
+        'files_missing': len(missing_files),
+        'missing_file_names': missing_files,
+        'files_failed': len(failed_files),
+        'failed_file_names': sorted(failed_files),
+        'bytes_uploaded': bytes_uploaded,
+        'seconds': elapsed,
+        'bytes_per_second': bytes_per_second,
+    }
+    if not print_summary:
+        return dataset, upload_stats
+
     # Print summary
     print(f"\nSummary:")
     print(f"Total rows with file names: {total_files}")
     print(f"Total files uploaded to S3: {files_uploaded}")
+    print(f"Total files skipped (unchanged in S3): {files_skipped}")
+    print(f"Total files missing from repository: {len(missing_files)}")
+    if missing_files:
+        print(f"Missing files: {', '.join(missing_files)}")
+    print(f"Total files that failed to upload: {len(failed_files)}")
+    if failed_files:
+        print(f"Failed files: {', '.join(sorted(failed_files))}")
     print(f"Total file paths updated in DataFrame: {file_paths_updated}")
+    print(f"Upload throughput: {bytes_uploaded} bytes in {elapsed:.1f}s ({bytes_per_second / (1024 * 1024):.2f} MB/s)")
     print(f"Uploaded file types: {', '.join(uploaded_file_types)}") 
-    
-    return dataset
+
+    return dataset, upload_stats
 
 # Download file from S3
+@traced('s3.download_file')
 def download_file_from_s3(file_name, bucket_name, download_dir, s3_client):
-    """Download a file from S3 to the specified directory."""
+    """Download a file from S3 into the local cache directory, reusing the cached copy if its ETag still matches."""
     if not file_name or not bucket_name:
         print(f"Error: file_name or bucket_name is None. file_name: {file_name}, bucket_name: {bucket_name}")
         return None
     
     os.makedirs(download_dir, exist_ok=True)  # Create download directory if not exists
     file_path = os.path.join(download_dir, file_name)  # Define the local file path
+    etag_path = file_path + ETAG_SUFFIX
+
+    # ETag of the cached copy, if there is one
+    cached_etag = None
+    if os.path.exists(file_path) and os.path.exists(etag_path):
+        with open(etag_path, 'r') as etag_file:
+            cached_etag = etag_file.read().strip()
 
     try:
-        # Attempt to download the file from S3
-        s3_client.download_file(bucket_name, file_name, file_path)
+        request = {'Bucket': bucket_name, 'Key': file_name}
+        if cached_etag:
+            request['IfNoneMatch'] = cached_etag
+
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if cached_etag and e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                # Cached copy is current; touch it so LRU eviction sees the access
+                os.utime(file_path)
+                with _download_cache_lock:
+                    download_cache_stats['hits'] += 1
+                annotate(key=file_name, cache='hit')
+                print(f"Using cached {file_name} at {file_path}")
+                return file_path
+            raise
+
+        # Stream into a temporary file and rename it into place so readers never see a torn file
+        fd, temp_path = tempfile.mkstemp(dir=download_dir, prefix='.', suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in response['Body'].iter_chunks(1024 * 1024):
+                    temp_file.write(chunk)
+            os.replace(temp_path, file_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        write_file_atomically(etag_path, response.get('ETag', '').encode('utf-8'))
+
+        with _download_cache_lock:
+            download_cache_stats['misses'] += 1
+        annotate(key=file_name, cache='miss', bytes=os.path.getsize(file_path))
         print(f"Downloaded {file_name} from S3 to {file_path}")
+
+        evict_download_cache(download_dir, keep=file_path)
         return file_path  # Return the path of the downloaded file
     except Exception as e:
         print(f"Error downloading {file_name} from S3: {e}")
+        mark_error(e)
         return None
 
+# Fetch a file from S3 into memory
+@traced('s3.fetch_file')
+def fetch_file_from_s3(file_name, bucket_name, s3_client, max_bytes=None):
+    """Fetch an S3 object into a BytesIO named after the object, reading only the first max_bytes if given."""
+    if not file_name or not bucket_name:
+        print(f"Error: file_name or bucket_name is None. file_name: {file_name}, bucket_name: {bucket_name}")
+        return None
+
+    try:
+        request = {'Bucket': bucket_name, 'Key': file_name}
+        if max_bytes:
+            request['Range'] = f"bytes=0-{max_bytes - 1}"  # Ranged GET, only the head of the object
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+                raise
+            # Empty objects reject any range, so fetch them whole
+            request.pop('Range')
+            response = s3_client.get_object(**request)
+
+        buffer = io.BytesIO()
+        for chunk in response['Body'].iter_chunks(1024 * 1024):
+            buffer.write(chunk)
+        buffer.seek(0)
+        buffer.name = file_name  # Lets preprocess_file pick the extractor from the extension
+        annotate(key=file_name, bytes=buffer.getbuffer().nbytes, ranged='Range' in request)
+        print(f"Fetched {file_name} from S3 into memory ({buffer.getbuffer().nbytes} bytes)")
+        return buffer
+    except Exception as e:
+        print(f"Error fetching {file_name} from S3: {e}")
+        mark_error(e)
+        return None
+
+# Write a small file via a temporary file and an atomic rename
+def write_file_atomically(path, data):
+    """Write bytes to path so that concurrent readers see either the old or the new content."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix=TEMP_SUFFIX)
+    with os.fdopen(fd, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+# Keep the download cache under its size quota
+def evict_download_cache(download_dir, max_bytes=DOWNLOAD_CACHE_MAX_BYTES, keep=None):
+    """Delete the least recently used cached files until the cache fits in max_bytes."""
+    entries = []
+    total_bytes = 0
+    with os.scandir(download_dir) as scan:
+        for entry in scan:
+            if not entry.is_file() or entry.name.endswith((ETAG_SUFFIX, TEMP_SUFFIX)):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+    # Oldest access first
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            if os.path.exists(path + ETAG_SUFFIX):
+                os.remove(path + ETAG_SUFFIX)
+        except FileNotFoundError:
+            pass  # Already evicted by another session
+        total_bytes -= size
+        with _download_cache_lock:
+            download_cache_stats['evictions'] += 1
 
+# Hit/miss counters for the download cache
+def get_download_cache_stats():
+    """Return a copy of the download cache counters."""
+    with _download_cache_lock:
+        return dict(download_cache_stats)
@@ -1,18 +1,23 @@
 import os
-import pandas as pd
+import threading
+import time
 import bcrypt
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.types import NVARCHAR, Integer, DateTime
 from sqlalchemy.exc import SQLAlchemyError
+from .telemetry import traced, annotate, mark_error, record_span
 
-# Load environment variables
-load_dotenv()
+# Environment variables are loaded by the entry points (newapp.py, main.py, setup_database.py).
+# pandas is imported inside the functions returning DataFrames, so logging in does not load it.
 
 def get_sqlalchemy_connection_string():
     """
     Constructs an SQLAlchemy connection string for Azure SQL Database.
+    SQL_DATABASE_URL overrides it, e.g. sqlite:///bench.db for the offline benchmarks.
     """
+    if os.getenv('SQL_DATABASE_URL'):
+        return os.getenv('SQL_DATABASE_URL')
+
     server = os.getenv('AZURE_SQL_SERVER')
     user = os.getenv('AZURE_SQL_USER')
     password = os.getenv('AZURE_SQL_PASSWORD')
@@ -20,94 +25,320 @@ def get_sqlalchemy_connection_string():
 
     return f"mssql+pymssql://{user}:{password}@{server}/{database}"
 
-# Function to insert a DataFrame into the SQL table (e.g., for initial data setup)
-def insert_dataframe_to_sql(df, table_name):
+# One engine (and connection pool) per process, created on first use
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Returns the shared SQLAlchemy engine, creating it on first use.
+    Reusing it keeps connections pooled instead of opening a new pool for every query.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            # pool_pre_ping replaces connections Azure SQL closed while they sat idle in the pool
+            _engine = create_engine(get_sqlalchemy_connection_string(), pool_pre_ping=True)
+            instrument_engine(_engine)
+        return _engine
+
+def instrument_engine(engine):
+    """
+    Records every statement the engine runs as a sql.query span, nested under the span of the calling function.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info['query_start_times'].pop()
+        record_span('sql.query', seconds, operation=statement_operation(statement),
+                    rowcount=cursor.rowcount, executemany=executemany)
+
+    @event.listens_for(engine, 'handle_error')
+    def record_failed_query(exception_context):
+        start_times = exception_context.connection.info.get('query_start_times') if exception_context.connection else None
+        if start_times:
+            record_span('sql.query', time.perf_counter() - start_times.pop(), status='error',
+                        operation=statement_operation(exception_context.statement or ''),
+                        error=str(exception_context.original_exception))
+
+# First keyword of a statement (SELECT, MERGE, INSERT, ...), logged instead of the statement and its parameters
+def statement_operation(statement):
+    words = statement.split(None, 1)
+    return words[0].upper() if words else ''
+
+# True when running against the local SQLite stand-in instead of Azure SQL
+def is_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+# Column types used when writing the GAIA dataset to SQL
+GAIA_DATASET_DTYPES = {
+    'config_name': NVARCHAR(length=50),
+    'split_name': NVARCHAR(length=20),
+    'task_id': NVARCHAR(length=50),
+    'Question': NVARCHAR(length='max'),
+    'Level': Integer,
+    'FinalAnswer': NVARCHAR(length='max'),
+    'file_name': NVARCHAR(length=255),
+    'file_path': NVARCHAR(length='max'),
+    'Annotator_Metadata_Steps': NVARCHAR(length='max'),
+    'Annotator_Metadata_Number_of_steps': NVARCHAR(length='max'),
+    'Annotator_Metadata_How_long_did_this_take': NVARCHAR(length=100),
+    'Annotator_Metadata_Tools': NVARCHAR(length='max'),
+    'Annotator_Metadata_Number_of_tools': Integer,
+    'user_result_status': NVARCHAR(length=50),
+    'created_date': DateTime
+}
+
+# Columns of the dataset table, in table order
+DATASET_COLUMNS = ", ".join(GAIA_DATASET_DTYPES)
+
+# Name of the table a partition is loaded into before it replaces the partition of table_name
+def dataset_staging_table(table_name):
+    return f"{table_name}_staging"
+
+# Function to create the dataset and staging tables if needed and empty one partition's staging rows
+@traced('sql.prepare_dataset_partition')
+def prepare_dataset_partition(table_name, config_name, split_name):
     """
-    Inserts DataFrame into Azure SQL Database (replaces existing table).
+    Creates the dataset table and its staging table if they do not exist and deletes the staging rows of one
+    config/split partition (left by an ingest that failed). The dataset table itself is not changed: batches are
+    appended to the staging table and replace_dataset_partitions swaps them in. Returns True on success.
     """
+    staging_table = dataset_staging_table(table_name)
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
-        # Drop table if it exists
         with engine.connect() as connection:
             transaction = connection.begin()
             try:
-                drop_table_query = text(f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL DROP TABLE {table_name};")
-                connection.execute(drop_table_query)
+                if is_sqlite(connection):
+                    connection.execute(text(dataset_table_ddl(table_name, sqlite=True)))
+                    connection.execute(text(dataset_table_ddl(staging_table, sqlite=True)))
+                else:
+                    # Tables from before partitioning have no partition key and are rebuilt once
+                    connection.execute(text(f"""
+                        IF OBJECT_ID('{table_name}', 'U') IS NOT NULL AND COL_LENGTH('{table_name}', 'config_name') IS NULL
+                            DROP TABLE {table_name};
+                    """))
+
+                    # The clustered primary key keeps each partition contiguous, so partition queries are range seeks
+                    connection.execute(text(dataset_table_ddl(table_name)))
+                    connection.execute(text(dataset_table_ddl(staging_table)))
+
+                # Added to tables created before the index existed, too
+                connection.execute(text(dataset_index_ddl(table_name, sqlite=is_sqlite(connection))))
+
+                connection.execute(
+                    text(f"DELETE FROM {staging_table} WHERE config_name = :config_name AND split_name = :split_name"),
+                    {'config_name': config_name, 'split_name': split_name}
+                )
                 transaction.commit()
             except Exception as e:
                 transaction.rollback()
-                print(f"Error dropping table: {e}")
-                return
+                print(f"Error preparing partition {config_name}/{split_name}: {e}")
+                mark_error(e)
+                return False
+        return True
 
-        # Create the table and insert the data
-        with engine.connect() as connection:
-            create_table_query = text(f"""
-                CREATE TABLE {table_name} (
-                    task_id NVARCHAR(50) PRIMARY KEY,
-                    Question NVARCHAR(MAX),
-                    Level INT,
-                    FinalAnswer NVARCHAR(MAX),
-                    file_name NVARCHAR(255),
-                    file_path NVARCHAR(MAX),
-                    Annotator_Metadata_Steps NVARCHAR(MAX),
-                    Annotator_Metadata_Number_of_steps NVARCHAR(MAX),
-                    Annotator_Metadata_How_long_did_this_take NVARCHAR(100),
-                    Annotator_Metadata_Tools NVARCHAR(MAX),
-                    Annotator_Metadata_Number_of_tools INT,
-                    user_result_status NVARCHAR(50) DEFAULT 'N/A',
-                    created_date DATETIME
-                );
-            """)
-            connection.execute(create_table_query)
+    except Exception as e:
+        print(f"Error preparing table {table_name}: {e}")
+        mark_error(e)
+        return False
+
+# Function to replace partitions of the dataset table with their staged rows
+@traced('sql.replace_dataset_partitions')
+def replace_dataset_partitions(table_name, partitions):
+    """
+    Replaces the rows of each (config_name, split_name) partition with the rows staged for it, and empties the
+    staging table, in one transaction: readers see either the old or the new partitions, never a partial one.
+    Returns True on success.
+    """
+    staging_table = dataset_staging_table(table_name)
+    annotate(table=table_name, partitions=len(partitions))
+    try:
+        engine = get_engine()
+
+        with engine.begin() as connection:
+            for config_name, split_name in partitions:
+                parameters = {'config_name': config_name, 'split_name': split_name}
+                connection.execute(
+                    text(f"DELETE FROM {table_name} WHERE config_name = :config_name AND split_name = :split_name"),
+                    parameters
+                )
+                connection.execute(text(f"""
+                    INSERT INTO {table_name} ({DATASET_COLUMNS})
+                    SELECT {DATASET_COLUMNS} FROM {staging_table}
+                    WHERE config_name = :config_name AND split_name = :split_name
+                """), parameters)
+                connection.execute(
+                    text(f"DELETE FROM {staging_table} WHERE config_name = :config_name AND split_name = :split_name"),
+                    parameters
+                )
+        return True
+
+    except Exception as e:
+        print(f"Error replacing the partitions of {table_name}: {e}")
+        mark_error(e)
+        return False
+
+# Statement creating the dataset table if it does not exist
+def dataset_table_ddl(table_name, sqlite=False):
+    columns = f"""(
+        config_name NVARCHAR(50) NOT NULL,
+        split_name NVARCHAR(20) NOT NULL,
+        task_id NVARCHAR(50) NOT NULL,
+        Question NVARCHAR(MAX),
+        Level INT,
+        FinalAnswer NVARCHAR(MAX),
+        file_name NVARCHAR(255),
+        file_path NVARCHAR(MAX),
+        Annotator_Metadata_Steps NVARCHAR(MAX),
+        Annotator_Metadata_Number_of_steps NVARCHAR(MAX),
+        Annotator_Metadata_How_long_did_this_take NVARCHAR(100),
+        Annotator_Metadata_Tools NVARCHAR(MAX),
+        Annotator_Metadata_Number_of_tools INT,
+        user_result_status NVARCHAR(50) DEFAULT 'N/A',
+        created_date DATETIME,
+        CONSTRAINT PK_{table_name} PRIMARY KEY CLUSTERED (config_name, split_name, task_id)
+    )"""
+    if sqlite:
+        # SQLite has no NVARCHAR(MAX), clustered keys or IF OBJECT_ID
+        return f"CREATE TABLE IF NOT EXISTS {table_name} " + columns.replace('(MAX)', '').replace(' CLUSTERED', '')
+    return f"IF OBJECT_ID('{table_name}', 'U') IS NULL CREATE TABLE {table_name} " + columns
+
+# Statement adding the task_id index of the dataset table if it is missing
+def dataset_index_ddl(table_name, sqlite=False):
+    """
+    task_id is the last column of the clustered key, so lookups by task_id alone (result cube updates, the
+    leaderboard's hardest questions) would scan the table without this index. It covers the columns they read.
+    """
+    if sqlite:
+        return f"CREATE INDEX IF NOT EXISTS IX_{table_name}_task ON {table_name} (task_id)"
+    return f"""
+        IF OBJECT_ID('{table_name}', 'U') IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table_name}_task' AND object_id = OBJECT_ID('{table_name}'))
+            CREATE INDEX IX_{table_name}_task ON {table_name} (task_id)
+            INCLUDE (Question, Level, file_name, Annotator_Metadata_Number_of_tools, Annotator_Metadata_Number_of_steps);
+    """
+
+# Function to append a batch of rows to the dataset table
+@traced('sql.append_dataframe_to_sql')
+def append_dataframe_to_sql(df, table_name):
+    """
+    Appends DataFrame rows to an existing table in Azure SQL Database. Returns True on success.
+    """
+    try:
+        engine = get_engine()
 
         # Insert DataFrame into SQL table
-        df.to_sql(table_name, engine, if_exists='append', index=False, dtype={
-            'task_id': NVARCHAR(length=50),
-            'Question': NVARCHAR(length='max'),
-            'Level': Integer,
-            'FinalAnswer': NVARCHAR(length='max'),
-            'file_name': NVARCHAR(length=255),
-            'file_path': NVARCHAR(length='max'),
-            'Annotator_Metadata_Steps': NVARCHAR(length='max'),
-            'Annotator_Metadata_Number_of_steps': NVARCHAR(length='max'),
-            'Annotator_Metadata_How_long_did_this_take': NVARCHAR(length=100),
-            'Annotator_Metadata_Tools': NVARCHAR(length='max'),
-            'Annotator_Metadata_Number_of_tools': Integer,
-            'user_result_status': NVARCHAR(length=50),
-            'created_date': DateTime
-        })
+        df.to_sql(table_name, engine, if_exists='append', index=False, dtype=GAIA_DATASET_DTYPES)
+        annotate(table=table_name, rows=len(df))
 
         print(f"Data successfully inserted into {table_name}.")
+        return True
     
     except Exception as e:
         print(f"Error inserting data into Azure SQL: {e}")
+        mark_error(e)
+        return False
 
 # Function to fetch the dataset (default, e.g., main table like GaiaDataset)
-def fetch_dataframe_from_sql(table_name='GaiaDataset'):
+@traced('sql.fetch_dataframe_from_sql')
+def fetch_dataframe_from_sql(table_name='GaiaDataset', config_name=None, split_name=None, columns=None):
     """
-    Fetches data from Azure SQL as a DataFrame.
+    Fetches data from Azure SQL as a DataFrame, limited to one config/split partition and to the given columns if set.
     """
+    import pandas as pd
+
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
+        select_list = ', '.join(f"[{column}]" for column in columns) if columns else '*'
         
-        query = f"SELECT * FROM {table_name}"
-        df = pd.read_sql(query, con=engine)
+        if config_name and split_name:
+            query = text(f"SELECT {select_list} FROM {table_name} WHERE config_name = :config_name AND split_name = :split_name")
+            df = pd.read_sql(query, con=engine, params={'config_name': config_name, 'split_name': split_name})
+        else:
+            query = f"SELECT {select_list} FROM {table_name}"
+            df = pd.read_sql(query, con=engine)
+        annotate(table=table_name, rows=len(df))
         return df
     
     except Exception as e:
         print(f"Error fetching data from Azure SQL: {e}")
+        mark_error(e)
         return None
 
+# Function to fetch a few columns of one question, e.g. text left out of the in-memory dataset
+@traced('sql.fetch_question_columns')
+def fetch_question_columns(config_name, split_name, task_id, columns, table_name='GaiaDataset'):
+    """
+    Returns {column: value} for one question of a partition, {} if it does not exist, or None on error.
+    """
+    try:
+        engine = get_engine()
+
+        select_list = ', '.join(f"[{column}]" for column in columns)
+        query = text(f"""
+            SELECT {select_list} FROM {table_name}
+            WHERE config_name = :config_name AND split_name = :split_name AND task_id = :task_id
+        """)
+        with engine.connect() as connection:
+            row = connection.execute(
+                query, {'config_name': config_name, 'split_name': split_name, 'task_id': task_id}
+            ).mappings().first()
+
+        return dict(row) if row else {}
+
+    except Exception as e:
+        print(f"Error fetching question {task_id} from Azure SQL: {e}")
+        mark_error(e)
+        return None
+
+# Function to tell a database outage apart from a statement that fails on its own
+def database_available():
+    """
+    Returns True if a trivial query succeeds.
+    """
+    try:
+        with get_engine().connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        print(f"Azure SQL is not available: {e}")
+        return False
+
+# Function to list the partitions stored in the dataset table
+@traced('sql.fetch_dataset_partitions')
+def fetch_dataset_partitions(table_name='GaiaDataset'):
+    """
+    Returns the (config_name, split_name) pairs present in the dataset table, or None on error.
+    """
+    try:
+        engine = get_engine()
+
+        query = text(f"SELECT DISTINCT config_name, split_name FROM {table_name} ORDER BY config_name, split_name")
+        with engine.connect() as connection:
+            result = connection.execute(query).fetchall()
+
+        return [tuple(row) for row in result]
+
+    except Exception as e:
+        print(f"Error fetching dataset partitions: {e}")
+        mark_error(e)
+        return None
+
+@traced('sql.fetch_user_results')
 def fetch_user_results(user_id):
     """
     Fetches the user-specific results from the Azure SQL Database.
     """
+    import pandas as pd
+
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
         
         query = text("""
             SELECT 
@@ -129,51 +360,370 @@ def fetch_user_results(user_id):
 
     except Exception as e:
         print(f"Error fetching user results: {e}")
+        mark_error(e)
         return None
 
+# Columns of a GaiaDataset row the cube dimensions are computed from, all covered by its task_id index
+CUBE_QUESTION_COLUMNS = "Level, file_name, Annotator_Metadata_Number_of_tools, Annotator_Metadata_Number_of_steps"
+
+# Dimensions of the result cube, computed from a GaiaDataset row aliased g
+RESULT_CUBE_DIMENSIONS = """
+    CROSS APPLY (VALUES
+        ('all', 'all'),
+        ('level', ISNULL(CAST(g.Level AS NVARCHAR(50)), 'N/A')),
+        ('file_type', CASE WHEN CHARINDEX('.', ISNULL(g.file_name, '')) = 0 THEN '(no file)'
+                           ELSE LOWER(RIGHT(g.file_name, CHARINDEX('.', REVERSE(g.file_name)))) END),
+        ('tools', ISNULL(CAST(g.Annotator_Metadata_Number_of_tools AS NVARCHAR(50)), 'N/A')),
+        ('steps', ISNULL(CAST(g.Annotator_Metadata_Number_of_steps AS NVARCHAR(50)), 'N/A'))
+    ) AS d(dimension, dimension_value)
+"""
+
 def update_user_result(user_id, task_id, status, chatgpt_response, table_name='user_results'):
     """
-    Updates user-specific result and ChatGPT response in the user_results table.
+    Updates user-specific result and ChatGPT response in the user_results table,
+    moving the question from its previous status to the new one in the user_result_cube table.
+    """
+    update_user_results([(user_id, task_id, status, chatgpt_response)], table_name)
+
+# Function to write several user results in one transaction
+@traced('sql.update_user_results')
+def update_user_results(results, table_name='user_results'):
+    """
+    Writes (user_id, task_id, status, chatgpt_response) tuples in a single transaction.
+    Returns True if all of them were committed, False otherwise.
     """
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
         with engine.connect() as connection:
             transaction = connection.begin()
             try:
-                update_query = text(f"""
-                    MERGE INTO {table_name} AS target
-                    USING (SELECT :user_id AS user_id, :task_id AS task_id, :status AS status, :chatgpt_response AS chatgpt_response) AS source
-                    ON target.user_id = source.user_id AND target.task_id = source.task_id
-                    WHEN MATCHED THEN
-                        UPDATE SET user_result_status = source.status, chatgpt_response = source.chatgpt_response
-                    WHEN NOT MATCHED THEN
-                        INSERT (user_id, task_id, user_result_status, chatgpt_response) 
-                        VALUES (source.user_id, source.task_id, source.status, source.chatgpt_response);
-                """)
-                connection.execute(update_query, {
-                    'user_id': user_id, 
-                    'task_id': task_id, 
-                    'status': status, 
-                    'chatgpt_response': chatgpt_response
-                })
+                for user_id, task_id, status, chatgpt_response in results:
+                    write_user_result(connection, user_id, task_id, status, chatgpt_response, table_name)
                 transaction.commit()
+                annotate(rows=len(results))
+                return True
             except Exception as e:
                 transaction.rollback()
                 print(f"Transaction error: {e}")
+                mark_error(e)
+                return False
 
     except Exception as e:
         print(f"Error updating user result: {e}")
+        mark_error(e)
+        return False
+
+# Function to upsert one user result on an open connection
+def write_user_result(connection, user_id, task_id, status, chatgpt_response, table_name='user_results'):
+    """
+    Merges one result into the user_results table and updates the result cube, without committing.
+    """
+    parameters = {'user_id': user_id, 'task_id': task_id, 'status': status, 'chatgpt_response': chatgpt_response}
+    if is_sqlite(connection):
+        previous_status = write_user_result_sqlite(connection, parameters, table_name)
+        if previous_status != status:
+            apply_result_cube_update(connection, user_id, task_id, previous_status, status)
+        return
+
+    update_query = text(f"""
+        MERGE INTO {table_name} AS target
+        USING (SELECT :user_id AS user_id, :task_id AS task_id, :status AS status, :chatgpt_response AS chatgpt_response) AS source
+        ON target.user_id = source.user_id AND target.task_id = source.task_id
+        WHEN MATCHED THEN
+            UPDATE SET user_result_status = source.status, chatgpt_response = source.chatgpt_response
+        WHEN NOT MATCHED THEN
+            INSERT (user_id, task_id, user_result_status, chatgpt_response) 
+            VALUES (source.user_id, source.task_id, source.status, source.chatgpt_response)
+        OUTPUT deleted.user_result_status;
+    """)
+    previous = connection.execute(update_query, parameters).fetchone()
+    previous_status = previous[0] if previous else None
+
+    # Keep the aggregate cube in step, in the same transaction
+    if previous_status != status:
+        apply_result_cube_update(connection, user_id, task_id, previous_status, status)
+
+# Function to update the result cube without putting the result write at risk
+def apply_result_cube_update(connection, user_id, task_id, previous_status, status):
+    """
+    Runs the cube update in a savepoint, so a failure (e.g. a database without the user_result_cube table)
+    undoes only the cube change and the result itself is still saved. Recalculate on the summary page
+    rebuilds the cube from user_results.
+    """
+    try:
+        with connection.begin_nested():
+            if is_sqlite(connection):
+                update_result_cube_sqlite(connection, user_id, task_id, previous_status, status)
+            else:
+                update_result_cube(connection, user_id, task_id, previous_status, status)
+    except Exception as e:
+        print(f"Error updating result cube for task {task_id}, result saved without it: {e}")
+
+# Function to move one question between status cells of the result cube
+def update_result_cube(connection, user_id, task_id, previous_status, status):
+    """
+    Decrements the previous status cells and increments the new status cells of every dimension of a question.
+    Runs on the caller's connection so it commits or rolls back with the user_results write.
+    """
+    question = f"(SELECT TOP 1 {CUBE_QUESTION_COLUMNS} FROM GaiaDataset WHERE task_id = :task_id) AS g {RESULT_CUBE_DIMENSIONS}"
+    parameters = {'user_id': user_id, 'task_id': task_id}
+
+    if previous_status is not None:
+        connection.execute(text(f"""
+            UPDATE c SET question_count = c.question_count - 1
+            FROM user_result_cube AS c
+            JOIN (SELECT d.dimension, d.dimension_value FROM {question}) AS q
+                ON c.dimension = q.dimension AND c.dimension_value = q.dimension_value
+            WHERE c.user_id = :user_id AND c.user_result_status = :previous_status;
+        """), {**parameters, 'previous_status': previous_status})
+
+    connection.execute(text(f"""
+        MERGE INTO user_result_cube WITH (HOLDLOCK) AS target
+        USING (SELECT d.dimension, d.dimension_value FROM {question}) AS source
+        ON target.user_id = :user_id AND target.user_result_status = :status
+            AND target.dimension = source.dimension AND target.dimension_value = source.dimension_value
+        WHEN MATCHED THEN
+            UPDATE SET question_count = target.question_count + 1
+        WHEN NOT MATCHED THEN
+            INSERT (user_id, dimension, dimension_value, user_result_status, question_count)
+            VALUES (:user_id, source.dimension, source.dimension_value, :status, 1);
+    """), {**parameters, 'status': status})
+
+# SQLite has no MERGE ... OUTPUT: read the previous status, then upsert on the (user_id, task_id) unique index
+def write_user_result_sqlite(connection, parameters, table_name='user_results'):
+    previous = connection.execute(
+        text(f"SELECT user_result_status FROM {table_name} WHERE user_id = :user_id AND task_id = :task_id"), parameters
+    ).fetchone()
+    connection.execute(text(f"""
+        INSERT INTO {table_name} (user_id, task_id, user_result_status, chatgpt_response)
+        VALUES (:user_id, :task_id, :status, :chatgpt_response)
+        ON CONFLICT (user_id, task_id) DO UPDATE
+        SET user_result_status = excluded.user_result_status, chatgpt_response = excluded.chatgpt_response;
+    """), parameters)
+    return previous[0] if previous else None
+
+# Cube cells of a question, matching RESULT_CUBE_DIMENSIONS
+def result_cube_cells(level, file_name, number_of_tools, number_of_steps):
+    file_name = file_name or ''
+    return [
+        ('all', 'all'),
+        ('level', 'N/A' if level is None else str(level)),
+        ('file_type', '(no file)' if '.' not in file_name else '.' + file_name.rsplit('.', 1)[1].lower()),
+        ('tools', 'N/A' if number_of_tools is None else str(number_of_tools)),
+        ('steps', 'N/A' if number_of_steps is None else str(number_of_steps)),
+    ]
+
+# SQLite has no CROSS APPLY or MERGE: compute the question's cells here and update them one by one
+def update_result_cube_sqlite(connection, user_id, task_id, previous_status, status):
+    question = connection.execute(text("""
+        SELECT Level, file_name, Annotator_Metadata_Number_of_tools, Annotator_Metadata_Number_of_steps
+        FROM GaiaDataset WHERE task_id = :task_id LIMIT 1
+    """), {'task_id': task_id}).fetchone()
+    if question is None:
+        return
+
+    for dimension, dimension_value in result_cube_cells(*question):
+        cell = {'user_id': user_id, 'dimension': dimension, 'dimension_value': dimension_value}
+        if previous_status is not None:
+            connection.execute(text("""
+                UPDATE user_result_cube SET question_count = question_count - 1
+                WHERE user_id = :user_id AND dimension = :dimension AND dimension_value = :dimension_value
+                    AND user_result_status = :previous_status;
+            """), {**cell, 'previous_status': previous_status})
+        connection.execute(text("""
+            INSERT INTO user_result_cube (user_id, dimension, dimension_value, user_result_status, question_count)
+            VALUES (:user_id, :dimension, :dimension_value, :status, 1)
+            ON CONFLICT (user_id, dimension, dimension_value, user_result_status) DO UPDATE
+            SET question_count = question_count + 1;
+        """), {**cell, 'status': status})
+
+# Function to rebuild the result cube of a user from the user_results table
+@traced('sql.rebuild_result_cube')
+def rebuild_result_cube(user_id):
+    """
+    Recomputes every cube cell of a user in one set-based query (e.g. for results written before the cube existed).
+    Returns True on success.
+    """
+    try:
+        engine = get_engine()
+
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                connection.execute(text("DELETE FROM user_result_cube WHERE user_id = :user_id"), {'user_id': user_id})
+                connection.execute(text(f"""
+                    INSERT INTO user_result_cube (user_id, dimension, dimension_value, user_result_status, question_count)
+                    SELECT r.user_id, d.dimension, d.dimension_value, r.user_result_status, COUNT(*)
+                    FROM user_results AS r
+                    CROSS APPLY (SELECT TOP 1 {CUBE_QUESTION_COLUMNS} FROM GaiaDataset WHERE task_id = r.task_id) AS g
+                    {RESULT_CUBE_DIMENSIONS}
+                    WHERE r.user_id = :user_id
+                    GROUP BY r.user_id, d.dimension, d.dimension_value, r.user_result_status;
+                """), {'user_id': user_id})
+                transaction.commit()
+            except Exception as e:
+                transaction.rollback()
+                print(f"Transaction error: {e}")
+                mark_error(e)
+                return False
+        return True
+
+    except Exception as e:
+        print(f"Error rebuilding result cube: {e}")
+        mark_error(e)
+        return False
+
+# Function to count the questions and a user's results over the same scope as the result cube
+@traced('sql.fetch_result_totals')
+def fetch_result_totals(user_id):
+    """
+    Returns {'total_questions', 'user_results'}: the distinct questions of every partition (cube cells are keyed
+    by task_id, whatever the partition) and the number of the user's results for those questions, or None on error.
+    user_results equals the cube's 'all' total while the cube is in step with user_results.
+    """
+    try:
+        engine = get_engine()
+
+        query = text("""
+            SELECT
+                (SELECT COUNT(DISTINCT task_id) FROM GaiaDataset) AS total_questions,
+                (SELECT COUNT(*) FROM user_results AS r
+                 WHERE r.user_id = :user_id AND EXISTS (SELECT 1 FROM GaiaDataset AS g WHERE g.task_id = r.task_id)) AS user_results
+        """)
+        with engine.connect() as connection:
+            row = connection.execute(query, {'user_id': user_id}).mappings().first()
+
+        return dict(row)
+
+    except Exception as e:
+        print(f"Error fetching result totals: {e}")
+        mark_error(e)
+        return None
+
+# Function to fetch the result cube of a user
+@traced('sql.fetch_result_cube')
+def fetch_result_cube(user_id):
+    """
+    Fetches the non-empty cube cells of a user as a DataFrame
+    (dimension, dimension_value, user_result_status, question_count), or None on error.
+    """
+    import pandas as pd
+
+    try:
+        engine = get_engine()
+
+        query = text("""
+            SELECT dimension, dimension_value, user_result_status, question_count
+            FROM user_result_cube
+            WHERE user_id = :user_id AND question_count > 0
+        """)
+        with engine.connect() as connection:
+            result = connection.execute(query, {"user_id": user_id}).fetchall()
+
+        return pd.DataFrame(result, columns=['dimension', 'dimension_value', 'user_result_status', 'question_count'])
+
+    except Exception as e:
+        print(f"Error fetching result cube: {e}")
+        mark_error(e)
+        return None
+
+# Counts a user_results row as correct, with or without instructions
+CORRECT_RESULT_SQL = "CASE WHEN user_result_status LIKE 'Correct%' THEN 1 ELSE 0 END"
+
+# Function to compute accuracy per user across all users
+@traced('sql.fetch_accuracy_by_user')
+def fetch_accuracy_by_user(limit=100, min_answered=1):
+    """
+    Returns the top users by accuracy (username, answered, correct, accuracy) among those with at least
+    min_answered results, as a DataFrame, or None on error.
+    """
+    import pandas as pd
+
+    try:
+        engine = get_engine()
+
+        # Aggregate user_results first, then join the (much smaller) per-user result to users
+        query = text(f"""
+            SELECT TOP (:limit) u.username, r.answered, r.correct, CAST(r.correct AS FLOAT) / r.answered AS accuracy
+            FROM (
+                SELECT user_id, COUNT(*) AS answered, SUM({CORRECT_RESULT_SQL}) AS correct
+                FROM user_results
+                GROUP BY user_id
+                HAVING COUNT(*) >= :min_answered
+            ) AS r
+            JOIN users AS u ON u.user_id = r.user_id
+            ORDER BY accuracy DESC, r.answered DESC
+        """)
+        return pd.read_sql(query, con=engine, params={'limit': limit, 'min_answered': min_answered})
+
+    except Exception as e:
+        print(f"Error fetching accuracy by user: {e}")
+        mark_error(e)
+        return None
+
+# Function to find the questions users get wrong most often
+@traced('sql.fetch_accuracy_by_task')
+def fetch_accuracy_by_task(limit=50, min_attempts=1):
+    """
+    Returns the hardest questions (task_id, Question, Level, attempts, correct, accuracy) as a DataFrame, or None on error.
+    """
+    import pandas as pd
+
+    try:
+        engine = get_engine()
+
+        query = text(f"""
+            SELECT TOP (:limit) r.task_id, g.Question, g.Level, r.attempts, r.correct,
+                   CAST(r.correct AS FLOAT) / r.attempts AS accuracy
+            FROM (
+                SELECT task_id, COUNT(*) AS attempts, SUM({CORRECT_RESULT_SQL}) AS correct
+                FROM user_results
+                GROUP BY task_id
+                HAVING COUNT(*) >= :min_attempts
+            ) AS r
+            OUTER APPLY (SELECT TOP 1 Question, Level FROM GaiaDataset WHERE task_id = r.task_id) AS g
+            ORDER BY accuracy ASC, r.attempts DESC
+        """)
+        return pd.read_sql(query, con=engine, params={'limit': limit, 'min_attempts': min_attempts})
+
+    except Exception as e:
+        print(f"Error fetching accuracy by task: {e}")
+        mark_error(e)
+        return None
+
+# Function to count results per status across all users
+@traced('sql.fetch_global_result_counts')
+def fetch_global_result_counts():
+    """
+    Returns the number of results and of distinct users per result status as a DataFrame, or None on error.
+    """
+    import pandas as pd
+
+    try:
+        engine = get_engine()
+
+        query = text("""
+            SELECT user_result_status, COUNT(*) AS results, COUNT(DISTINCT user_id) AS users
+            FROM user_results
+            GROUP BY user_result_status
+            ORDER BY results DESC
+        """)
+        return pd.read_sql(query, con=engine)
+
+    except Exception as e:
+        print(f"Error fetching global result counts: {e}")
+        mark_error(e)
+        return None
 
 # Function to fetch user information based on username
+@traced('sql.fetch_user_from_sql')
 def fetch_user_from_sql(username):
     """
     Fetch user information based on username.
     """
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
         
         query = text("SELECT user_id, username, password, role FROM users WHERE username = :username")
         with engine.connect() as connection:
@@ -185,6 +735,7 @@ def fetch_user_from_sql(username):
     
     except Exception as e:
         print(f"Error fetching user: {e}")
+        mark_error(e)
         return None
 
 # Function to insert a new user with a hashed password
@@ -196,8 +747,7 @@ def insert_user_to_sql(username, password, role):
         # Hash the user's password
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
         insert_user_query = text("""
             INSERT INTO users (user_id, username, password, role)
@@ -227,8 +777,7 @@ def fetch_all_users():
     Fetch all users from the database.
     """
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
         query = text("SELECT user_id, username, role FROM users")
         with engine.connect() as connection:
@@ -246,8 +795,7 @@ def remove_user(username):
     Remove a user from the database.
     """
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
         query = text("DELETE FROM users WHERE username = :username")
         with engine.connect() as connection:
@@ -270,8 +818,7 @@ def promote_to_admin(username):
     Promote a user to admin role.
     """
     try:
-        connection_string = get_sqlalchemy_connection_string()
-        engine = create_engine(connection_string)
+        engine = get_engine()
 
         query = text("UPDATE users SET role = 'admin' WHERE username = :username")
         with engine.connect() as connection:
@@ -286,3 +833,89 @@ def promote_to_admin(username):
                 return False
     except Exception as e:
         print(f"Error: {e}")
+
+# Running ingest jobs not updated for this long are treated as abandoned
+INGEST_JOB_STALE_MINUTES = 30
+
+# Function to register a new ingest job unless one is already running
+def create_ingest_job(started_by):
+    """
+    Inserts a 'running' ingest job and returns its job_id, or None if another job is still running.
+    Raises on database errors (e.g. no ingest_jobs table), so they are not mistaken for a running job.
+    """
+    engine = get_engine()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # Abandoned jobs (e.g. the server restarted mid-run) must not block new runs forever
+            connection.execute(text(f"""
+                UPDATE ingest_jobs
+                SET status = 'failed', message = 'Abandoned: no progress reported', finished_at = GETDATE()
+                WHERE status = 'running' AND updated_at < DATEADD(minute, -{INGEST_JOB_STALE_MINUTES}, GETDATE());
+            """))
+
+            # UPDLOCK/HOLDLOCK serialize concurrent starts so only one admin gets a job
+            result = connection.execute(text("""
+                INSERT INTO ingest_jobs (started_by, status, stage, started_at, updated_at)
+                OUTPUT INSERTED.job_id
+                SELECT :started_by, 'running', 'queued', GETDATE(), GETDATE()
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ingest_jobs WITH (UPDLOCK, HOLDLOCK) WHERE status = 'running'
+                );
+            """), {'started_by': started_by}).fetchone()
+            transaction.commit()
+            return result[0] if result else None
+        except Exception as e:
+            transaction.rollback()
+            print(f"Error creating ingest job: {e}")
+            raise
+
+# Function to record progress of an ingest job
+def update_ingest_job(job_id, **fields):
+    """
+    Updates progress columns (stage, status, counts, throughput, message) of an ingest job.
+    """
+    allowed_columns = ['status', 'stage', 'rows_loaded', 'rows_written', 'files_uploaded',
+                       'files_skipped', 'bytes_uploaded', 'bytes_per_second', 'message']
+    updates = {column: value for column, value in fields.items() if column in allowed_columns}
+
+    assignments = [f"{column} = :{column}" for column in updates] + ["updated_at = GETDATE()"]
+    if updates.get('status') in ('succeeded', 'failed'):
+        assignments.append("finished_at = GETDATE()")
+
+    try:
+        engine = get_engine()
+
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                connection.execute(
+                    text(f"UPDATE ingest_jobs SET {', '.join(assignments)} WHERE job_id = :job_id"),
+                    {**updates, 'job_id': job_id}
+                )
+                transaction.commit()
+            except Exception as e:
+                transaction.rollback()
+                print(f"Transaction error: {e}")
+
+    except Exception as e:
+        print(f"Error updating ingest job: {e}")
+
+# Function to fetch the most recent ingest job
+def fetch_latest_ingest_job():
+    """
+    Fetch the most recent ingest job as a dict, or None if no job has run yet.
+    """
+    try:
+        engine = get_engine()
+
+        query = text("SELECT TOP 1 * FROM ingest_jobs ORDER BY job_id DESC")
+        with engine.connect() as connection:
+            result = connection.execute(query).fetchone()
+
+        return dict(result._mapping) if result else None
+
+    except Exception as e:
+        print(f"Error fetching ingest job: {e}")
+        return None
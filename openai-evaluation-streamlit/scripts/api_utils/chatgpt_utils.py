@@ -1,11 +1,13 @@
 import openai
 import streamlit as st
+from .telemetry import traced, annotate, mark_error
 
 # Initialize OpenAI API
 def init_openai(api_key):
     openai.api_key = api_key
 
 # Function to send a question and preprocessed file data to ChatGPT
+@traced('openai.chat_completion', model='gpt-3.5-turbo')
 def get_chatgpt_response(question, instructions=None, preprocessed_data=None):
     # Construct the system message for the Chat API
     system_message = {
@@ -53,6 +55,8 @@ Answer:
             presence_penalty=0.5  # Encourage new concepts when appropriate
         )
         
+        annotate_usage(response)
+
         # Extract and process the answer
         answer = response['choices'][0]['message']['content'].strip()
         
@@ -68,9 +72,11 @@ Answer:
         return answer.strip()
     except Exception as e:
         st.error(f"Error calling ChatGPT API: {e}")
+        mark_error(e)
         return None
 
 # Compare ChatGPT's response with the expected answer using OpenAI API
+@traced('openai.compare_answers', model='gpt-3.5-turbo')
 def compare_and_update_status(row, chatgpt_response, instructions):
     original_answer = str(row['FinalAnswer']).strip()
     ai_engine_answer = chatgpt_response.strip()
@@ -103,6 +109,7 @@ Does the AI's response match the key information in the original answer? Respond
             temperature=0  # Zero temperature for deterministic results
         )
         
+        annotate_usage(response)
         comparison_result = response['choices'][0]['message']['content'].strip().lower()
 
         # Normalize and interpret the result
@@ -116,4 +123,11 @@ Does the AI's response match the key information in the original answer? Respond
 
     except Exception as e:
         st.error(f"Error calling OpenAI API for comparison: {e}")
-        return 'Error'
\ No newline at end of file
+        mark_error(e)
+        return 'Error'
+
+# Add the token counts of a chat completion to the active span
+def annotate_usage(response):
+    usage = response.get('usage') or {}
+    annotate(prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+             total_tokens=usage.get('total_tokens'))
@@ -0,0 +1,239 @@
+#telemetry
+import bisect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+
+# Set TELEMETRY_JSON_LOGS=1 to log every finished span as one JSON line (to stderr, or to TELEMETRY_LOG_PATH)
+JSON_LOGS_ENABLED = os.getenv('TELEMETRY_JSON_LOGS', '0').lower() in ('1', 'true', 'yes')
+TELEMETRY_LOG_PATH = os.getenv('TELEMETRY_LOG_PATH') or None
+
+# Set METRICS_PORT to serve the span metrics in the Prometheus text format at /metrics
+METRICS_PORT = os.getenv('METRICS_PORT') or None
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Upper bounds (seconds) of the span duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Numeric span attributes also summed per span name, e.g. bytes moved by S3 transfers
+COUNTED_ATTRIBUTES = ('bytes', 'rows', 'total_tokens')
+
+class _Registry:
+    """Process-wide telemetry state: the active span, duration histograms, attribute counters and the metrics server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current_span = ContextVar('current_span', default=None)
+        self.histograms = {}  # (span name, status) -> {'buckets': [...], 'count': n, 'sum': seconds}
+        self.counters = {}  # (span name, attribute) -> total
+        self.server_started = False
+        self.server = None
+
+_registry = _Registry()
+
+class Span:
+    """One timed operation. Attributes set while it runs are logged with it."""
+
+    __slots__ = ('name', 'attributes', 'status', 'trace_id', 'span_id', 'parent_id', 'duration')
+
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.status = 'ok'
+        # Random ids in the W3C trace context sizes (128-bit trace, 64-bit span); they need not be secret
+        self.trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = 'error'
+        self.attributes['error'] = str(error)
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span named name, nested under the active span of this thread or task."""
+    current = Span(name, attributes, _registry.current_span.get())
+    token = _registry.current_span.set(current)
+    start_time = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.fail(e)
+        raise
+    except BaseException:
+        # Streamlit's rerun and stop signals end a script run early without it having failed
+        if current.status == 'ok':
+            current.status = 'interrupted'
+        raise
+    finally:
+        current.duration = time.perf_counter() - start_time
+        _registry.current_span.reset(token)
+        record(current)
+
+def traced(name, **attributes):
+    """Decorator running every call of a function in a span."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(**attributes):
+    """Add attributes to the active span, if there is one."""
+    current = _registry.current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def mark_error(error):
+    """Mark the active span as failed, for functions that handle their errors instead of raising them."""
+    current = _registry.current_span.get()
+    if current is not None:
+        current.fail(error)
+
+def record_span(name, seconds, status='ok', **attributes):
+    """Record an operation timed elsewhere (e.g. by SQLAlchemy events) as a child of the active span."""
+    finished = Span(name, attributes, _registry.current_span.get())
+    finished.status = status
+    finished.duration = seconds
+    record(finished)
+
+def record(finished):
+    """Add a finished span to the metrics and, if enabled, write its JSON log line."""
+    with _registry.lock:
+        histogram = _registry.histograms.get((finished.name, finished.status))
+        if histogram is None:
+            histogram = {'buckets': [0] * (len(DURATION_BUCKETS) + 1), 'count': 0, 'sum': 0.0}
+            _registry.histograms[(finished.name, finished.status)] = histogram
+        histogram['buckets'][bisect.bisect_left(DURATION_BUCKETS, finished.duration)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += finished.duration
+
+        for attribute in COUNTED_ATTRIBUTES:
+            value = finished.attributes.get(attribute)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+                key = (finished.name, attribute)
+                _registry.counters[key] = _registry.counters.get(key, 0) + value
+
+    if JSON_LOGS_ENABLED:
+        get_span_logger().info(json.dumps({
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'span': finished.name,
+            'duration_ms': round(finished.duration * 1000, 3),
+            'status': finished.status,
+            'trace_id': finished.trace_id,
+            'span_id': finished.span_id,
+            'parent_id': finished.parent_id,
+            'thread': threading.current_thread().name,
+            'attributes': finished.attributes,
+        }, default=str))
+
+def get_span_logger():
+    """Return the logger the JSON span lines are written to, attaching its handler on first use."""
+    logger = logging.getLogger('gaia.telemetry')
+    with _registry.lock:
+        if not logger.handlers:
+            handler = logging.FileHandler(TELEMETRY_LOG_PATH) if TELEMETRY_LOG_PATH else logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False  # One line per span, not another copy through the root logger
+    return logger
+
+def metrics_snapshot():
+    """Return {span name: {'count', 'errors', 'seconds', plus counted attributes}} aggregated over all statuses."""
+    summary = {}
+    with _registry.lock:
+        for (name, status), histogram in _registry.histograms.items():
+            entry = summary.setdefault(name, {'count': 0, 'errors': 0, 'seconds': 0.0})
+            entry['count'] += histogram['count']
+            entry['seconds'] += histogram['sum']
+            if status == 'error':
+                entry['errors'] += histogram['count']
+        for (name, attribute), total in _registry.counters.items():
+            summary.setdefault(name, {'count': 0, 'errors': 0, 'seconds': 0.0})[attribute] = total
+    return summary
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus():
+    """Return the span metrics in the Prometheus text exposition format."""
+    with _registry.lock:
+        histograms = {key: {**histogram, 'buckets': list(histogram['buckets'])} for key, histogram in _registry.histograms.items()}
+        counters = dict(_registry.counters)
+
+    lines = [
+        '# HELP gaia_span_duration_seconds Duration of traced operations (SQL, S3, OpenAI, file extraction, page runs).',
+        '# TYPE gaia_span_duration_seconds histogram',
+    ]
+    for (name, status), histogram in sorted(histograms.items()):
+        labels = f'span="{_label(name)}",status="{_label(status)}"'
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+            cumulative += count
+            lines.append(f'gaia_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'gaia_span_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+        lines.append(f'gaia_span_duration_seconds_sum{{{labels}}} {histogram["sum"]}')
+        lines.append(f'gaia_span_duration_seconds_count{{{labels}}} {histogram["count"]}')
+
+    lines.append('# HELP gaia_span_attribute_total Sum of counted span attributes (bytes, rows, total_tokens).')
+    lines.append('# TYPE gaia_span_attribute_total counter')
+    for (name, attribute), total in sorted(counters.items()):
+        lines.append(f'gaia_span_attribute_total{{span="{_label(name)}",attribute="{_label(attribute)}"}} {total}')
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port=None, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread, once per process. Off unless port (or METRICS_PORT) is set.
+
+    Returns the port the server listens on, or None if it is off or could not bind.
+    """
+    port = port if port is not None else METRICS_PORT
+    if port is None:
+        return None
+
+    with _registry.lock:
+        if _registry.server_started:
+            return _registry.server.server_address[1] if _registry.server is not None else None
+        _registry.server_started = True
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would otherwise flood the app's output
+
+    try:
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    except (OSError, ValueError) as e:
+        print(f"Could not start the metrics server on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    _registry.server = server
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server.server_address[1]
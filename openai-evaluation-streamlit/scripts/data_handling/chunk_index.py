@@ -0,0 +1,125 @@
+#chunk_index
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# Chunks longer than this are split before indexing so one chunk cannot take the whole budget
+CHUNK_MAX_CHARS = 1500
+
+# Number of chunk indexes kept in memory, least recently used evicted first
+INDEX_CACHE_SIZE = 32
+
+# BM25 tuning constants
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def tokenize(text):
+    """Lowercase text and split it into alphanumeric tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def split_long_chunks(chunks, max_chars=CHUNK_MAX_CHARS):
+    """Split chunks longer than max_chars on line boundaries, falling back to hard cuts."""
+    result = []
+    for chunk in chunks:
+        if len(chunk) <= max_chars:
+            result.append(chunk)
+            continue
+
+        piece = ''
+        for line in chunk.split('\n'):
+            while len(line) > max_chars:
+                if piece:
+                    result.append(piece)
+                    piece = ''
+                result.append(line[:max_chars])
+                line = line[max_chars:]
+            if piece and len(piece) + len(line) + 1 > max_chars:
+                result.append(piece)
+                piece = ''
+            piece = f"{piece}\n{line}" if piece else line
+        if piece:
+            result.append(piece)
+    return result
+
+def split_paragraphs(text):
+    """Split text into paragraphs separated by blank lines."""
+    return [paragraph for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+
+class ChunkIndex:
+    """BM25 index over the chunks of a single attachment."""
+
+    def __init__(self, chunks):
+        self.chunks = split_long_chunks(chunks)
+        self.term_counts = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+
+        total = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, question):
+        """Return the BM25 score of every chunk for the question."""
+        terms = [term for term in set(tokenize(question)) if term in self.idf]
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+            for term in terms:
+                frequency = counts.get(term, 0)
+                if frequency:
+                    score += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, question, budget, separator='\n'):
+        """Return the highest scoring chunks that fit in budget characters, in document order."""
+        scores = self.scores(question)
+        # Ties (including unmatched chunks) keep their document order
+        ranked = sorted(range(len(self.chunks)), key=lambda position: (-scores[position], position))
+
+        selected = []
+        used = 0
+        for position in ranked:
+            size = len(self.chunks[position]) + len(separator)
+            if used + size > budget:
+                continue
+            selected.append(position)
+            used += size
+
+        return separator.join(self.chunks[position] for position in sorted(selected))
+
+def get_chunk_index(chunks):
+    """Return the cached index for these chunks, building it on first use."""
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        digest.update(chunk.encode('utf-8', errors='replace'))
+        digest.update(b'\0')
+    key = digest.hexdigest()
+
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    index = ChunkIndex(chunks)
+
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -2,18 +2,74 @@
 import os
 import subprocess
 
-# Clone the Git repository containing the dataset files
-def clone_repository(repo_url, clone_dir):
-    if not os.path.exists(clone_dir):
-        # Clone the repository using git
-        try:
-            # Install git-lfs if not already installed
-            subprocess.run(["git", "lfs", "install"], check=True)
-            
+# 'sparse' clones shallowly without LFS content and pulls attachments on demand; 'full' clones everything
+CLONE_MODE = os.getenv('GAIA_CLONE_MODE', 'sparse')
+
+# Folders checked out in sparse mode (space separated)
+SPARSE_PATHS = os.getenv('GAIA_SPARSE_PATHS', '2023').split()
+
+# Leave LFS pointer files in place instead of downloading every large file
+SKIP_SMUDGE_ENV = dict(os.environ, GIT_LFS_SKIP_SMUDGE='1')
+
+# Clone the Git repository containing the dataset files; raises RuntimeError if git fails
+def clone_repository(repo_url, clone_dir, mode=None):
+    mode = mode or CLONE_MODE
+
+    if os.path.exists(os.path.join(clone_dir, '.git')):
+        update_repository(clone_dir, mode)
+        return
+
+    if os.path.exists(clone_dir):
+        print(f"Repository already cloned in {clone_dir}")
+        return
+
+    # Clone the repository using git
+    try:
+        # Install git-lfs if not already installed
+        subprocess.run(["git", "lfs", "install"], check=True)
+
+        if mode == 'sparse':
+            # Shallow, blobless clone with only the attachment folders checked out, as LFS pointers
+            subprocess.run(["git", "clone", "--depth", "1", "--filter=blob:none", "--sparse", repo_url, clone_dir],
+                           check=True, env=SKIP_SMUDGE_ENV)
+            subprocess.run(["git", "-C", clone_dir, "sparse-checkout", "set", *SPARSE_PATHS],
+                           check=True, env=SKIP_SMUDGE_ENV)
+        else:
             # Clone the repository
             subprocess.run(["git", "clone", repo_url, clone_dir], check=True)
-            print(f"Repository successfully cloned into {clone_dir}")
-        except subprocess.CalledProcessError as e:
-            print(f"Error cloning repository: {e}")
-    else:
-        print(f"Repository already cloned in {clone_dir}")
+        print(f"Repository successfully cloned into {clone_dir} ({mode} mode)")
+    except subprocess.CalledProcessError as e:
+        print(f"Error cloning repository: {e}")
+        # Without the clone every attachment would count as missing and the ingest would store rows without them
+        raise RuntimeError(f"could not clone {repo_url} into {clone_dir}: {e}") from e
+
+# Bring an existing clone up to date instead of skipping it; raises RuntimeError if git fails
+def update_repository(clone_dir, mode=None):
+    mode = mode or CLONE_MODE
+    try:
+        if mode == 'sparse':
+            subprocess.run(["git", "-C", clone_dir, "fetch", "--depth", "1", "origin"], check=True, env=SKIP_SMUDGE_ENV)
+            # Only files that changed upstream are rewritten; already pulled attachments stay in place
+            subprocess.run(["git", "-C", clone_dir, "reset", "--hard", "FETCH_HEAD"], check=True, env=SKIP_SMUDGE_ENV)
+        else:
+            subprocess.run(["git", "-C", clone_dir, "pull", "--ff-only"], check=True)
+        print(f"Repository in {clone_dir} updated")
+    except subprocess.CalledProcessError as e:
+        print(f"Error updating repository: {e}")
+        raise RuntimeError(f"could not update the repository in {clone_dir}: {e}") from e
+
+# Download the LFS content of selected files in a sparse clone
+def fetch_lfs_files(clone_dir, file_paths):
+    """Replace the LFS pointers of the given files (paths inside clone_dir) with their content.
+
+    Raises RuntimeError if the pull fails: the files would still be pointers, which must not be uploaded.
+    """
+    if CLONE_MODE != 'sparse' or not file_paths:
+        return
+
+    relative_paths = [os.path.relpath(path, clone_dir) for path in file_paths]
+    try:
+        subprocess.run(["git", "-C", clone_dir, "lfs", "pull", f"--include={','.join(relative_paths)}"], check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error pulling LFS files: {e}")
+        raise RuntimeError(f"could not pull the LFS content of {len(relative_paths)} files: {e}") from e
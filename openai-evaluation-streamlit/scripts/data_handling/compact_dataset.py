@@ -0,0 +1,44 @@
+#compact_dataset
+import os
+import pandas as pd
+
+# Long annotator text left out of the in-memory dataset and loaded for the selected question only
+HEAVY_TEXT_COLUMNS = ['Annotator_Metadata_Steps', 'Annotator_Metadata_Tools']
+
+# Columns with a handful of distinct values, stored once per value as categoricals
+CATEGORY_COLUMNS = ['config_name', 'split_name', 'Level', 'user_result_status', 'file_extension']
+
+# Count columns stored as small nullable integers instead of Python objects
+COUNT_COLUMNS = ['Annotator_Metadata_Number_of_steps', 'Annotator_Metadata_Number_of_tools']
+
+def compact_dataframe(df):
+    """Return the shared, read-only form of a dataset partition.
+
+    Heavy text columns are dropped, low-cardinality columns become categoricals (with a file_extension column
+    derived from file_name), counts become Int16, and rows are indexed by their integer position (a RangeIndex,
+    which costs no memory per row) so every session can hold the same frame without copying it.
+    """
+    df = df.drop(columns=[column for column in HEAVY_TEXT_COLUMNS if column in df.columns])
+    df = df.reset_index(drop=True)
+
+    if 'file_name' in df.columns:
+        file_names = df['file_name'].fillna('')
+        df['file_extension'] = file_names.map(lambda file_name: os.path.splitext(file_name)[1].lower())
+
+    for column in COUNT_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('Int16')
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+def memory_report(df):
+    """Return {'rows', 'bytes', 'columns': {column: bytes}} with the deep memory usage of a DataFrame."""
+    usage = df.memory_usage(deep=True)
+    return {
+        'rows': len(df),
+        'bytes': int(usage.sum()),
+        'columns': {str(column): int(size) for column, size in usage.items()},
+    }
@@ -0,0 +1,190 @@
+#dataset_snapshot
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scripts.data_handling.compact_dataset import compact_dataframe, HEAVY_TEXT_COLUMNS
+
+# Folder holding the versioned Parquet snapshots written by the ingest
+SNAPSHOT_DIR = os.path.join('.cache', 'snapshots')
+
+# 'sql' reads Azure SQL and falls back to the snapshot; 'snapshot' reads the local snapshot first
+DATASET_SOURCE = os.getenv('GAIA_DATASET_SOURCE', 'sql')
+
+SNAPSHOT_PREFIX = 'gaia_'
+
+# Partition (config, split) the app shows until the user picks another one
+DEFAULT_PARTITION = (os.getenv('GAIA_CONFIG_NAME', '2023_all'), os.getenv('GAIA_SPLIT_NAME', 'validation'))
+
+# Number of questions whose heavy text columns are kept in memory after being loaded on demand
+QUESTION_TEXT_CACHE_SIZE = 256
+
+# Loaded partitions shared by every session in the Streamlit server process
+_dataframe_cache = {}
+_dataframe_cache_lock = threading.Lock()
+_question_text_cache = OrderedDict()
+
+# Folder holding the snapshots of one partition
+def partition_snapshot_dir(snapshot_dir, config_name, split_name):
+    """Return the snapshot folder of a config/split partition, e.g. .cache/snapshots/2023_all/validation."""
+    return os.path.join(snapshot_dir, config_name, split_name)
+
+# Write a versioned Parquet snapshot of one ingested partition
+def write_snapshot(df, snapshot_dir=SNAPSHOT_DIR):
+    """Write the DataFrame to a timestamped Parquet file in snapshot_dir and return its path."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d%H%M%S')
+    snapshot_path = os.path.join(snapshot_dir, f"{SNAPSHOT_PREFIX}{version}.parquet")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Write next to the target and rename so readers never open a partial file
+    temp_path = snapshot_path + '.part'
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, snapshot_path)
+
+    print(f"Dataset snapshot written to {snapshot_path}")
+    return snapshot_path
+
+# Find the newest snapshot
+def latest_snapshot_path(snapshot_dir=SNAPSHOT_DIR):
+    """Return the path of the most recent snapshot, or None if there is none."""
+    if not os.path.isdir(snapshot_dir):
+        return None
+    snapshots = sorted(name for name in os.listdir(snapshot_dir)
+                       if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.parquet'))
+    return os.path.join(snapshot_dir, snapshots[-1]) if snapshots else None
+
+# Load the newest snapshot of a partition through a memory map
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR, partition=DEFAULT_PARTITION, exclude_columns=(), filters=None):
+    """Load the latest snapshot of a partition as a DataFrame, or return None if there is none.
+
+    exclude_columns are not read at all; filters are pyarrow row filters such as [('task_id', '=', task_id)].
+    """
+    snapshot_path = latest_snapshot_path(partition_snapshot_dir(snapshot_dir, *partition))
+    if snapshot_path is None:
+        return None
+
+    try:
+        columns = None
+        if exclude_columns:
+            columns = [name for name in pq.read_schema(snapshot_path).names if name not in exclude_columns]
+        # Memory-mapped read: column buffers come straight from the page cache
+        table = pq.read_table(snapshot_path, columns=columns, filters=filters, memory_map=True)
+        return table.to_pandas()
+    except Exception as e:
+        print(f"Error loading dataset snapshot {snapshot_path}: {e}")
+        return None
+
+# List the partitions that have a snapshot
+def list_snapshot_partitions(snapshot_dir=SNAPSHOT_DIR):
+    """Return the (config, split) pairs with at least one snapshot."""
+    partitions = []
+    if os.path.isdir(snapshot_dir):
+        for config_name in sorted(os.listdir(snapshot_dir)):
+            config_dir = os.path.join(snapshot_dir, config_name)
+            if not os.path.isdir(config_dir):
+                continue
+            for split_name in sorted(os.listdir(config_dir)):
+                if latest_snapshot_path(os.path.join(config_dir, split_name)):
+                    partitions.append((config_name, split_name))
+    return partitions
+
+# Load the GAIA dataset for the app
+def load_gaia_dataframe(partition=DEFAULT_PARTITION, exclude_columns=()):
+    """Load one config/split partition from Azure SQL or the local snapshot (per GAIA_DATASET_SOURCE), falling back to the other.
+
+    exclude_columns are left out of the query or the snapshot read.
+    """
+    from scripts.api_utils.azure_sql_utils import fetch_dataframe_from_sql, GAIA_DATASET_DTYPES
+
+    if DATASET_SOURCE == 'snapshot':
+        df = load_snapshot(partition=partition, exclude_columns=exclude_columns)
+        if df is not None:
+            return df
+
+    config_name, split_name = partition
+    columns = [column for column in GAIA_DATASET_DTYPES if column not in exclude_columns] if exclude_columns else None
+    df = fetch_dataframe_from_sql(config_name=config_name, split_name=split_name, columns=columns)
+    if df is None:
+        # Offline fallback when Azure SQL is unreachable
+        df = load_snapshot(partition=partition, exclude_columns=exclude_columns)
+        if df is not None:
+            print("Azure SQL unavailable, using the local dataset snapshot.")
+    return df
+
+# Load a partition once per process and share it between sessions
+def get_gaia_dataframe(partition=DEFAULT_PARTITION, refresh=False):
+    """Return the cached compact DataFrame of a partition, loading it on first use or when refresh is set.
+
+    The frame has a RangeIndex and no heavy text columns (see get_question_text). Sessions share it, so callers
+    must not modify it in place.
+    """
+    partition = tuple(partition)
+    with _dataframe_cache_lock:
+        df = None if refresh else _dataframe_cache.get(partition)
+    if df is not None:
+        return df
+
+    df = load_gaia_dataframe(partition, exclude_columns=HEAVY_TEXT_COLUMNS)
+    if df is not None:
+        df = compact_dataframe(df)
+        with _dataframe_cache_lock:
+            _dataframe_cache[partition] = df
+            # Text loaded for the previous version of this partition may be stale
+            for key in [key for key in _question_text_cache if key[0] == partition]:
+                del _question_text_cache[key]
+    return df
+
+# Load the heavy text columns of one question when it is opened
+def get_question_text(partition, task_id, column):
+    """Return one heavy text column (e.g. Annotator_Metadata_Steps) of a question, or '' if it is unavailable."""
+    from scripts.api_utils.azure_sql_utils import fetch_question_columns
+
+    partition = tuple(partition)
+    key = (partition, str(task_id))
+    with _dataframe_cache_lock:
+        texts = _question_text_cache.get(key)
+        if texts is not None:
+            _question_text_cache.move_to_end(key)
+            return texts.get(column) or ''
+
+    def from_snapshot():
+        rows = load_snapshot(partition=partition, filters=[('task_id', '=', str(task_id))])
+        if rows is None or rows.empty:
+            return None
+        return {name: rows[name].iloc[0] for name in HEAVY_TEXT_COLUMNS if name in rows.columns}
+
+    # All heavy columns of the question are fetched together, so opening it costs one round trip
+    texts = from_snapshot() if DATASET_SOURCE == 'snapshot' else None
+    if texts is None:
+        texts = fetch_question_columns(partition[0], partition[1], str(task_id), HEAVY_TEXT_COLUMNS)
+    if texts is None:
+        texts = from_snapshot()
+    if texts is None:
+        return ''  # Not cached, so the next selection tries again
+
+    with _dataframe_cache_lock:
+        _question_text_cache[key] = texts
+        while len(_question_text_cache) > QUESTION_TEXT_CACHE_SIZE:
+            _question_text_cache.popitem(last=False)
+    return texts.get(column) or ''
+
+# Forget the loaded partitions, e.g. after an ingest rewrote them
+def clear_gaia_dataframe_cache():
+    with _dataframe_cache_lock:
+        _dataframe_cache.clear()
+        _question_text_cache.clear()
+
+# List the partitions the app can show
+def list_gaia_partitions():
+    """Return the ingested (config, split) pairs, from Azure SQL or the local snapshots (per GAIA_DATASET_SOURCE)."""
+    from scripts.api_utils.azure_sql_utils import fetch_dataset_partitions
+
+    if DATASET_SOURCE == 'snapshot':
+        partitions = list_snapshot_partitions() or fetch_dataset_partitions()
+    else:
+        partitions = fetch_dataset_partitions() or list_snapshot_partitions()
+    return partitions or [DEFAULT_PARTITION]
@@ -1,69 +1,102 @@
+import io
+import mmap
 import os
+from contextlib import contextmanager
 import pandas as pd
 import json
-from PIL import Image
 import zipfile
-from docx import Document
-from PyPDF2 import PdfReader
+from scripts.data_handling.chunk_index import get_chunk_index, split_paragraphs
+from scripts.api_utils.telemetry import traced, annotate
 
-def preprocess_file(file_path):
-    """Preprocess a file based on its extension and return relevant information."""
-    file_extension = os.path.splitext(file_path)[1].lower()
+# Attachment types that cannot be sent to ChatGPT
+UNSUPPORTED_TYPES = ['.jpg', '.png', '.mp3']
+
+# Character budget for the content extracted from a single attachment
+CONTENT_CHAR_LIMIT = 16000
+
+# Byte budget for plain-text attachments read through read_file_content
+TEXT_BYTE_LIMIT = 16000
+
+# Byte budget for text read ahead of relevance ranking against the question
+TEXT_INDEX_BYTE_LIMIT = 2 * 1024 * 1024
+
+# PDB records describing the structure as a whole, kept ahead of any coordinates
+PDB_HEADER_RECORDS = (b'HEADER', b'TITLE', b'COMPND', b'SOURCE', b'KEYWDS', b'EXPDTA', b'AUTHOR',
+                      b'SEQRES', b'HELIX', b'SHEET', b'HETNAM', b'SSBOND', b'CRYST1')
+
+# Number of ATOM/HETATM records sampled from the start of a .pdb file
+PDB_ATOM_SAMPLE = 100
+
+# ZIP members larger than this are skipped without being read
+ZIP_MEMBER_MAX_BYTES = 10 * 1024 * 1024
+
+# Member types inside a ZIP archive that are never sent to ChatGPT
+ZIP_BINARY_TYPES = ['.jpg', '.jpeg', '.png', '.gif', '.mp3', '.wav', '.mp4', '.zip', '.exe', '.bin']
+
+@traced('extract.preprocess_file')
+def preprocess_file(file_path, question=None):
+    """Preprocess a file based on its extension and return relevant information.
+
+    file_path may also be a binary file-like object (e.g. an in-memory S3 download) with a name attribute.
+    When a question is given, content over the budget is reduced to the chunks most relevant to it.
+    """
+    file_extension = os.path.splitext(getattr(file_path, 'name', file_path))[1].lower()
+    annotate(file_type=file_extension, in_memory=hasattr(file_path, 'read'))
     
      # Check for unsupported file types
-    unsupported_types = ['.jpg', '.png', '.zip', '.mp3']
-    if file_extension in unsupported_types:
+    if file_extension in UNSUPPORTED_TYPES:
         return f"File type '{file_extension}' is currently not supported."
     
     if file_extension == '.txt':
-        return preprocess_txt(file_path)
+        return preprocess_txt(file_path, question)
     elif file_extension == '.csv':
-        return preprocess_csv(file_path)
+        return preprocess_csv(file_path, question)
     elif file_extension == '.xlsx':
-        return preprocess_xlsx(file_path)
+        return preprocess_xlsx(file_path, question)
     elif file_extension == '.jsonld':
         return preprocess_jsonld(file_path)
     elif file_extension == '.docx':
-        return preprocess_docx(file_path)
+        return preprocess_docx(file_path, question)
     elif file_extension == '.pdf':
-        return preprocess_pdf(file_path)
+        return preprocess_pdf(file_path, question)
     elif file_extension == '.py':
-        return preprocess_py(file_path)
+        return preprocess_py(file_path, question)
     elif file_extension == '.pptx':
-        return preprocess_pptx(file_path)
+        return preprocess_pptx(file_path, question)
     elif file_extension == '.pdb':
         return preprocess_pdb(file_path)
+    elif file_extension == '.zip':
+        return preprocess_zip(file_path, question)
     else:
         return f"Unsupported file type: {file_extension}"
 
-def preprocess_txt(file_path):
+def preprocess_txt(file_path, question=None):
     """Preprocess a .txt file by reading and returning its content."""
-    return read_file_content(file_path)
+    if question:
+        text = read_file_content(file_path, max_bytes=TEXT_INDEX_BYTE_LIMIT)
+        return fit_to_budget(split_paragraphs(text), question)
+    return read_file_content(file_path, sample='head_tail')
 
-def preprocess_csv(file_path):
+def preprocess_csv(file_path, question=None):
     """Preprocess a .csv file by loading and returning its full content or as much as possible if too large."""
     try:
         df = pd.read_csv(file_path)
-        content = df.to_string(index=False)
-        
-        # Adjust based on the token limit (e.g., 16000 characters)
-        if len(content) > 16000:
-            content = content[:16000]  # Truncate to fit the limit
-            
+        lines = df.to_string(index=False).split('\n')
+
+        # Keep the column header and fit the rows to the token limit
+        content = fit_to_budget(lines[1:], question, header=lines[0])
         return {"content": content}
     except Exception as e:
         return f"Error processing CSV file: {e}"
 
-def preprocess_xlsx(file_path):
+def preprocess_xlsx(file_path, question=None):
     """Preprocess an .xlsx file by loading and returning its full content or as much as possible if too large."""
     try:
         df = pd.read_excel(file_path, sheet_name=0)
-        content = df.to_string(index=False)
-        
-        # Adjust based on the token limit
-        if len(content) > 16000:
-            content = content[:16000]  # Truncate to fit the limit
-            
+        lines = df.to_string(index=False).split('\n')
+
+        # Keep the column header and fit the rows to the token limit
+        content = fit_to_budget(lines[1:], question, header=lines[0])
         return {"content": content}
     except Exception as e:
         return f"Error processing XLSX file: {e}"
@@ -71,65 +104,245 @@ def preprocess_xlsx(file_path):
 def preprocess_jsonld(file_path):
     """Preprocess a .jsonld file by loading and returning its content."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        if hasattr(file_path, 'read'):
+            data = json.loads(file_path.read().decode('utf-8'))
+        else:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
         return {"content": json.dumps(data, indent=2)}
     except Exception as e:
         return f"Error processing JSON-LD file: {e}"
 
-def preprocess_docx(file_path):
+def preprocess_docx(file_path, question=None):
     """Preprocess a .docx file by reading and returning its content."""
     try:
+        from docx import Document  # Loaded on the first .docx attachment
         doc = Document(file_path)
         full_text = []
         for paragraph in doc.paragraphs:
             full_text.append(paragraph.text)
-        return '\n'.join(full_text)
+        return fit_to_budget(full_text, question)
     except Exception as e:
         return f"Error processing DOCX file: {e}"
 
-def preprocess_pdf(file_path):
+def preprocess_pdf(file_path, question=None):
     """Preprocess a .pdf file by extracting and returning its text."""
     try:
+        from PyPDF2 import PdfReader  # Loaded on the first .pdf attachment
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        
+        pages = [page.extract_text() or "" for page in reader.pages]
+
         # Adjust based on the token limit
-        if len(text) > 16000:
-            text = text[:16000]  # Truncate to fit the limit
-            
-        return text
+        return fit_to_budget(pages, question)
     except Exception as e:
         return f"Error processing PDF file: {e}"
 
-def preprocess_py(file_path):
+def preprocess_py(file_path, question=None):
     """Preprocess a .py file by returning its content."""
+    if question:
+        text = read_file_content(file_path, max_bytes=TEXT_INDEX_BYTE_LIMIT)
+        return fit_to_budget(split_paragraphs(text), question)
     return read_file_content(file_path)
 
-def preprocess_pptx(file_path):
+def preprocess_pptx(file_path, question=None):
     """Preprocess a .pptx file by extracting and returning slide content."""
     try:
         from pptx import Presentation
         prs = Presentation(file_path)
         slides_text = []
         for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    slides_text.append(shape.text)
-        return '\n'.join(slides_text)
+            # One chunk per slide so relevance ranking keeps slides intact
+            shape_text = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+            if shape_text:
+                slides_text.append('\n'.join(shape_text))
+        return fit_to_budget(slides_text, question)
     except Exception as e:
         return f"Error processing PPTX file: {e}"
 
 def preprocess_pdb(file_path):
-    """Preprocess a .pdb file by returning its content."""
-    return read_file_content(file_path)
+    """Preprocess a .pdb file by returning its header records and a sample of atom records."""
+    try:
+        if hasattr(file_path, 'read') and not hasattr(file_path, 'getbuffer'):
+            # Other streams have no buffer to view, so they are read whole
+            file_path = io.BytesIO(file_path.read())
+
+        with byte_view(file_path) as buffer:
+            if len(buffer) <= TEXT_BYTE_LIMIT:
+                return bytes(buffer).decode('utf-8', errors='replace')
+
+            # Walk the records without copying or decoding the whole file
+            readline = file_path.readline if hasattr(file_path, 'getbuffer') else buffer.readline
+            return summarize_pdb_records(iter(readline, b''))
+    except Exception as e:
+        return f"Error processing PDB file: {e}"
+
+def summarize_pdb_records(lines):
+    """Keep PDB header records and the first atom records, with per-chain atom counts."""
+    header_lines = []
+    atom_lines = []
+    atom_counts = {}
+    header_bytes = 0
+
+    for line in lines:
+        record = line[:6].rstrip()
+        if record in (b'ATOM', b'HETATM'):
+            chain = line[21:22].decode('ascii', errors='replace').strip() or '-'
+            atom_counts[chain] = atom_counts.get(chain, 0) + 1
+            if len(atom_lines) < PDB_ATOM_SAMPLE:
+                atom_lines.append(line)
+        elif record in PDB_HEADER_RECORDS and header_bytes + len(line) <= TEXT_BYTE_LIMIT // 2:
+            header_lines.append(line)
+            header_bytes += len(line)
+
+    total_atoms = sum(atom_counts.values())
+    chains = ', '.join(f"{chain}: {count}" for chain, count in atom_counts.items())
+    content = b''.join(header_lines).decode('utf-8', errors='replace')
+    content += f"\nATOM/HETATM records (first {len(atom_lines)} of {total_atoms}; per chain {chains}):\n"
+    content += b''.join(atom_lines).decode('utf-8', errors='replace')
+    return content[:CONTENT_CHAR_LIMIT]
+
+def preprocess_zip(file_path, question=None):
+    """Preprocess a .zip file by streaming each member through the matching extractor."""
+    try:
+        sections = []
+        skipped = []
+        remaining = CONTENT_CHAR_LIMIT
+
+        with zipfile.ZipFile(file_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+
+                member_extension = os.path.splitext(info.filename)[1].lower()
 
-def read_file_content(file_path):
-    """Read content from a file."""
+                # Skip members we cannot use before reading any of their bytes
+                if member_extension in ZIP_BINARY_TYPES:
+                    skipped.append(f"{info.filename} (binary)")
+                    continue
+                if info.file_size > ZIP_MEMBER_MAX_BYTES:
+                    skipped.append(f"{info.filename} (too large)")
+                    continue
+                if remaining <= 0:
+                    skipped.append(f"{info.filename} (budget exhausted)")
+                    continue
+
+                with archive.open(info) as member:
+                    # Read at most the cap so a lying header cannot blow up memory
+                    data = member.read(ZIP_MEMBER_MAX_BYTES + 1)
+                if len(data) > ZIP_MEMBER_MAX_BYTES:
+                    skipped.append(f"{info.filename} (too large)")
+                    continue
+
+                content = extract_zip_member(member_extension, data, question)
+                if content is None:
+                    skipped.append(f"{info.filename} (binary)")
+                    continue
+
+                content = content[:remaining]
+                remaining -= len(content)
+                sections.append(f"--- {info.filename} ---\n{content}")
+
+        if skipped:
+            sections.append("Skipped members: " + ', '.join(skipped))
+        return '\n\n'.join(sections)
+    except Exception as e:
+        return f"Error processing ZIP file: {e}"
+
+def extract_zip_member(file_extension, data, question=None):
+    """Run the extractor for a single ZIP member held in memory, returning None for binary data."""
+    stream = io.BytesIO(data)
+
+    if file_extension == '.csv':
+        result = preprocess_csv(stream, question)
+    elif file_extension == '.xlsx':
+        result = preprocess_xlsx(stream, question)
+    elif file_extension == '.jsonld':
+        result = preprocess_jsonld(stream)
+    elif file_extension == '.docx':
+        result = preprocess_docx(stream, question)
+    elif file_extension == '.pdf':
+        result = preprocess_pdf(stream, question)
+    elif file_extension == '.pptx':
+        result = preprocess_pptx(stream, question)
+    elif b'\x00' in data[:1024]:
+        # NUL bytes in the first block mean this is not text
+        return None
+    else:
+        result = data.decode('utf-8', errors='replace')
+
+    if isinstance(result, dict):
+        return result['content']
+    return result
+
+def fit_to_budget(chunks, question=None, header=None):
+    """Join chunks within CONTENT_CHAR_LIMIT, keeping the chunks most relevant to the question if they do not fit."""
+    prefix = f"{header}\n" if header is not None else ''
+    budget = CONTENT_CHAR_LIMIT - len(prefix)
+
+    content = '\n'.join(chunks)
+    if len(content) <= budget:
+        return prefix + content
+    if not question:
+        return (prefix + content)[:CONTENT_CHAR_LIMIT]  # Truncate to fit the limit
+
+    # The index is built once per distinct attachment content and reused across reruns
+    return prefix + get_chunk_index(chunks).select(question, budget)
+
+def read_file_content(file_path, max_bytes=TEXT_BYTE_LIMIT, sample='head'):
+    """Read up to max_bytes of a text file, sampling the head or the head and tail of larger files.
+
+    file_path may be a path or a BytesIO (read from its current position). Other streams cannot be viewed
+    whole, so only their head is read, whatever the sample.
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
+        if hasattr(file_path, 'read') and not hasattr(file_path, 'getbuffer'):
+            data = file_path.read(max_bytes + 1)
+            if len(data) <= max_bytes:
+                return data.decode('utf-8', errors='replace')
+            return decode_utf8_head(data, max_bytes)
+
+        with byte_view(file_path) as buffer:
+            size = len(buffer)
+            if size <= max_bytes:
+                return bytes(buffer).decode('utf-8', errors='replace')
+
+            if sample == 'head_tail':
+                half = max_bytes // 2
+                head = decode_utf8_head(bytes(buffer[:half + 4]), half)
+                tail = decode_utf8_tail(bytes(buffer[size - half - 4:]), half)
+                return f"{head}\n... [{size - 2 * half} bytes omitted] ...\n{tail}"
+
+            # Only the slice is copied (and, for a mapped file, only its pages are read from disk)
+            return decode_utf8_head(bytes(buffer[:max_bytes + 4]), max_bytes)
     except Exception as e:
         return f"Error reading file {file_path}: {e}"
+
+@contextmanager
+def byte_view(file_path):
+    """Yield the bytes of a file (memory-mapped) or of a BytesIO from its current position, without copying them."""
+    if hasattr(file_path, 'getbuffer'):
+        with file_path.getbuffer() as buffer, buffer[file_path.tell():] as view:
+            yield view
+        return
+
+    if os.path.getsize(file_path) == 0:
+        yield b''  # mmap cannot map an empty file
+        return
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield buffer
+
+def decode_utf8_head(data, limit):
+    """Decode the first limit bytes of data without splitting a UTF-8 character."""
+    cut = min(limit, len(data))
+    # Back off over continuation bytes (10xxxxxx) so the cut lands on a character start
+    while 0 < cut < len(data) and (data[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return data[:cut].decode('utf-8', errors='replace')
+
+def decode_utf8_tail(data, limit):
+    """Decode the last limit bytes of data without splitting a UTF-8 character."""
+    start = max(len(data) - limit, 0)
+    # Move forward over continuation bytes so decoding starts on a character start
+    while start < len(data) and (data[start] & 0xC0) == 0x80:
+        start += 1
+    return data[start:].decode('utf-8', errors='replace')
@@ -1,10 +1,27 @@
 #load_dataset
 import os
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datasets import load_dataset
 
-# Load the GAIA dataset using Hugging Face with authentication
-def load_gaia_dataset(cache_dir):
+# Flattened metadata columns renamed to SQL-friendly names
+COLUMN_RENAMES = {
+    'Final answer': 'FinalAnswer',
+    'Annotator_Metadata_Number of steps': 'Annotator_Metadata_Number_of_steps',
+    'Annotator_Metadata_How long did this take?': 'Annotator_Metadata_How_long_did_this_take',
+    'Annotator_Metadata_Number of tools': 'Annotator_Metadata_Number_of_tools'
+}
+
+# Configuration and split loaded when none is given
+DEFAULT_CONFIG_NAME = '2023_all'  # Available: ['2023_all', '2023_level1', '2023_level2', '2023_level3']
+DEFAULT_SPLIT_NAME = 'validation'  # 'test' or 'validation'
+
+# Partitions ingested by process_dataset, as space separated config/split pairs
+INGEST_PARTITIONS = [tuple(partition.split('/', 1)) for partition in
+                     os.getenv('GAIA_INGEST_PARTITIONS', f'{DEFAULT_CONFIG_NAME}/{DEFAULT_SPLIT_NAME}').split()]
+
+# Load the GAIA dataset split using Hugging Face with authentication
+def load_gaia_split(cache_dir, config_name=DEFAULT_CONFIG_NAME, split_name=DEFAULT_SPLIT_NAME):
     # Set environment variables for Hugging Face
     os.environ["HF_HOME"] = cache_dir
     os.environ["HF_DATASETS_CACHE"] = cache_dir  # Set the datasets cache directory explicitly
@@ -12,32 +29,19 @@ def load_gaia_dataset(cache_dir):
     # Ensure that the cache directory exists
     os.makedirs(cache_dir, exist_ok=True)
 
-    # Specify the configuration to load
-    config_name = '2023_all' # Available: ['2023_all', '2023_level1', '2023_level2', '2023_level3']
-
     # Load the dataset into the specified cache directory
     ds = load_dataset('gaia-benchmark/GAIA', config_name, trust_remote_code=True, cache_dir=cache_dir)
-    
-    # Select the split to load, 'test' or 'validation'
-    split_name = 'validation'
+
+    return ds[split_name]
+
+# Load the GAIA dataset using Hugging Face with authentication
+def load_gaia_dataset(cache_dir, config_name=DEFAULT_CONFIG_NAME, split_name=DEFAULT_SPLIT_NAME):
+    split = load_gaia_split(cache_dir, config_name, split_name)
 
     # Attempt to convert to DataFrame
     try:
-        # Convert to DataFrame
-        df = pd.DataFrame(ds[split_name])
-        
-        # Flatten the 'Annotator Metadata' column
-        df = preprocess_nested_data(df)
-        
-        # Data cleaning: Convert 'file_name' and 'file_path' columns to string and handle NaNs
-        if 'file_name' in df.columns:
-            df['file_name'] = df['file_name'].astype(str).fillna('')  # Convert to string and replace NaNs with empty strings
-        if 'file_path' in df.columns:
-            df['file_path'] = df['file_path'].astype(str).fillna('')  # Convert to string and replace NaNs with empty strings
-        
-        # **New Code**: Add a new column 'result_status' with initial value 'N/A'
-        df['result_status'] = 'N/A'
-        
+        # Convert in Arrow and hand the finished table to pandas once
+        df = convert_gaia_table(split.with_format('arrow')[:], config_name, split_name).to_pandas()
         print("Dataset successfully converted to DataFrame.")
     except Exception as e:
         print(f"Error converting dataset to DataFrame: {e}")
@@ -45,21 +49,43 @@ def load_gaia_dataset(cache_dir):
 
     return df
 
-# Flatten the 'Annotator Metadata' column
-def preprocess_nested_data(df):
-    if 'Annotator Metadata' in df.columns:
-        # Normalize the 'Annotator Metadata' column into separate columns
-        metadata_df = pd.json_normalize(df['Annotator Metadata'])
-        # Rename columns to include a prefix for clarity
-        metadata_df.columns = [f"Annotator_Metadata_{col}" for col in metadata_df.columns]
-        # Concatenate with the original DataFrame, dropping the original 'Annotator Metadata' column
-        df = pd.concat([df.drop(columns=['Annotator Metadata']), metadata_df], axis=1)
-    
-    df = df.rename(columns={
-        'Final answer': 'FinalAnswer',
-        'Annotator_Metadata_Number of steps': 'Annotator_Metadata_Number_of_steps',
-        'Annotator_Metadata_How long did this take?': 'Annotator_Metadata_How_long_did_this_take',
-        'Annotator_Metadata_Number of tools': 'Annotator_Metadata_Number_of_tools'
-    })
-    
-    return df
+# Yield the GAIA dataset as converted DataFrame batches, so later ingest stages can start early
+def iter_gaia_batches(cache_dir, batch_size, config_name=DEFAULT_CONFIG_NAME, split_name=DEFAULT_SPLIT_NAME):
+    arrow_split = load_gaia_split(cache_dir, config_name, split_name).with_format('arrow')
+
+    for start in range(0, len(arrow_split), batch_size):
+        # Slicing an Arrow-formatted dataset returns a zero-copy pyarrow Table
+        df = convert_gaia_table(arrow_split[start:start + batch_size], config_name, split_name).to_pandas()
+        df.index = range(start, start + len(df))  # Keep row labels unique across batches
+        yield df
+
+# Flatten and clean a pyarrow Table of raw GAIA records
+def convert_gaia_table(table, config_name=DEFAULT_CONFIG_NAME, split_name=DEFAULT_SPLIT_NAME):
+    # Flatten the 'Annotator Metadata' struct into one column per field
+    table = table.flatten()
+    column_names = [name.replace('Annotator Metadata.', 'Annotator_Metadata_') for name in table.column_names]
+    table = table.rename_columns([COLUMN_RENAMES.get(name, name) for name in column_names])
+
+    # Data cleaning: Convert 'file_name' and 'file_path' columns to string and replace nulls with empty strings
+    for column in ('file_name', 'file_path'):
+        if column in table.column_names:
+            position = table.column_names.index(column)
+            table = table.set_column(position, column, pc.fill_null(pc.cast(table[column], pa.string()), ''))
+
+    # Numeric metadata as integers, matching the INT columns in Azure SQL
+    for column in ('Level', 'Annotator_Metadata_Number_of_tools'):
+        if column in table.column_names:
+            position = table.column_names.index(column)
+            try:
+                table = table.set_column(position, column, pc.cast(table[column], pa.int64()))
+            except pa.ArrowInvalid:
+                pass  # Leave non-numeric values as they are
+
+    # Initial 'user_result_status' of 'N/A', matching the dataset table's column (result_status does not exist there)
+    table = table.append_column('user_result_status', pa.array(['N/A'] * table.num_rows, pa.string()))
+
+    # Partition key: the configuration and split every row was loaded from
+    table = table.append_column('config_name', pa.array([config_name] * table.num_rows, pa.string()))
+    table = table.append_column('split_name', pa.array([split_name] * table.num_rows, pa.string()))
+
+    return table
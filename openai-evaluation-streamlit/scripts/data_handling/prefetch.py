@@ -0,0 +1,87 @@
+#prefetch
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from scripts.api_utils.amazon_s3_utils import download_file_from_s3, fetch_file_from_s3
+from scripts.data_handling.file_processor import preprocess_file, UNSUPPORTED_TYPES, TEXT_INDEX_BYTE_LIMIT
+
+# Number of attachments downloaded and preprocessed in the background at once
+PREFETCH_WORKERS = 4
+
+# 'memory' fetches attachments straight into memory, 'disk' goes through the local download cache
+ATTACHMENT_FETCH_MODE = os.getenv('ATTACHMENT_FETCH_MODE', 'memory')
+
+# Types whose extractor reads at most TEXT_INDEX_BYTE_LIMIT bytes, so only that much is fetched
+HEAD_ONLY_TYPES = ['.txt', '.py']
+
+# Number of prefetched attachments kept in memory, oldest dropped first
+PREFETCH_CACHE_SIZE = 64
+
+# Shared by every session in the Streamlit server process
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='attachment-prefetch')
+_futures = OrderedDict()
+_futures_lock = threading.Lock()
+
+def load_attachment(file_name, question, bucket_name, download_dir, s3_client):
+    """Fetch an attachment from S3 and preprocess it. Returns (source, preprocessed_data), source being a path or S3 URI."""
+    if ATTACHMENT_FETCH_MODE == 'memory':
+        max_bytes = None
+        if question and os.path.splitext(file_name)[1].lower() in HEAD_ONLY_TYPES:
+            max_bytes = TEXT_INDEX_BYTE_LIMIT + 4  # Room to finish a UTF-8 character at the cut
+        buffer = fetch_file_from_s3(file_name, bucket_name, s3_client, max_bytes=max_bytes)
+        if buffer is None:
+            return None, None
+        return f"s3://{bucket_name}/{file_name}", preprocess_file(buffer, question=question)
+
+    downloaded_file_path = download_file_from_s3(file_name, bucket_name, download_dir, s3_client)
+    if not downloaded_file_path:
+        return None, None
+    return downloaded_file_path, preprocess_file(downloaded_file_path, question=question)
+
+def is_prefetchable(file_name):
+    """Return True if the attachment has a file type the app can preprocess."""
+    return bool(file_name) and os.path.splitext(file_name)[1].lower() not in UNSUPPORTED_TYPES
+
+def submit_attachment(file_name, question, bucket_name, download_dir, s3_client):
+    """Return the future loading this attachment, submitting it to the worker pool if needed."""
+    key = (file_name, question)
+    with _futures_lock:
+        future = _futures.get(key)
+        if future is None:
+            future = _executor.submit(load_attachment, file_name, question, bucket_name, download_dir, s3_client)
+            _futures[key] = future
+        _futures.move_to_end(key)
+
+        # Drop the oldest finished entries once the cache is full
+        for old_key in list(_futures):
+            if len(_futures) <= PREFETCH_CACHE_SIZE:
+                break
+            if _futures[old_key].done():
+                del _futures[old_key]
+    return future
+
+def prefetch_attachments(rows, bucket_name, download_dir, s3_client):
+    """Start loading the attachments of the given DataFrame rows in the background."""
+    if not bucket_name or 'file_name' not in rows.columns:
+        return
+
+    for file_name, question in zip(rows['file_name'], rows['Question']):
+        if is_prefetchable(file_name):
+            submit_attachment(file_name, question, bucket_name, download_dir, s3_client)
+
+def get_attachment(file_name, question, bucket_name, download_dir, s3_client):
+    """Return (downloaded_file_path, preprocessed_data), waiting for a prefetch in flight if there is one."""
+    future = submit_attachment(file_name, question, bucket_name, download_dir, s3_client)
+    try:
+        downloaded_file_path, preprocessed_data = future.result()
+    except Exception as e:
+        print(f"Error loading attachment {file_name}: {e}")
+        downloaded_file_path, preprocessed_data = None, None
+
+    if downloaded_file_path is None:
+        # Do not cache failures so the next selection retries the download
+        with _futures_lock:
+            if _futures.get((file_name, question)) is future:
+                del _futures[(file_name, question)]
+    return downloaded_file_path, preprocessed_data
@@ -0,0 +1,155 @@
+#question_index
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from scripts.data_handling.chunk_index import tokenize
+
+# Number of dataset versions whose index is kept in memory, shared by all sessions
+QUESTION_INDEX_CACHE_SIZE = 8
+
+# Number of questions on one page of the question grid (also the attachments the warm-up preprocesses)
+QUESTIONS_PER_PAGE = 7
+
+# Length of the question labels shown in the question grid
+LABEL_MAX_CHARS = 100
+
+# Columns of the display frame the question grid can be sorted by
+SORT_COLUMNS = ['ID', 'Level', 'File type', 'Tools', 'Question']
+
+# Result statuses a user can filter on, in display order
+RESULT_STATUSES = [
+    'N/A',
+    'Correct without Instruction',
+    'Correct with Instruction',
+    'Incorrect without Instruction',
+    'Incorrect with Instruction',
+]
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def to_int(value):
+    """Return value as an int, or None if it is missing or not numeric."""
+    try:
+        return None if pd.isna(value) else int(value)
+    except (TypeError, ValueError):
+        return None
+
+class QuestionIndex:
+    """Inverted index over the questions of one dataset version, with facet postings for filtering.
+
+    Every posting is a set of row positions in the DataFrame the index was built from. The display frame
+    holds the precomputed grid columns (ID, truncated question, Level, file type, tools) for every row.
+    """
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.task_ids = [str(task_id) for task_id in df['task_id']]
+        self.terms = {}
+        self.levels = {}
+        self.extensions = {}
+        self.tool_counts = {}
+
+        questions = df['Question'] if 'Question' in df.columns else [''] * self.size
+        if 'file_extension' in df.columns:
+            extensions = df['file_extension']  # Precomputed by compact_dataframe
+        else:
+            file_names = df['file_name'] if 'file_name' in df.columns else [''] * self.size
+            extensions = [os.path.splitext(file_name)[1].lower() if file_name else '' for file_name in file_names]
+        levels = df['Level'] if 'Level' in df.columns else [None] * self.size
+        tool_counts = df['Annotator_Metadata_Number_of_tools'] if 'Annotator_Metadata_Number_of_tools' in df.columns else [None] * self.size
+
+        labels, row_levels, row_extensions, row_tool_counts = [], [], [], []
+        for position, (question, extension, level, tool_count) in enumerate(zip(questions, extensions, levels, tool_counts)):
+            question = question or ''
+            for term in set(tokenize(question)):
+                self.terms.setdefault(term, set()).add(position)
+
+            extension = extension or ''
+            self.extensions.setdefault(extension, set()).add(position)
+
+            level = to_int(level)
+            if level is not None:
+                self.levels.setdefault(level, set()).add(position)
+
+            tool_count = to_int(tool_count)
+            if tool_count is not None:
+                self.tool_counts.setdefault(tool_count, set()).add(position)
+
+            labels.append(question if len(question) <= LABEL_MAX_CHARS else question[:LABEL_MAX_CHARS] + '...')
+            row_levels.append(level)
+            row_extensions.append(extension)
+            row_tool_counts.append(tool_count)
+
+        self.display = pd.DataFrame({
+            'ID': range(self.size),
+            'Question': labels,
+            'Level': pd.array(row_levels, dtype='Int64'),
+            'File type': row_extensions,
+            'Tools': pd.array(row_tool_counts, dtype='Int64'),
+        })
+
+        # Rank of every row per sortable column, so sorting matches never compares the values again
+        self.sort_ranks = {
+            column: self.display[column].rank(method='first', na_option='bottom').astype(int).tolist()
+            for column in SORT_COLUMNS
+        }
+
+    def facet_values(self):
+        """Return the sorted values available for the level, extension and tool count filters."""
+        return sorted(self.levels), sorted(self.extensions), sorted(self.tool_counts)
+
+    def search(self, text='', levels=None, extensions=None, tool_counts=None, statuses=None, result_store=None):
+        """Return the sorted row positions matching every term of text and every non-empty filter.
+
+        Status filtering looks up the user's results store, so it always reflects the latest answers.
+        """
+        candidates = None
+
+        def narrow(positions):
+            nonlocal candidates
+            candidates = positions if candidates is None else candidates & positions
+
+        for term in set(tokenize(text or '')):
+            narrow(self.terms.get(term, set()))
+        for postings, selected in ((self.levels, levels), (self.extensions, extensions), (self.tool_counts, tool_counts)):
+            if selected:
+                narrow(set().union(*(postings.get(value, set()) for value in selected)))
+
+        positions = range(self.size) if candidates is None else sorted(candidates)
+
+        if statuses:
+            store = result_store or {}
+            positions = [position for position in positions
+                         if store.get(self.task_ids[position], {}).get('user_result_status', 'N/A') in statuses]
+        return list(positions)
+
+    def sort(self, positions, column='ID', descending=False):
+        """Return the row positions ordered by a display column."""
+        ranks = self.sort_ranks[column]
+        return sorted(positions, key=ranks.__getitem__, reverse=descending)
+
+def get_question_index(df, version):
+    """Return the cached index for this dataset version, building it on first use.
+
+    version identifies the dataset contents (e.g. partition and load time); the same version must mean the same rows.
+    """
+    with _index_cache_lock:
+        index = _index_cache.get(version)
+        if index is not None:
+            _index_cache.move_to_end(version)
+            return index
+
+    index = QuestionIndex(df)
+
+    with _index_cache_lock:
+        _index_cache[version] = index
+        while len(_index_cache) > QUESTION_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+def dataset_version(df, partition):
+    """Identify a loaded dataset by its partition, row count and ingest time."""
+    created_date = str(df['created_date'].max()) if 'created_date' in df.columns and len(df) else ''
+    return (tuple(partition), len(df), created_date)
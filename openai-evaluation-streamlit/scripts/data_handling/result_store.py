@@ -0,0 +1,49 @@
+#result_store
+from scripts.api_utils.azure_sql_utils import fetch_user_results
+from scripts.data_handling.result_writer import pending_results
+
+# Status and response of a question the user has not sent to ChatGPT yet
+DEFAULT_RESULT = {'user_result_status': 'N/A', 'chatgpt_response': 'N/A'}
+
+# Build the in-session results store from the rows of the user_results table
+def build_result_store(user_results):
+    """Turn a fetch_user_results DataFrame into {task_id: {'user_result_status', 'chatgpt_response'}}."""
+    if user_results is None or user_results.empty:
+        return {}
+
+    return {
+        str(task_id): {'user_result_status': status or 'N/A', 'chatgpt_response': response or 'N/A'}
+        for task_id, status, response in zip(
+            user_results['task_id'], user_results['user_result_status'], user_results['chatgpt_response']
+        )
+    }
+
+# Load the results store of a user from Azure SQL, once per login
+def load_result_store(user_id):
+    """Fetch the user's results and return them as a results store (empty for a new user).
+
+    Results still queued for the background writer override what Azure SQL returns.
+    """
+    store = build_result_store(fetch_user_results(user_id))
+    for task_id, entry in pending_results(user_id).items():
+        record_result(store, task_id, entry['status'], entry['chatgpt_response'])
+    return store
+
+# Look up the result of one question
+def get_result(store, task_id):
+    """Return the stored status and response of a question, or the 'N/A' defaults."""
+    return store.get(str(task_id), DEFAULT_RESULT)
+
+# Record a new result in place after ChatGPT has answered
+def record_result(store, task_id, status, chatgpt_response):
+    """Update the store entry of a question with its latest status and response."""
+    store[str(task_id)] = {'user_result_status': status, 'chatgpt_response': chatgpt_response}
+
+# Add the user's status and response columns to a few dataset rows
+def attach_results(rows, store):
+    """Return a copy of the rows with 'user_result_status' and 'chatgpt_response' looked up in the store."""
+    rows = rows.copy()
+    results = [get_result(store, task_id) for task_id in rows['task_id']]
+    rows['user_result_status'] = [result['user_result_status'] for result in results]
+    rows['chatgpt_response'] = [result['chatgpt_response'] for result in results]
+    return rows
@@ -0,0 +1,181 @@
+#result_writer
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from scripts.api_utils.azure_sql_utils import update_user_results, database_available
+
+# Local journal of results not yet written to Azure SQL, replayed when the app restarts
+RESULT_JOURNAL_PATH = os.getenv('RESULT_JOURNAL_PATH', os.path.join('.cache', 'result_journal.jsonl'))
+
+# Seconds the writer waits to coalesce more results into one flush
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# Maximum number of results written in one transaction
+FLUSH_BATCH_SIZE = 50
+
+# Seconds to wait before retrying after a failed flush
+RETRY_INTERVAL_SECONDS = 5.0
+
+# Failed writes of one result, while the database is reachable, before it is moved to the dead-letter file
+MAX_RESULT_ATTEMPTS = 3
+
+# Results that kept failing (e.g. an unknown user_id), kept for inspection instead of blocking the queue
+RESULT_DEAD_LETTER_PATH = os.getenv('RESULT_DEAD_LETTER_PATH', os.path.join('.cache', 'result_dead_letter.jsonl'))
+
+# Latest unwritten result per (user_id, task_id), oldest first; a newer result replaces the queued one
+_pending = OrderedDict()
+# Results taken for a flush that has not finished yet, per id(batch)
+_in_flight = {}
+_pending_lock = threading.Condition()
+_writer_thread = None
+
+def append_to_journal(entries, path=RESULT_JOURNAL_PATH):
+    """Append results to the journal (or another JSON lines file) and force them to disk."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as journal:
+        for entry in entries:
+            journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+def rewrite_journal():
+    """Replace the journal with the results not yet written (in flight, then pending). Call with _pending_lock held."""
+    entries = [entry for batch in _in_flight.values() for entry in batch] + list(_pending.values())
+    if not entries:
+        if os.path.exists(RESULT_JOURNAL_PATH):
+            os.remove(RESULT_JOURNAL_PATH)
+        return
+
+    temp_path = RESULT_JOURNAL_PATH + '.part'
+    with open(temp_path, 'w', encoding='utf-8') as journal:
+        for entry in entries:
+            journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+    os.replace(temp_path, RESULT_JOURNAL_PATH)
+
+def replay_journal():
+    """Queue the results left in the journal by a previous run. Call with _pending_lock held."""
+    if not os.path.exists(RESULT_JOURNAL_PATH):
+        return
+
+    replayed = 0
+    with open(RESULT_JOURNAL_PATH, 'r', encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line torn by a crash mid-write
+            # Later lines win, matching the order the results were given
+            _pending[(entry['user_id'], entry['task_id'])] = entry
+            replayed += 1
+    if replayed:
+        print(f"Replaying {replayed} unsaved results from {RESULT_JOURNAL_PATH}")
+
+def take_batch():
+    """Remove and return up to FLUSH_BATCH_SIZE of the oldest pending results. Call with _pending_lock held."""
+    batch = []
+    while _pending and len(batch) < FLUSH_BATCH_SIZE:
+        batch.append(_pending.popitem(last=False)[1])
+    if batch:
+        _in_flight[id(batch)] = batch
+    return batch
+
+# Write queued entries in one transaction; True if it committed
+def write_entries(entries):
+    return update_user_results([
+        (entry['user_id'], entry['task_id'], entry['status'], entry['chatgpt_response']) for entry in entries
+    ])
+
+def flush_batch(batch):
+    """Write a batch to Azure SQL. Returns True if nothing in it is left to retry.
+
+    If the batch fails while the database is reachable, its results are written one by one so a single failing
+    result cannot hold back the others. A result that fails MAX_RESULT_ATTEMPTS times goes to the dead-letter file;
+    other failed results are queued again unless a newer one arrived meanwhile. During an outage the whole batch
+    is queued again without counting an attempt.
+    """
+    retry, dead = [], []
+    if not write_entries(batch):
+        if not database_available():
+            retry = batch
+        else:
+            for entry in batch:
+                if len(batch) > 1 and write_entries([entry]):
+                    continue
+                entry = {**entry, 'attempts': entry.get('attempts', 0) + 1}
+                (dead if entry['attempts'] >= MAX_RESULT_ATTEMPTS else retry).append(entry)
+
+    with _pending_lock:
+        del _in_flight[id(batch)]
+        for entry in reversed(retry):
+            key = (entry['user_id'], entry['task_id'])
+            if key not in _pending:
+                _pending[key] = entry
+                _pending.move_to_end(key, last=False)
+        if dead:
+            append_to_journal([{**entry, 'failed_at': time.time()} for entry in dead], RESULT_DEAD_LETTER_PATH)
+            print(f"Moved {len(dead)} results that could not be written to {RESULT_DEAD_LETTER_PATH}: "
+                  f"{', '.join(entry['user_id'] + '/' + entry['task_id'] for entry in dead)}")
+        rewrite_journal()
+    return not retry
+
+def run_writer():
+    """Flush pending results in coalesced batches until the process exits."""
+    while True:
+        with _pending_lock:
+            while not _pending:
+                _pending_lock.wait()
+        # Let results arriving in quick succession join the same flush
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+
+        with _pending_lock:
+            batch = take_batch()
+        if batch and not flush_batch(batch):
+            time.sleep(RETRY_INTERVAL_SECONDS)
+
+def start_result_writer():
+    """Replay the journal and start the background writer, once per process."""
+    global _writer_thread
+    with _pending_lock:
+        if _writer_thread is not None:
+            return
+        replay_journal()
+        _writer_thread = threading.Thread(target=run_writer, name='result-writer', daemon=True)
+        _writer_thread.start()
+        _pending_lock.notify()
+
+def enqueue_result(user_id, task_id, status, chatgpt_response):
+    """Journal a result and queue it for the background writer; returns without waiting for Azure SQL."""
+    start_result_writer()
+    entry = {'user_id': user_id, 'task_id': str(task_id), 'status': status, 'chatgpt_response': chatgpt_response}
+
+    with _pending_lock:
+        append_to_journal([entry])
+        key = (entry['user_id'], entry['task_id'])
+        _pending.pop(key, None)  # Coalesce: only the latest result per question is written
+        _pending[key] = entry
+        _pending_lock.notify()
+
+def pending_results(user_id):
+    """Return the queued or in flight, not yet written results of a user as {task_id: entry}."""
+    with _pending_lock:
+        # In-flight first so a newer pending result for the same question wins
+        entries = [entry for batch in _in_flight.values() for entry in batch] + list(_pending.values())
+        return {entry['task_id']: entry for entry in entries if entry['user_id'] == user_id}
+
+def flush_pending():
+    """Write every pending result now (used on shutdown). Returns True if nothing is left pending."""
+    while True:
+        with _pending_lock:
+            batch = take_batch()
+        if not batch:
+            return True
+        if not flush_batch(batch):
+            return False
+
+# Best effort on a clean shutdown; anything left stays in the journal for the next start
+atexit.register(flush_pending)
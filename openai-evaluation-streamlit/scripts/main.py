@@ -1,22 +1,91 @@
 import os
 import sys
+import queue
+import threading
+import time
+import pandas as pd
 from dotenv import load_dotenv
 
-# Add the 'scripts' folder to the Python path if it's not already there
-sys.path.append(os.path.dirname(__file__))
-
-from data_handling.clone_repo import clone_repository
-from data_handling.load_dataset import load_gaia_dataset
-from api_utils.amazon_s3_utils import init_s3_client, upload_files_to_s3_and_update_paths
+# Imported through the scripts package, as the app does, so both share one copy of each module (and its state).
+# Run from the openai-evaluation-streamlit folder with: python -m scripts.main
+from scripts.data_handling.clone_repo import clone_repository, fetch_lfs_files
+from scripts.data_handling.load_dataset import iter_gaia_batches, INGEST_PARTITIONS
+from scripts.api_utils.amazon_s3_utils import init_s3_client, build_file_index, refresh_file_index, upload_files_to_s3_and_update_paths
 from huggingface_hub import login
-from api_utils.azure_sql_utils import insert_dataframe_to_sql
+from scripts.api_utils.azure_sql_utils import (prepare_dataset_partition, append_dataframe_to_sql, replace_dataset_partitions,
+                                               dataset_staging_table, create_ingest_job, update_ingest_job)
+from scripts.api_utils.telemetry import traced, annotate, mark_error
 from datetime import datetime  # Import datetime for created_date
-from data_handling.delete_cache import delete_cache_folder  # Import the function to delete cache
+from scripts.data_handling.dataset_snapshot import write_snapshot, partition_snapshot_dir, clear_gaia_dataframe_cache
 
 # Load environment variables from .env file
 load_dotenv()
 
-def process_dataset():
+# Rows per batch flowing through the ingest pipeline
+PIPELINE_BATCH_SIZE = 25
+
+# Batches buffered between two stages before the upstream stage waits
+PIPELINE_QUEUE_SIZE = 4
+
+# Marks the end of the batch stream in a stage queue
+END_OF_STREAM = object()
+
+# Minimum seconds between two progress writes to the ingest_jobs table
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+def run_stage(name, inbox, outbox, work, stage_timings, errors, abort):
+    """Apply work to every batch from inbox and pass the result to outbox, recording busy time.
+
+    After a failure anywhere in the pipeline the stage keeps draining its inbox so upstream never blocks.
+    """
+    busy_seconds = 0.0
+    try:
+        while True:
+            batch = inbox.get()
+            if batch is END_OF_STREAM:
+                break
+            if abort.is_set():
+                continue
+
+            start_time = time.perf_counter()
+            result = work(batch)
+            busy_seconds += time.perf_counter() - start_time
+
+            if outbox is not None:
+                outbox.put(result)
+    except Exception as e:
+        errors.append(f"{name} stage: {e}")
+        abort.set()
+        while inbox.get() is not END_OF_STREAM:
+            pass
+    finally:
+        stage_timings[name] = busy_seconds
+        if outbox is not None:
+            outbox.put(END_OF_STREAM)
+
+@traced('ingest.process_dataset')
+def process_dataset(dry_run=False, progress=None, partitions=None, allow_missing_files=False):
+    """Run the ingest pipeline: load -> S3 upload -> SQL insert, with stages overlapping on bounded queues.
+
+    Each (config, split) pair in partitions (default INGEST_PARTITIONS) replaces only its own rows in the table.
+    Batches are loaded into a staging table and the partitions are swapped in together once every batch is
+    written, so a failed ingest leaves the table as it was. Attachments missing from the repository also fail
+    the ingest, since their rows would have no file_path, unless allow_missing_files is set.
+
+    With dry_run, the dataset is loaded and matched against the repository but nothing is uploaded or written.
+    progress, if given, is called as progress(stage, **counts) as the pipeline advances.
+    """
+    counters = {'rows_loaded': 0, 'rows_written': 0}
+    counters_lock = threading.Lock()
+
+    def report(stage, **counts):
+        if progress is None:
+            return
+        try:
+            progress(stage, **counts)
+        except Exception as e:
+            print(f"Error reporting ingest progress: {e}")
+
     try:
         # Set the environment variable for Hugging Face cache directory
         cache_dir = './.cache'
@@ -41,48 +110,238 @@ def process_dataset():
         # Programmatically login to Hugging Face without adding to Git credentials
         login(token=hf_token, add_to_git_credential=False)
 
+        stage_timings = {}
+        pipeline_start = time.perf_counter()
+
         # Step 1: Clone the repository
         clone_dir = os.path.join(cache_dir, "gaia_repo")
+        report('clone')
+        start_time = time.perf_counter()
         clone_repository(repo_url, clone_dir)
 
-        # Step 2: Load the dataset
-        df = load_gaia_dataset(cache_dir)
-        if df is not None:
-            # Add the 'created_date' column with the current timestamp
-            df['created_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Index the repository's attachments once for O(1) lookups during upload
+        file_index = build_file_index(clone_dir)
+        stage_timings['clone'] = time.perf_counter() - start_time
+
+        # Step 2: Initialize S3 client
+        s3_client = init_s3_client(aws_access_key, aws_secret_key)
+        table_name = "GaiaDataset"
+        created_date = datetime.now().replace(microsecond=0)  # A datetime, not a string: the DateTime column needs one
+
+        upload_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        sql_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        errors = []
+        abort = threading.Event()
+
+        upload_totals = {'total_files': 0, 'files_uploaded': 0, 'files_skipped': 0, 'files_missing': 0, 'files_failed': 0,
+                         'bytes_uploaded': 0}
+        missing_file_names = []
+        written_batches = {}  # (config, split) -> list of written batches
+        report('pipeline')
+
+        def report_counts():
+            elapsed = time.perf_counter() - pipeline_start
+            with counters_lock:
+                counts = dict(counters,
+                              files_uploaded=upload_totals['files_uploaded'],
+                              files_skipped=upload_totals['files_skipped'],
+                              bytes_uploaded=upload_totals['bytes_uploaded'],
+                              bytes_per_second=upload_totals['bytes_uploaded'] / elapsed if elapsed > 0 else 0.0)
+            report('pipeline', **counts)
 
-            # Step 3: Initialize S3 client
-            s3_client = init_s3_client(aws_access_key, aws_secret_key)
+        # Step 3: Load the dataset in batches, feeding the upload stage as each batch is converted
+        def load_stage():
+            busy_seconds = 0.0
+            try:
+                for config_name, split_name in partitions or INGEST_PARTITIONS:
+                    batches = iter_gaia_batches(cache_dir, PIPELINE_BATCH_SIZE, config_name, split_name)
+                    while not abort.is_set():
+                        start_time = time.perf_counter()
+                        batch = next(batches, None)
+                        busy_seconds += time.perf_counter() - start_time
+                        if batch is None:
+                            break
+                        # Add the 'created_date' column with the current timestamp
+                        batch['created_date'] = created_date
+                        with counters_lock:
+                            counters['rows_loaded'] += len(batch)
+                        upload_queue.put(batch)
+            except Exception as e:
+                errors.append(f"load stage: {e}")
+                abort.set()
+            finally:
+                stage_timings['load'] = busy_seconds
+                upload_queue.put(END_OF_STREAM)
 
-            # Step 4: Upload files to S3 and update paths
-            df = upload_files_to_s3_and_update_paths(df, s3_client, bucket_name, clone_dir)
+        # Step 4: Upload files to S3 and update paths
+        @traced('ingest.upload_batch', dry_run=dry_run)
+        def upload_batch(batch):
+            annotate(rows=len(batch))
+            if dry_run:
+                file_names = batch['file_name'][batch['file_name'] != '']
+                missing = file_names[~file_names.isin(file_index.keys())]
+                with counters_lock:
+                    upload_totals['total_files'] += len(file_names)
+                    upload_totals['files_missing'] += len(missing)
+                    missing_file_names.extend(missing)
+                return batch
 
-            # Step 5: Insert the updated DataFrame into Azure SQL Database before saving to CSV
-            table_name = "GaiaDataset"
-            insert_dataframe_to_sql(df, table_name)
+            # In a sparse clone, pull the LFS content of this batch's attachments only
+            batch_files = batch['file_name'][batch['file_name'].isin(file_index.keys())].unique()
+            fetch_lfs_files(clone_dir, [file_index[file_name][0] for file_name in batch_files])
+            # The index was built from the pointers; record the pulled files' size and mtime
+            refresh_file_index(file_index, batch_files)
 
-            # Step 6: Save the updated DataFrame to a new CSV file
-            output_dir = os.path.join(cache_dir, 'data_to_azuresql')
-            os.makedirs(output_dir, exist_ok=True)
-            output_csv_file = os.path.join(output_dir, 'gaia_data_view.csv')
-            df.to_csv(output_csv_file, index=False)
+            batch, batch_stats = upload_files_to_s3_and_update_paths(
+                batch, s3_client, bucket_name, clone_dir, file_index, print_summary=False
+            )
+            with counters_lock:
+                for key in upload_totals:
+                    upload_totals[key] += batch_stats[key]
+                missing_file_names.extend(batch_stats['missing_file_names'])
+            report_counts()
+            if batch_stats['files_failed']:
+                # Fails the stage, so rows without their attachment never replace the stored partition
+                raise RuntimeError(f"could not upload {batch_stats['files_failed']} files to S3: "
+                                   f"{', '.join(batch_stats['failed_file_names'])}")
+            return batch
 
-            # Optional: Step 7: Delete the cache directory
-            # delete_cache_folder(cache_dir)
+        # Step 5: Stage each batch in Azure SQL Database as soon as its file paths are resolved
+        @traced('ingest.insert_batch', dry_run=dry_run)
+        def insert_batch(batch):
+            partition = (batch['config_name'].iloc[0], batch['split_name'].iloc[0])
+            annotate(partition='/'.join(partition), rows=len(batch))
+            if not dry_run:
+                if partition not in written_batches:
+                    # Clear the partition's staged rows only once its first batch is ready to be written
+                    if not prepare_dataset_partition(table_name, *partition):
+                        raise RuntimeError(f"could not prepare partition {'/'.join(partition)} of {table_name}")
+                if not append_dataframe_to_sql(batch, dataset_staging_table(table_name)):
+                    raise RuntimeError(f"could not insert a batch into {dataset_staging_table(table_name)}")
+            written_batches.setdefault(partition, []).append(batch)
+            with counters_lock:
+                counters['rows_written'] += len(batch)
+            report_counts()
 
-            # Return a summary of the processing steps instead of the CSV file location
-            return f"""
-            Dataset processing complete:
+        stages = [
+            threading.Thread(target=load_stage, name='ingest-load'),
+            threading.Thread(target=run_stage, name='ingest-upload',
+                             args=('upload', upload_queue, sql_queue, upload_batch, stage_timings, errors, abort)),
+            threading.Thread(target=run_stage, name='ingest-sql',
+                             args=('sql', sql_queue, None, insert_batch, stage_timings, errors, abort)),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if errors:
+            mark_error('; '.join(errors))
+            return "Dataset processing failed:\n" + '\n'.join(errors)
+        if not written_batches:
+            return "Data loading failed."
+
+        # Rows without their attachment must not replace stored rows that have it
+        if not dry_run and upload_totals['files_missing'] and not allow_missing_files:
+            message = (f"{upload_totals['files_missing']} attachments are missing from the repository "
+                       f"({', '.join(sorted(set(missing_file_names)))}); {table_name} was left unchanged. "
+                       f"Allow missing files (--allow-missing-files, or the checkbox on the Dataset Management page) to store "
+                       f"these rows without them.")
+            mark_error(message)
+            return f"Dataset processing failed: {message}"
+
+        # Swap the staged partitions into the dataset table in one transaction
+        if not dry_run:
+            start_time = time.perf_counter()
+            if not replace_dataset_partitions(table_name, list(written_batches)):
+                mark_error(f"could not replace the partitions of {table_name}")
+                return f"Dataset processing failed: could not replace the partitions of {table_name}; it was left unchanged."
+            stage_timings['sql'] = stage_timings.get('sql', 0.0) + time.perf_counter() - start_time
+
+        partition_dfs = {partition: pd.concat(batches) for partition, batches in written_batches.items()}
+        total_rows = sum(len(partition_df) for partition_df in partition_dfs.values())
+        upload_seconds = stage_timings.get('upload', 0.0)
+        bytes_per_second = upload_totals['bytes_uploaded'] / upload_seconds if upload_seconds > 0 else 0.0
+        if missing_file_names:
+            print(f"Missing files: {', '.join(sorted(set(missing_file_names)))}")
+
+        # Step 6: Save each partition as a versioned Parquet snapshot for fast local reads
+        snapshot_paths = []
+        if not dry_run:
+            report('snapshot')
+            start_time = time.perf_counter()
+            for partition, partition_df in partition_dfs.items():
+                snapshot_dir = partition_snapshot_dir(os.path.join(cache_dir, 'snapshots'), *partition)
+                snapshot_paths.append(write_snapshot(partition_df, snapshot_dir))
+            stage_timings['snapshot'] = time.perf_counter() - start_time
+
+        # Optional: Step 7: Delete the cache directory
+        # delete_cache_folder(cache_dir)
+
+        total_seconds = time.perf_counter() - pipeline_start
+        report_counts()
+        report('complete')
+        partition_counts = ', '.join(f"{'/'.join(partition)}: {len(partition_df)}" for partition, partition_df in partition_dfs.items())
+        timings = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in stage_timings.items())
+
+        # Return a summary of the processing steps instead of the CSV file location
+        return f"""
+            Dataset processing complete{' (dry run, nothing uploaded or written)' if dry_run else ''}:
             - Repository cloned to: {clone_dir}
-            - Dataset successfully loaded
+            - Dataset successfully loaded: {total_rows} rows ({partition_counts})
             - Files uploaded to S3 bucket: {bucket_name}
+            - Uploaded: {upload_totals['files_uploaded']}, skipped (unchanged): {upload_totals['files_skipped']}, missing: {upload_totals['files_missing']}
+            - Upload throughput: {upload_totals['bytes_uploaded']} bytes at {bytes_per_second / (1024 * 1024):.2f} MB/s
             - Data inserted into Azure SQL table: {table_name}
+            - Dataset snapshots: {', '.join(snapshot_paths) or None}
+            - Stage busy time: {timings}; total {total_seconds:.1f}s
             """
-        else:
-            return "Data loading failed."
-    
+
     except Exception as e:
+        mark_error(e)
         return f"Error: {str(e)}"
 
+def run_ingest_job(job_id, dry_run=False, allow_missing_files=False):
+    """Run process_dataset for a job record, writing throttled progress to the ingest_jobs table.
+
+    After a successful ingest the process-wide dataset cache is cleared, before the job is marked finished,
+    so sessions load the new rows whether or not an admin is watching the job.
+    """
+    state = {'stage': None, 'last_write': 0.0}
+    state_lock = threading.Lock()  # The upload and sql stages both report progress
+
+    def record_progress(stage, **counts):
+        with state_lock:
+            now = time.monotonic()
+            # Stage changes are always written; count updates at most every PROGRESS_INTERVAL_SECONDS
+            if stage == state['stage'] and now - state['last_write'] < PROGRESS_INTERVAL_SECONDS:
+                return
+            state['stage'] = stage
+            state['last_write'] = now
+        update_ingest_job(job_id, stage=stage, **counts)
+
+    try:
+        result = process_dataset(dry_run=dry_run, progress=record_progress, allow_missing_files=allow_missing_files)
+        status = 'succeeded' if state['stage'] == 'complete' else 'failed'
+    except Exception as e:
+        result, status = f"Error: {e}", 'failed'
+    if status == 'succeeded' and not dry_run:
+        clear_gaia_dataframe_cache()
+    update_ingest_job(job_id, status=status, message=result)
+
+def start_ingest_job(started_by, dry_run=False, allow_missing_files=False):
+    """Start process_dataset in a background thread. Returns the job_id, or None if a job is already running.
+
+    Raises if the job record cannot be created (e.g. the database is unreachable).
+    """
+    job_id = create_ingest_job(started_by)
+    if job_id is None:
+        return None
+
+    # Daemon thread: the ingest outlives the admin's Streamlit session and page refreshes
+    threading.Thread(target=run_ingest_job, args=(job_id, dry_run, allow_missing_files), name=f'ingest-job-{job_id}',
+                     daemon=True).start()
+    return job_id
+
 if __name__ == "__main__":
-    print(process_dataset())
+    print(process_dataset(dry_run='--dry-run' in sys.argv, allow_missing_files='--allow-missing-files' in sys.argv))
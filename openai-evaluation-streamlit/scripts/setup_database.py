@@ -1,8 +1,9 @@
 import os
+import sys
 import bcrypt  # To hash the passwords
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
-from api_utils.azure_sql_utils import get_sqlalchemy_connection_string
+from api_utils.azure_sql_utils import get_sqlalchemy_connection_string, dataset_index_ddl, rebuild_result_cube
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,6 +11,8 @@ load_dotenv()
 # SQL queries to drop and create tables
 drop_user_results_table = "IF OBJECT_ID('user_results', 'U') IS NOT NULL DROP TABLE user_results;"
 drop_users_table = "IF OBJECT_ID('users', 'U') IS NOT NULL DROP TABLE users;"
+drop_ingest_jobs_table = "IF OBJECT_ID('ingest_jobs', 'U') IS NOT NULL DROP TABLE ingest_jobs;"
+drop_user_result_cube_table = "IF OBJECT_ID('user_result_cube', 'U') IS NOT NULL DROP TABLE user_result_cube;"
 
 create_users_table = """
 CREATE TABLE users (
@@ -32,6 +35,66 @@ CREATE TABLE user_results (
 );
 """
 
+# Indexes serving per-user lookups and MERGE (user_id, task_id) and per-question aggregates (task_id)
+create_user_results_indexes = """
+CREATE UNIQUE INDEX IX_user_results_user_task ON user_results (user_id, task_id) INCLUDE (user_result_status);
+CREATE INDEX IX_user_results_task ON user_results (task_id) INCLUDE (user_result_status);
+"""
+
+# The same indexes for a database set up before they existed. Duplicate (user_id, task_id) rows, which the
+# unique index rejects, can only come from concurrent first saves; the newest of each is kept.
+migrate_user_results_indexes = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_user_results_user_task' AND object_id = OBJECT_ID('user_results'))
+BEGIN
+    DELETE r FROM user_results AS r
+    WHERE EXISTS (SELECT 1 FROM user_results AS newer
+                  WHERE newer.user_id = r.user_id AND newer.task_id = r.task_id AND newer.result_id > r.result_id);
+    CREATE UNIQUE INDEX IX_user_results_user_task ON user_results (user_id, task_id) INCLUDE (user_result_status);
+END;
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_user_results_task' AND object_id = OBJECT_ID('user_results'))
+    CREATE INDEX IX_user_results_task ON user_results (task_id) INCLUDE (user_result_status);
+"""
+
+create_user_result_cube_table = """
+CREATE TABLE user_result_cube (
+    user_id NVARCHAR(50),
+    dimension NVARCHAR(20),  -- all, level, file_type, tools or steps
+    dimension_value NVARCHAR(50),
+    user_result_status NVARCHAR(50),
+    question_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, dimension, dimension_value, user_result_status),
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+"""
+
+create_ingest_jobs_table = """
+CREATE TABLE ingest_jobs (
+    job_id INT IDENTITY(1,1) PRIMARY KEY,
+    started_by NVARCHAR(100),
+    status NVARCHAR(20) NOT NULL,  -- running, succeeded or failed
+    stage NVARCHAR(50),
+    rows_loaded INT DEFAULT 0,
+    rows_written INT DEFAULT 0,
+    files_uploaded INT DEFAULT 0,
+    files_skipped INT DEFAULT 0,
+    bytes_uploaded BIGINT DEFAULT 0,
+    bytes_per_second FLOAT DEFAULT 0,
+    message NVARCHAR(MAX),
+    started_at DATETIME,
+    updated_at DATETIME,
+    finished_at DATETIME
+);
+"""
+
+# Idempotent (description, statement) pairs bringing an existing database up to the current schema.
+# Nothing is dropped, so they are safe to run on a database holding users and results.
+migrations = [
+    ("user_result_cube table", "IF OBJECT_ID('user_result_cube', 'U') IS NULL" + create_user_result_cube_table),
+    ("ingest_jobs table", "IF OBJECT_ID('ingest_jobs', 'U') IS NULL" + create_ingest_jobs_table),
+    ("user_results indexes", migrate_user_results_indexes),
+    ("GaiaDataset task_id index", dataset_index_ddl('GaiaDataset')),
+]
+
 # Default user and admin credentials
 default_users = [
     {"username": "admin", "password": "admin", "role": "admin"},
@@ -48,8 +111,10 @@ def setup_database():
         try:
             # Drop existing tables in the correct order
             print("Dropping existing tables if they exist...")
-            connection.execute(text(drop_user_results_table))  # Drop dependent table first
+            connection.execute(text(drop_user_result_cube_table))  # Drop dependent tables first
+            connection.execute(text(drop_user_results_table))
             connection.execute(text(drop_users_table))  # Then drop the referenced table
+            connection.execute(text(drop_ingest_jobs_table))
 
             # Commit the transaction after dropping tables
             transaction.commit()
@@ -69,6 +134,13 @@ def setup_database():
 
             print("Creating user_results table...")
             connection.execute(text(create_user_results_table))
+            connection.execute(text(create_user_results_indexes))
+
+            print("Creating user_result_cube table...")
+            connection.execute(text(create_user_result_cube_table))
+
+            print("Creating ingest_jobs table...")
+            connection.execute(text(create_ingest_jobs_table))
 
             # Insert default users
             print("Inserting default users...")
@@ -98,5 +170,35 @@ def setup_database():
             transaction.rollback()
             print(f"An error occurred while creating tables or inserting users: {e}")
 
+def migrate_database():
+    """Create the tables and indexes added since the database was set up, keeping all existing data."""
+    engine = create_engine(get_sqlalchemy_connection_string())
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for description, statement in migrations:
+                print(f"Ensuring {description}...")
+                connection.execute(text(statement))
+            transaction.commit()
+        except Exception as e:
+            transaction.rollback()
+            print(f"An error occurred while migrating the database: {e}")
+            return
+
+        user_ids = [row[0] for row in connection.execute(text("SELECT DISTINCT user_id FROM user_results"))]
+
+    # Results saved before the cube existed, or while its updates failed, are aggregated from user_results
+    print(f"Rebuilding the result cube of {len(user_ids)} users...")
+    failed = [user_id for user_id in user_ids if not rebuild_result_cube(user_id)]
+    if failed:
+        print(f"Could not rebuild the result cube of users {', '.join(failed)}; use Recalculate on their summary page.")
+        return
+    print("Database migration completed successfully.")
+
 if __name__ == "__main__":
-    setup_database()
+    # --migrate updates an existing database in place; without it, all tables are dropped and recreated
+    if '--migrate' in sys.argv:
+        migrate_database()
+    else:
+        setup_database()
@@ -0,0 +1,137 @@
+#warmup
+import importlib
+import os
+import threading
+import time
+
+# Set APP_WARMUP=1 to prime connections, caches and extractors in the background when the server starts
+WARMUP_ENABLED = os.getenv('APP_WARMUP', '0').lower() in ('1', 'true', 'yes')
+
+# Extractor and client libraries whose first import would otherwise land on a user's request
+WARMUP_MODULES = ['pandas', 'openai', 'docx', 'PyPDF2', 'openpyxl', 'pptx']
+
+# Seconds to wait for the warm-up attachments before reporting ready anyway
+WARMUP_ATTACHMENT_TIMEOUT_SECONDS = 60
+
+_status = {'state': 'disabled', 'steps': {}, 'started_at': None, 'finished_at': None}
+_status_lock = threading.Lock()
+_warmup_thread = None
+
+def run_step(name, step):
+    """Run one warm-up step, recording its duration and any error; a failed step does not stop the others."""
+    started = time.perf_counter()
+    try:
+        detail = step()
+        result = {'ok': True, 'seconds': round(time.perf_counter() - started, 3)}
+        if detail is not None:
+            result['detail'] = detail
+    except Exception as e:
+        print(f"Warm-up step {name} failed: {e}")
+        result = {'ok': False, 'seconds': round(time.perf_counter() - started, 3), 'error': str(e)}
+    with _status_lock:
+        _status['steps'][name] = result
+
+def prime_sql_pool():
+    """Open a pooled Azure SQL connection so the first query does not pay for the login handshake."""
+    from sqlalchemy import text
+    from scripts.api_utils.azure_sql_utils import get_engine
+
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+def load_dataset_cache():
+    """Load the default partition into the process-wide dataset cache and build its question index."""
+    from scripts.data_handling.dataset_snapshot import get_gaia_dataframe, DEFAULT_PARTITION
+    from scripts.data_handling.question_index import get_question_index, dataset_version
+
+    df = get_gaia_dataframe(DEFAULT_PARTITION)
+    if df is None:
+        raise RuntimeError(f"Dataset partition {DEFAULT_PARTITION} could not be loaded")
+    # Same frame and version the explore page uses, so its first visit hits the index cache
+    get_question_index(df, dataset_version(df, DEFAULT_PARTITION))
+    return f"{len(df)} questions"
+
+def import_extractors():
+    """Import the attachment extractors and the OpenAI client."""
+    missing = []
+    for module in WARMUP_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            missing.append(module)
+    importlib.import_module('scripts.data_handling.file_processor')
+    return f"not installed: {', '.join(missing)}" if missing else None
+
+def prefetch_first_page():
+    """Download and preprocess the attachments of the first explore page of the default partition."""
+    from scripts.api_utils.amazon_s3_utils import init_s3_client
+    from scripts.data_handling.dataset_snapshot import get_gaia_dataframe, DEFAULT_PARTITION
+    from scripts.data_handling.prefetch import prefetch_attachments, submit_attachment, is_prefetchable
+    from scripts.data_handling.question_index import QUESTIONS_PER_PAGE
+
+    aws_access_key = os.getenv('AWS_ACCESS_KEY')
+    aws_secret_key = os.getenv('AWS_SECRET_KEY')
+    bucket_name = os.getenv('S3_BUCKET_NAME')
+    if not (aws_access_key and aws_secret_key and bucket_name):
+        return "skipped: S3 settings missing"
+
+    df = get_gaia_dataframe(DEFAULT_PARTITION)
+    if df is None:
+        return "skipped: dataset not loaded"
+
+    # Same download folder the explore page uses, so its requests find these futures
+    download_dir = os.path.join('.cache', 'temp_file')
+    os.makedirs(download_dir, exist_ok=True)
+    s3_client = init_s3_client(aws_access_key, aws_secret_key)
+    rows = df.iloc[:QUESTIONS_PER_PAGE]
+    prefetch_attachments(rows, bucket_name, download_dir, s3_client)
+
+    # Wait for the prefetched attachments so readiness means they are in memory
+    deadline = time.monotonic() + WARMUP_ATTACHMENT_TIMEOUT_SECONDS
+    loaded = 0
+    for file_name, question in zip(rows['file_name'], rows['Question']):
+        if not is_prefetchable(file_name):
+            continue
+        future = submit_attachment(file_name, question, bucket_name, download_dir, s3_client)
+        try:
+            if future.result(timeout=max(0, deadline - time.monotonic()))[0] is not None:
+                loaded += 1
+        except Exception as e:
+            print(f"Warm-up could not load attachment {file_name}: {e}")
+    return f"{loaded} attachments"
+
+# Steps in the order they run; later steps reuse what earlier ones loaded
+WARMUP_STEPS = [
+    ('sql_pool', prime_sql_pool),
+    ('dataset_cache', load_dataset_cache),
+    ('extractors', import_extractors),
+    ('attachments', prefetch_first_page),
+]
+
+def run_warmup():
+    with _status_lock:
+        _status['state'] = 'running'
+        _status['started_at'] = time.time()
+    for name, step in WARMUP_STEPS:
+        run_step(name, step)
+    with _status_lock:
+        _status['state'] = 'ready'
+        _status['finished_at'] = time.time()
+    print(f"Warm-up finished: {warmup_status()['steps']}")
+
+def start_warmup(force=False):
+    """Start the warm-up thread once per server process, if APP_WARMUP is set (or force is True)."""
+    global _warmup_thread
+    if not (WARMUP_ENABLED or force):
+        return
+    with _status_lock:
+        if _warmup_thread is not None:
+            return
+        _status['state'] = 'pending'
+        _warmup_thread = threading.Thread(target=run_warmup, name='app-warmup', daemon=True)
+        _warmup_thread.start()
+
+def warmup_status():
+    """Return a copy of the warm-up state ('disabled', 'pending', 'running' or 'ready') and per-step results."""
+    with _status_lock:
+        return {**_status, 'steps': {name: dict(result) for name, result in _status['steps'].items()}}
@@ -1,40 +1,78 @@
 import streamlit as st
-from scripts.main import process_dataset  # Import the function directly
+from scripts.api_utils.azure_sql_utils import fetch_latest_ingest_job
 
-# Callback to trigger dataset processing logic
+# Seconds between status refreshes while an ingest job is running
+POLL_INTERVAL_SECONDS = 2
+
+# Callback to start dataset processing in the background
 def run_dataset_processing():
+    # The ingest pipeline pulls in datasets, huggingface_hub and boto3, so load it only when a run starts
+    from scripts.main import start_ingest_job
+
     try:
-        result = process_dataset()
+        job_id = start_ingest_job(st.session_state.get('username') or 'admin',
+                                  allow_missing_files=st.session_state.get('allow_missing_files', False))
 
-        # Store the result in session state for display
-        st.session_state['dataset_processing_status'] = "Dataset Processing Complete"
-        st.session_state['dataset_processing_output'] = result
+        if job_id is None:
+            st.session_state['dataset_processing_status'] = "Another dataset processing job is already running."
+        else:
+            st.session_state['dataset_processing_status'] = f"Dataset processing job {job_id} started."
 
     except Exception as e:
-        st.session_state['dataset_processing_status'] = f"An unexpected error occurred: {e}"
+        st.session_state['dataset_processing_status'] = (
+            f"Could not start dataset processing: {e}\n\n"
+            "If the ingest_jobs table is missing, run `python scripts/setup_database.py --migrate`."
+        )
+
+# Display the latest job, re-running itself while the job is in progress
+def show_ingest_job_status(polling):
+    job = fetch_latest_ingest_job()
+    if job is None:
+        st.write("No dataset processing job has run yet.")
+        return
+
+    if polling and job['status'] != 'running':
+        st.rerun()  # Job finished: rerun the whole page so polling stops
+
+    st.write(f"**Job {job['job_id']}** started by {job['started_by']} at {job['started_at']}: **{job['status']}**")
+    if job['status'] == 'running':
+        st.write(f"Current stage: {job['stage']}")
+        st.write(
+            f"Rows loaded: {job['rows_loaded'] or 0}, rows written: {job['rows_written'] or 0}, "
+            f"files uploaded: {job['files_uploaded'] or 0}, skipped: {job['files_skipped'] or 0}"
+        )
+        st.write(f"Upload throughput: {(job['bytes_per_second'] or 0) / (1024 * 1024):.2f} MB/s")
+        st.caption(f"Last update: {job['updated_at']}")
+    elif job['message']:
+        st.text(job['message'])
 
 def admin_dataset_management_page():
     # Ensure session state variables are initialized
     if 'dataset_processing_status' not in st.session_state:
         st.session_state['dataset_processing_status'] = ''
-    if 'dataset_processing_output' not in st.session_state:
-        st.session_state['dataset_processing_output'] = ''
 
     st.title("Dataset Management")
 
     st.write("""
     This page allows you to manage the GAIA dataset. You can trigger the entire dataset processing pipeline,
     which includes cloning the repository, loading the dataset, uploading files to S3, and inserting records
-    into Azure SQL.
+    into Azure SQL. Processing runs in the background, so you can leave this page and come back to check on it.
     """)
 
+    # Missing attachments fail the ingest unless the admin accepts storing those rows without them
+    st.checkbox("Store questions whose attachments are missing from the repository", key='allow_missing_files')
+
     # Provide a button to trigger the main process
     st.button("Process Dataset", on_click=run_dataset_processing)
 
-    # Check and display dataset processing status and output
+    # Check and display the result of the last button press
     if st.session_state['dataset_processing_status']:
         st.write(st.session_state['dataset_processing_status'])
-        st.text(st.session_state['dataset_processing_output'])
+
+    # Poll the job record only while a job is running
+    job = fetch_latest_ingest_job()
+    running = job is not None and job['status'] == 'running'
+    st.fragment(run_every=POLL_INTERVAL_SECONDS if running else None)(show_ingest_job_status)(running)
 
     # Back button to return to the Admin page
     st.button("Back to Admin", on_click=lambda: st.session_state.update(page='admin'))
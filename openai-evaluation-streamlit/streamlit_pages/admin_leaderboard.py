@@ -0,0 +1,71 @@
+import streamlit as st
+from scripts.api_utils.azure_sql_utils import fetch_accuracy_by_user, fetch_accuracy_by_task, fetch_global_result_counts
+
+# Seconds the cross-user aggregates are cached before they are recomputed
+LEADERBOARD_TTL_SECONDS = 300
+
+# Cached across sessions: every admin viewing the page shares one set of queries per refresh interval
+@st.cache_data(ttl=LEADERBOARD_TTL_SECONDS, show_spinner="Computing leaderboard...")
+def load_accuracy_by_user(limit, min_answered):
+    return fetch_accuracy_by_user(limit, min_answered)
+
+@st.cache_data(ttl=LEADERBOARD_TTL_SECONDS, show_spinner="Finding the hardest questions...")
+def load_accuracy_by_task(limit, min_attempts):
+    return fetch_accuracy_by_task(limit, min_attempts)
+
+@st.cache_data(ttl=LEADERBOARD_TTL_SECONDS, show_spinner="Counting results...")
+def load_global_result_counts():
+    return fetch_global_result_counts()
+
+# Callback for the Refresh button: drop the cached aggregates so they are recomputed now
+def refresh_leaderboard():
+    load_accuracy_by_user.clear()
+    load_accuracy_by_task.clear()
+    load_global_result_counts.clear()
+
+def admin_leaderboard_page():
+    if st.session_state.get('role') != 'admin':
+        st.error("Only admins can view the leaderboard.")
+        return
+
+    st.title("Leaderboard")
+    st.write(f"Accuracy across all users. Figures are refreshed every {LEADERBOARD_TTL_SECONDS // 60} minutes.")
+    st.button("Refresh Now", on_click=refresh_leaderboard)
+
+    # Overall accuracy across every result of every user
+    counts = load_global_result_counts()
+    if counts is None:
+        st.error("Failed to load results from Azure SQL.")
+    elif counts.empty:
+        st.write("No results have been recorded yet.")
+    else:
+        total_results = int(counts['results'].sum())
+        correct_results = int(counts.loc[counts['user_result_status'].str.startswith('Correct'), 'results'].sum())
+        col1, col2 = st.columns(2)
+        col1.metric("Answered Questions", total_results)
+        col2.metric("Overall Accuracy", f"{correct_results / total_results:.0%}")
+        st.write("### Results by Status")
+        st.dataframe(counts, hide_index=True, use_container_width=True)
+
+    # Accuracy per user
+    st.write("### Top Users")
+    user_limit = st.number_input("Users to show", min_value=10, max_value=1000, value=100, step=10)
+    # A user with one correct answer would otherwise rank first at 100%
+    min_answered = st.number_input("Minimum answered questions", min_value=1, max_value=1000, value=10)
+    by_user = load_accuracy_by_user(user_limit, min_answered)
+    if by_user is None:
+        st.error("Failed to load accuracy by user.")
+    else:
+        st.dataframe(by_user.style.format({'accuracy': '{:.0%}'}), hide_index=True, use_container_width=True)
+
+    # Accuracy per question, lowest first
+    st.write("### Hardest Questions")
+    min_attempts = st.number_input("Minimum attempts", min_value=1, max_value=1000, value=3)
+    by_task = load_accuracy_by_task(50, min_attempts)
+    if by_task is None:
+        st.error("Failed to load accuracy by question.")
+    else:
+        st.dataframe(by_task.style.format({'accuracy': '{:.0%}'}), hide_index=True, use_container_width=True)
+
+    # Back button to return to the Admin page
+    st.button("Back to Admin", on_click=lambda: st.session_state.update(page='admin'))
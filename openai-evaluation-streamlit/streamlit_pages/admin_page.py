@@ -1,6 +1,4 @@
 import streamlit as st
-from streamlit_pages.admin_dataset_management import admin_dataset_management_page
-from streamlit_pages.admin_user_management import admin_user_management_page
 
 # Admin Dashboard Page
 def admin_page():
@@ -16,4 +14,14 @@ def admin_page():
     # Admin action buttons
     st.button("Manage Dataset", on_click=lambda: st.session_state.update(page='admin_dataset_management'))
     st.button("Manage Users", on_click=lambda: st.session_state.update(page='admin_user_management'))
+    st.button("Leaderboard", on_click=lambda: st.session_state.update(page='admin_leaderboard'))
     st.button("Logout", on_click=lambda: st.session_state.update(page='login'))
+
+    # Readiness of the optional startup warm-up
+    from scripts.warmup import warmup_status
+    status = warmup_status()
+    if status['state'] != 'disabled':
+        st.write(f"**Warm-up:** {status['state']}")
+        for name, result in status['steps'].items():
+            outcome = result.get('detail', 'done') if result['ok'] else f"failed ({result['error']})"
+            st.caption(f"{name}: {outcome} in {result['seconds']:.2f}s")
@@ -1,19 +1,20 @@
 #explore_questions.py
 import os
 import streamlit as st
-import pandas as pd
-from scripts.api_utils.azure_sql_utils import update_user_result, fetch_dataframe_from_sql, fetch_user_results
+from scripts.data_handling.result_writer import enqueue_result
+from scripts.data_handling.dataset_snapshot import get_gaia_dataframe, get_question_text, list_gaia_partitions, DEFAULT_PARTITION
 from scripts.api_utils.chatgpt_utils import get_chatgpt_response, compare_and_update_status
-from scripts.api_utils.amazon_s3_utils import download_file_from_s3
-from scripts.data_handling.file_processor import preprocess_file
-from scripts.data_handling.delete_cache import delete_cache_folder
+from scripts.data_handling.file_processor import UNSUPPORTED_TYPES
+from scripts.data_handling.prefetch import prefetch_attachments, get_attachment
+from scripts.data_handling.result_store import load_result_store, record_result, attach_results
+from scripts.data_handling.question_index import get_question_index, dataset_version, RESULT_STATUSES, SORT_COLUMNS, QUESTIONS_PER_PAGE
 
 # Define cache directory and temporary file directory
 cache_dir = '.cache'
 temp_file_dir = os.path.join(cache_dir, 'temp_file')
 
-# Ensure that cache and temp directories exist
-os.makedirs(temp_file_dir, exist_ok=True)
+# Session state keys of the search and filter widgets
+FILTER_KEYS = ['search_text', 'filter_levels', 'filter_extensions', 'filter_tool_counts', 'filter_statuses']
 
 def go_back_to_main():
     # Do not clear the session state related to user info
@@ -25,15 +26,83 @@ def go_back_to_main():
     # Navigate back to the main page without clearing username/session data
     st.session_state.page = 'main'
 
+# Callback for the dataset partition selector
+def change_dataset_partition():
+    st.session_state.dataset_partition = st.session_state.partition_selector
+    st.session_state.pop('df', None)  # Reloaded for the new partition on this rerun
+    for key in FILTER_KEYS:
+        st.session_state.pop(key, None)  # Filter values may not exist in the new partition
+    st.session_state.current_page = 0
+    st.session_state.last_selected_row_index = None
+    st.session_state.chatgpt_response = None
+
+# Let the user pick which config/split partition of the dataset to explore
+def select_dataset_partition():
+    if 'dataset_partitions' not in st.session_state:
+        st.session_state.dataset_partitions = list_gaia_partitions()
+    partitions = st.session_state.dataset_partitions
+    current_partition = st.session_state.get('dataset_partition', DEFAULT_PARTITION)
+    if current_partition not in partitions:
+        partitions = partitions + [current_partition]
+
+    st.selectbox(
+        "Dataset (config / split)",
+        options=partitions,
+        index=partitions.index(current_partition),
+        format_func=lambda partition: f"{partition[0]} / {partition[1]}",
+        key="partition_selector",
+        on_change=change_dataset_partition
+    )
+
+# Store a freshly loaded dataset and its search index in session state
+def set_dataset(df, partition):
+    st.session_state.df = df  # Shared compact frame with a positional index; sessions hold a reference, not a copy
+    # Built once per dataset version and shared by every session showing it
+    st.session_state.question_index = get_question_index(st.session_state.df, dataset_version(st.session_state.df, partition))
+
+# Callback for the search and filter widgets: show the first page of the new matches
+def reset_current_page():
+    st.session_state.current_page = 0
+    st.session_state.last_selected_row_index = None
+
+# Callback for the page number input
+def jump_to_page():
+    st.session_state.current_page = st.session_state.page_jump - 1
+
+# Show the search box and filters, returning the row positions that match
+def search_questions(question_index):
+    levels, extensions, tool_counts = question_index.facet_values()
+
+    st.text_input("Search questions", key="search_text", on_change=reset_current_page)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.multiselect("Level", options=levels, key="filter_levels", on_change=reset_current_page)
+    col2.multiselect("File type", options=extensions, format_func=lambda extension: extension or "(no file)",
+                     key="filter_extensions", on_change=reset_current_page)
+    col3.multiselect("Number of tools", options=tool_counts, key="filter_tool_counts", on_change=reset_current_page)
+    col4.multiselect("Result status", options=RESULT_STATUSES, key="filter_statuses", on_change=reset_current_page)
+
+    col1, col2 = st.columns([3, 1])
+    sort_column = col1.selectbox("Sort by", options=SORT_COLUMNS, key="sort_column", on_change=reset_current_page)
+    descending = col2.checkbox("Descending", key="sort_descending", on_change=reset_current_page)
+
+    matches = question_index.search(
+        st.session_state.search_text,
+        levels=st.session_state.filter_levels,
+        extensions=st.session_state.filter_extensions,
+        tool_counts=st.session_state.filter_tool_counts,
+        statuses=st.session_state.filter_statuses,
+        result_store=st.session_state.result_store
+    )
+    if sort_column != 'ID' or descending:
+        matches = question_index.sort(matches, sort_column, descending)
+    return matches
+
 # Callback function for handling 'Send to ChatGPT'
 def handle_send_to_chatgpt(selected_row, selected_row_index, preprocessed_data):
     user_id = st.session_state.get('user_id', 'default_user')  # Get user ID from session
 
-    # Get the current status from the user_results table
-    current_status = st.session_state.user_results.loc[selected_row_index, 'user_result_status']
-
-    # Get the response status from the user_results table
-    chatgpt_response = st.session_state.user_results.loc[selected_row_index, 'chatgpt_response']
+    # Get the current status from the in-session results store
+    current_status = selected_row['user_result_status']
 
     # Determine if instructions should be used based on the current status
     use_instructions = current_status.startswith("Incorrect")
@@ -50,10 +119,10 @@ def handle_send_to_chatgpt(selected_row, selected_row_index, preprocessed_data):
         status = compare_and_update_status(selected_row, chatgpt_response, st.session_state.instructions if use_instructions else None)
         
         # Update the status in session state immediately
-        st.session_state.user_results.at[selected_row_index, 'user_result_status'] = status
+        record_result(st.session_state.result_store, selected_row['task_id'], status, chatgpt_response)
     
-        # Update the status in the Azure SQL Database (backend)
-        update_user_result(user_id=user_id, task_id=selected_row['task_id'], status=status, chatgpt_response=chatgpt_response)
+        # Queue the write to the Azure SQL Database (backend); it is flushed in the background
+        enqueue_result(user_id=user_id, task_id=selected_row['task_id'], status=status, chatgpt_response=chatgpt_response)
 
         # Store ChatGPT response in session state
         st.session_state.chatgpt_response = chatgpt_response
@@ -79,10 +148,16 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
 
     user_id = st.session_state.get('user_id', 'default_user')  # Fetch user_id from session state
 
+    # Ensure that cache and temp directories exist
+    os.makedirs(temp_file_dir, exist_ok=True)
+
+    select_dataset_partition()
+    partition = st.session_state.get('dataset_partition', DEFAULT_PARTITION)
+
     # Explicitly check database connection and load data if not provided
     if df is None:
         st.info("Attempting to connect to the database...")
-        df = fetch_dataframe_from_sql()
+        df = get_gaia_dataframe(partition)
         if df is not None:
             st.success("GaiaDataset loaded successfully.")
         else:
@@ -92,8 +167,8 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
     # Initialize session state for pagination and instructions
     if 'current_page' not in st.session_state:
         st.session_state.current_page = 0
-    if 'df' not in st.session_state:
-        st.session_state.df = df
+    if 'df' not in st.session_state or 'question_index' not in st.session_state:
+        set_dataset(df, partition)
     if 'instructions' not in st.session_state:
         st.session_state.instructions = ""  # Initialize instructions state
     if 'show_instructions' not in st.session_state:
@@ -103,57 +178,30 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
     if 'final_status_updated' not in st.session_state:
         st.session_state.final_status_updated = False  # Track if the final status was updated
 
-    # Fetch user-specific results
-    user_results = fetch_user_results(user_id)
-
-    # If user_results is empty, create a default DataFrame with 'user_result_status' set to 'N/A'
-    if user_results is None or user_results.empty:
-        user_results = pd.DataFrame({
-            'task_id': st.session_state.df['task_id'],
-            'user_result_status': ['N/A'] * len(st.session_state.df),
-            'chatgpt_response' : ['N/A'] * len(st.session_state.df)
-        })
-
-    # Merge user_results with GaiaDataset
-    user_results = user_results.rename(columns={'result_status': 'user_result_status'})
-    user_results = user_results.rename(columns={'gpt_response': 'chatgpt_response'})
-  
-    if 'task_id' in user_results.columns and 'user_result_status' in user_results.columns and 'chatgpt_response' in user_results.columns:
-        merged_df = st.session_state.df.merge(
-            user_results[['task_id', 'user_result_status', 'chatgpt_response']],
-            on='task_id',
-            how='left'
-        )
-    else:
-        st.error("Necessary columns for merging ('task_id', 'user_result_status', or 'chatgpt_response') are missing.")
-        return
-    
-    # Check if 'chatgpt_response' exists in user_results; if not, create it
-    if 'chatgpt_response' not in user_results.columns:
-        user_results['chatgpt_response'] = None  # Initialize with None or a default value
-
-    # After merging user_results with GaiaDataset, fill missing 'user_result_status' with 'N/A'
-    merged_df['user_result_status'] = merged_df['user_result_status'].fillna('N/A')
-    merged_df['chatgpt_response'] = merged_df['chatgpt_response'].fillna('N/A')
-
-    st.session_state.user_results = merged_df  # Store merged DataFrame in session state
+    # Results of this user, keyed by task_id: loaded once per login, then updated in place
+    if 'result_store' not in st.session_state:
+        st.session_state.result_store = load_result_store(user_id)
     
     # Add a Refresh button
     if st.button("Refresh", key="refresh_button"):
         # Reload the dataset from Azure SQL Database and reset session state
-        df = fetch_dataframe_from_sql()  # Fetch from database
+        st.session_state.pop('dataset_partitions', None)  # Pick up newly ingested partitions too
+        df = get_gaia_dataframe(partition, refresh=True)  # Fetch from database
         if df is not None:
-            df.reset_index(drop=True, inplace=True)  # Reset the index
-            st.session_state.df = df
+            set_dataset(df, partition)
             st.session_state.current_page = 0
+            st.session_state.result_store = load_result_store(user_id)  # Pick up results saved in other sessions
             st.success("Data refreshed successfully!")
         else:
             st.error("Failed to refresh data from the database.")
 
-    # Reset the DataFrame index to avoid KeyError issues
-    st.session_state.df.reset_index(drop=True, inplace=True)
-    st.session_state.user_results.reset_index(drop=True, inplace=True)
-    
+    # Row positions of the questions matching the search and filters
+    matches = search_questions(st.session_state.question_index)
+
+    # Set pagination parameters
+    page_size = QUESTIONS_PER_PAGE  # Number of questions to display per page
+    total_pages = (len(matches) + page_size - 1) // page_size
+
     # Pagination controls at the very top
     col1, col2 = st.columns([9, 1])  # Adjust the width ratio to push "Next" to the right
     if col1.button("Previous", key="previous_button"):
@@ -161,66 +209,57 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
             st.session_state.current_page -= 1
 
     if col2.button("Next", key="next_button"):  # Next button is now on the right
-        if st.session_state.current_page < (len(st.session_state.df) // 7):
+        if st.session_state.current_page < total_pages - 1:
             st.session_state.current_page += 1
 
-
-    # Set pagination parameters
-    page_size = 7  # Number of questions to display per page
-    total_pages = (len(st.session_state.df) + page_size - 1) // page_size
+    # A status change can shrink the matches below the current page
+    st.session_state.current_page = min(st.session_state.current_page, max(total_pages - 1, 0))
     current_page = st.session_state.current_page
 
+    if not matches:
+        st.info("No questions match the search and filters.")
+        return
+
+    # Jump straight to any page of the matches
+    st.session_state.page_jump = current_page + 1  # Keep the input in step with Previous/Next
+    st.number_input(f"Page (of {total_pages})", min_value=1, max_value=total_pages, step=1,
+                    key="page_jump", on_change=jump_to_page)
+
     # Display the current page of questions
     start_idx = current_page * page_size
     end_idx = start_idx + page_size
-    current_df = st.session_state.user_results.iloc[start_idx:end_idx]
+    # Only the rows on this page get their status looked up; the full dataset is never merged
+    current_df = attach_results(st.session_state.df.iloc[matches[start_idx:end_idx]], st.session_state.result_store)
 
     # Check if 'Question' column is missing
     if 'Question' not in current_df.columns:
         st.error("'Question' column is missing from the dataset!")
         return
-  
-    # Display the questions in a compact table
-    # st.write(f"Page {current_page + 1} of {total_pages}")
-    # st.dataframe(current_df[['Question']], height=200)
-
-    # Function to apply dark and bold border to the dataframe
-    def style_dataframe_with_borders(df):
-        return df.style.set_table_styles(
-            [{
-                'selector': 'table',
-                'props': [('border', '3px solid black'), ('width', '100%')]  # Set a bold, dark border and full width
-            }, {
-                'selector': 'th',
-                'props': [('border', '2px solid black'), ('font-weight', 'bold')]  # Bold border and font for headers
-            }, {
-                'selector': 'td',
-                'props': [('border', '2px solid black'), ('width', '100%')]  # Ensure the cell takes full width
-            }]
-        )
-
-    # Assuming `current_df` is the dataframe you're displaying
-    # Filter the dataframe to show only the 'Question' column
-    question_df = current_df[['Question']]
-
-    # Give a name to the index column
-    question_df.index.name = 'ID'
-
-    # Apply styling to the 'Question' dataframe
-    styled_df = style_dataframe_with_borders(question_df)
 
-    # Display the styled dataframe in Streamlit, using container width to expand the table
-    st.dataframe(styled_df, use_container_width=True)
-
-    # Use a selectbox to choose a question index from the current page
-    selected_row_index = st.selectbox(
-        "Select Question Index",
-        options=current_df.index.tolist(),  # Use the index from current_df
-        format_func=lambda x: f"{x}: {current_df.loc[x, 'Question'][:50]}...",  # Adjust format_func
-        key=f"selectbox_{current_page}"
+    # Start downloading and preprocessing this page's and the next page's attachments in the background
+    prefetch_attachments(st.session_state.df.iloc[matches[start_idx:end_idx + page_size]], bucket_name, temp_file_dir, s3_client)
+  
+    # Question grid: precomputed ID/label columns of this page plus the user's status.
+    # st.dataframe renders a virtualized grid and reports the selected row.
+    page_positions = matches[start_idx:end_idx]
+    grid_df = st.session_state.question_index.display.iloc[page_positions].assign(
+        Status=current_df['user_result_status'].values
+    )
+    grid_event = st.dataframe(
+        grid_df,
+        hide_index=True,
+        use_container_width=True,
+        on_select='rerun',
+        selection_mode='single-row',
+        key=f"question_grid_{hash(tuple(page_positions))}"  # New rows, new selection
     )
 
-
+    # Choose the selected question, defaulting to the first one on the page
+    selected_rows = grid_event.selection.rows
+    if selected_rows and selected_rows[0] < len(page_positions):
+        selected_row_index = page_positions[selected_rows[0]]
+    else:
+        selected_row_index = page_positions[0]
 
     # Display question details if a row is selected
     selected_row = current_df.loc[selected_row_index]
@@ -239,17 +278,18 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
             st.write(f"**File Path (URL):** {file_url}")
 
         file_extension = os.path.splitext(file_name)[1].lower()
-        unsupported_types = ['.jpg', '.png', '.zip', '.mp3']
 
-        if file_extension in unsupported_types:
+        if file_extension in UNSUPPORTED_TYPES:
             st.error(f"File type '{file_extension}' is currently not supported")
         else:
             if bucket_name:
-                downloaded_file_path = download_file_from_s3(file_name, bucket_name, temp_file_dir, s3_client)
+                # Usually already prefetched when the page was rendered
+                downloaded_file_path, preprocessed_data = get_attachment(
+                    file_name, selected_row['Question'], bucket_name, temp_file_dir, s3_client
+                )
 
                 if downloaded_file_path:
-                    st.write(f"File downloaded successfully to: {downloaded_file_path}")
-                    preprocessed_data = preprocess_file(downloaded_file_path)
+                    st.write(f"File loaded successfully from: {downloaded_file_path}")
                     if isinstance(preprocessed_data, str) and "not supported" in preprocessed_data:
                         st.error(preprocessed_data)
                 else:
@@ -268,11 +308,12 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
         # Conditions to show the Edit Instructions box:
         # Show instructions if the result is 'Correct with Instructions', 'Incorrect with Instructions', or 'Incorrect without Instructions'
         if current_status in ['Correct with Instruction', 'Incorrect with Instruction', 'Incorrect without Instruction']:
-            st.session_state.instructions = selected_row.get('Annotator_Metadata_Steps', '')  # Pre-fill from dataset if available
+            # Annotator steps are not kept in memory; they are loaded for the selected question only
+            st.session_state.instructions = get_question_text(partition, selected_row['task_id'], 'Annotator_Metadata_Steps')
             st.session_state.show_instructions = True  # Show the instructions box
         else:
             #st.session_state.instructions = ""  # Clear instructions
-            st.session_state.instructions = selected_row.get('Annotator_Metadata_Steps', '')
+            st.session_state.instructions = get_question_text(partition, selected_row['task_id'], 'Annotator_Metadata_Steps')
             st.session_state.show_instructions = False  # Hide instructions by default
 
         st.session_state.last_selected_row_index = selected_row_index
@@ -314,11 +355,11 @@ def run_streamlit_app(df=None, s3_client=None, bucket_name=None):
 
                 # Compare and update status based on ChatGPT's response
                 status = compare_and_update_status(selected_row, chatgpt_response, st.session_state.instructions)
-                st.session_state.user_results.at[selected_row_index, 'user_result_status'] = status
+                record_result(st.session_state.result_store, selected_row['task_id'], status, chatgpt_response)
                 current_status = status  # Update current_status
 
-                # Update the user-specific status in the Azure SQL Database
-                update_user_result(user_id=user_id, task_id=selected_row['task_id'], status=status, chatgpt_response=chatgpt_response)
+                # Queue the user-specific status for the Azure SQL Database
+                enqueue_result(user_id=user_id, task_id=selected_row['task_id'], status=status, chatgpt_response=chatgpt_response)
 
                  # Update show_instructions flag based on new status
                 if status in ['Correct with Instruction', 'Incorrect with Instruction', 'Incorrect without Instruction']:
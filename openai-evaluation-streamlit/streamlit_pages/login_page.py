@@ -1,7 +1,8 @@
 import streamlit as st
-from scripts.api_utils.azure_sql_utils import fetch_user_from_sql, fetch_user_results
+from scripts.api_utils.azure_sql_utils import fetch_user_from_sql
+from scripts.data_handling.result_store import load_result_store
+from scripts.data_handling.result_writer import start_result_writer
 import bcrypt
-import pandas as pd
 
 # Callback function to go back to the register page
 def go_to_register():
@@ -28,13 +29,11 @@ def on_login_click():
             st.session_state['login_success'] = True  # Set login_success to True
             st.success(f"Welcome, {username}!")
 
-            # Fetch user-specific results after login and store in session state
-            user_results = fetch_user_results(st.session_state['user_id'])
-            if user_results is not None and not user_results.empty:
-                st.session_state['user_results'] = user_results
-            else:
-                # Initialize an empty user_results DataFrame if the user has no data yet
-                st.session_state['user_results'] = pd.DataFrame()  # Empty DataFrame for a new user
+            # Replay results a previous run could not save and start the background writer (once per process)
+            start_result_writer()
+
+            # Fetch user-specific results once after login, keyed by task_id (empty for a new user)
+            st.session_state['result_store'] = load_result_store(st.session_state['user_id'])
 
             # Redirect based on role
             if user['role'] == 'admin':
@@ -1,47 +1,45 @@
-import matplotlib.pyplot as plt
 import streamlit as st
-import pandas as pd
 
 def go_back_to_main():
     st.session_state.page = 'main'
 
-def run_summary_page(df, user_results_df):
+# Breakdowns shown below the overall distribution, as (cube dimension, heading)
+BREAKDOWN_DIMENSIONS = [
+    ('level', 'Level'),
+    ('file_type', 'Attachment File Type'),
+    ('tools', 'Number of Tools'),
+    ('steps', 'Number of Steps'),
+]
+
+# Turn the cube cells of one dimension into a table of status counts and accuracy per value
+def breakdown_table(cube_df, dimension):
+    cells = cube_df[cube_df['dimension'] == dimension]
+    table = cells.pivot_table(index='dimension_value', columns='user_result_status',
+                              values='question_count', aggfunc='sum', fill_value=0)
+    table.index.name = None
+    correct_columns = [column for column in table.columns if column.lower().startswith('correct')]
+    table['Answered'] = table.sum(axis=1)
+    table['Accuracy'] = table[correct_columns].sum(axis=1) / table['Answered']
+    return table
+
+def run_summary_page(total_questions, cube_df, on_recalculate=None):
     st.title("Summary of Results")
 
     # Add a "Back" button to return to the main page
     st.button("Back to Main", on_click=go_back_to_main)
+    if on_recalculate is not None:
+        st.button("Recalculate", on_click=on_recalculate)
 
-    # Ensure 'task_id' is of string type in both DataFrames
-    df['task_id'] = df['task_id'].astype(str)
-    user_results_df['task_id'] = user_results_df['task_id'].astype(str)
-
-    # Check if 'user_result_status' exists in the main dataset before merging and drop it to avoid conflict
-    if 'user_result_status' in df.columns:
-        df = df.drop(columns=['user_result_status'])
-
-    # Perform the merge with 'task_id' to combine user results
-    merged_df = df.merge(
-        user_results_df[['task_id', 'user_result_status']], 
-        on='task_id', 
-        how='left'
-    )
-
-    # If user_result_status is missing after the merge, fill it with 'N/A'
-    if 'user_result_status' not in merged_df.columns:
-        st.warning("'user_result_status' column missing after merge. Filling with 'N/A'.")
-        merged_df['user_result_status'] = 'N/A'
-    else:
-        # Fill missing user_result_status values with 'N/A'
-        merged_df['user_result_status'] = merged_df['user_result_status'].fillna('N/A')
-
-    # Filter answered questions (exclude 'N/A' status)
-    answered_df = merged_df[merged_df['user_result_status'] != 'N/A']
-    unanswered_count = len(merged_df) - len(answered_df)
+    # Overall counts come from the 'all' cells of the pre-aggregated cube
+    overall = cube_df[cube_df['dimension'] == 'all']
+    status_counts = overall.set_index('user_result_status')['question_count'].sort_values(ascending=False)
+    status_counts.index.name = None
+    answered_count = int(status_counts.sum())
+    unanswered_count = max(total_questions - answered_count, 0)
 
     # Create a bar chart for 'user_result_status'
-    if not answered_df.empty:
-        status_counts = answered_df['user_result_status'].value_counts()
-
+    if answered_count:
+        import matplotlib.pyplot as plt  # Loaded only when there is a chart to draw
         st.write("### Result Status Distribution (Answered Questions Only)")
 
         # Plot the bar chart
@@ -55,12 +53,21 @@ def run_summary_page(df, user_results_df):
         # Display the detailed counts for each result status
         st.write("### Detailed Result Status Counts")
         st.write(status_counts)
+
+        # Accuracy broken down by question attributes
+        for dimension, heading in BREAKDOWN_DIMENSIONS:
+            table = breakdown_table(cube_df, dimension)
+            if table.empty:
+                continue
+            st.write(f"### Accuracy by {heading}")
+            st.bar_chart(table['Accuracy'])
+            st.dataframe(table.style.format({'Accuracy': '{:.0%}'}), use_container_width=True)
     else:
         st.write("No answered questions to display.")
 
     # Display total number of questions and answered questions
-    st.write(f"**Total Questions in the Dataset:** {len(merged_df)}")
-    st.write(f"**Total Answered Questions:** {len(answered_df)}")
+    st.write(f"**Total Questions in the Dataset:** {total_questions}")
+    st.write(f"**Total Answered Questions:** {answered_count}")
     st.write(f"**Total Unanswered Questions:** {unanswered_count}")
 
     # Explanation of result statuses